@@ -2,6 +2,7 @@ import os
 import sys
 import logging
 from flask import Flask
+from sizing import get_plan, describe
 
 logging.basicConfig(level=logging.INFO)
 
@@ -31,13 +32,21 @@ else:
         load_dotenv(override=True)
     
     DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///hexamed.db')
+
+    # Worker/pool sizing chosen from CPU, memory and the DB connection budget
+    sizing_plan = get_plan()
+    app.config['SIZING_PLAN'] = sizing_plan
+    logging.info(describe(sizing_plan))
     
     # Add connection pooling and timeout settings for PostgreSQL
     if 'postgresql' in DATABASE_URL:
         # Add connection pool settings for better reliability
         app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-            'pool_pre_ping': True,
+            # Liveness is checked only for long-idle connections (db_health.py)
+            'pool_pre_ping': False,
             'pool_recycle': 300,
+            'pool_size': sizing_plan['pool_size'],
+            'max_overflow': sizing_plan['max_overflow'],
             'connect_args': {
                 'connect_timeout': 30,
                 'application_name': 'hexamed_asset_management'
@@ -45,6 +54,17 @@ else:
         }
     
     app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
+
+    # Optional read replica for dashboards, reports, exports and list pages
+    DATABASE_READ_URL = os.environ.get('DATABASE_READ_URL')
+    if DATABASE_READ_URL:
+        replica_options = {'url': DATABASE_READ_URL}
+        if 'postgresql' not in DATABASE_READ_URL:
+            replica_options['connect_args'] = {}
+        app.config['SQLALCHEMY_BINDS'] = {'replica': replica_options}
+        logging.info("Read replica configured for read-only views")
+    app.config['DB_REPLICA_STICKY_SECONDS'] = float(os.getenv('DB_REPLICA_STICKY_SECONDS', '5'))
+
     upload_folder = os.getenv('UPLOAD_FOLDER', os.path.join(os.getcwd(), 'uploads'))
 
 logging.info(f"Database URL configured: {'PostgreSQL (Render)' if 'postgresql://' in DATABASE_URL else 'SQLite'}")
@@ -52,110 +72,76 @@ logging.info(f"Database URL configured: {'PostgreSQL (Render)' if 'postgresql://
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here-change-in-production')
 
+# Embed a versioned authorization claim in the signed session cookie so
+# require_role can decide without loading the User row on every request
+app.config['SESSION_AUTHZ_CLAIM'] = os.getenv('SESSION_AUTHZ_CLAIM', 'false').lower() == 'true'
+app.config['AUTHZ_VERSION_TTL'] = float(os.getenv('AUTHZ_VERSION_TTL', '1'))
+
+
+# Skip migrations and seeding at import (run schema_migrations.py and
+# seed_data.py on deploy instead) so boots and worker respawns stay fast
+app.config['LAZY_STARTUP'] = os.getenv('LAZY_STARTUP', 'false').lower() == 'true'
+
+# Pooled connections idle longer than this are pinged before reuse
+app.config['DB_IDLE_VALIDATE_SECONDS'] = float(os.getenv('DB_IDLE_VALIDATE_SECONDS', '60'))
 
 app.config['UPLOAD_FOLDER'] = upload_folder
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('UPLOAD_MAX_MB', '16')) * 1024 * 1024
+
+# Per-view request size caps for the upload forms (see blob_store.upload_limit)
+app.config['UPLOAD_LIMITS'] = {
+    'request': int(os.getenv('REQUEST_UPLOAD_MAX_MB', '16')) * 1024 * 1024,
+    'bill': int(os.getenv('BILL_UPLOAD_MAX_MB', '10')) * 1024 * 1024,
+    'purchase_order': int(os.getenv('PO_UPLOAD_MAX_MB', '32')) * 1024 * 1024,
+}
+
+# Hand attachment downloads to the front proxy: '', 'x-accel-redirect' or 'x-sendfile'
+app.config['FILE_SERVING_MODE'] = os.getenv('FILE_SERVING_MODE', '').lower()
+app.config['X_ACCEL_PREFIX'] = os.getenv('X_ACCEL_PREFIX', '/protected-uploads/')
+
+# Background PNG thumbnails for uploaded PDFs and images (previews.py)
+app.config['PREVIEW_WORKERS'] = int(os.getenv('PREVIEW_WORKERS', '2'))
+app.config['PREVIEW_MAX_PX'] = int(os.getenv('PREVIEW_MAX_PX', '320'))
+
+# In-process warranty alert refresh (warranty_alerts.py); 0 leaves it to cron
+app.config['WARRANTY_ALERT_INTERVAL_HOURS'] = float(os.getenv('WARRANTY_ALERT_INTERVAL_HOURS', '24'))
 
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 from models import db
-from sqlalchemy import text
 
 db.init_app(app)
 
-import routes
+from db_health import install_connection_health, READ_ONLY_ENDPOINTS
+from db_routing import init_read_routing
 
 with app.app_context():
-    try:
-        # Test database connection first
-        print("Testing database connection...")
-        with db.engine.connect() as connection:
-            connection.execute(text("SELECT 1"))
-        print("Database connection successful!")
-
-        db.create_all()
-        print("Database tables created successfully!")
-
-        from models import User, Vendor
-        from werkzeug.security import generate_password_hash
-
-        admin_user = User.query.filter_by(username='admin').first()
-        if not admin_user:
-            admin_user = User()
-            admin_user.username = 'admin'
-            admin_user.email = 'admin@hexamed.com'
-            admin_user.password_hash = generate_password_hash('hexamed123')
-            admin_user.role = 'MD'
-            admin_user.full_name = 'System Administrator'
-            admin_user.floor = 'All'
-            admin_user.department = 'Admin Block'
-            db.session.add(admin_user)
-            db.session.commit()
-            logging.info("Admin user created with username: admin, password: hexamed123")
-
-        accounts_user = User.query.filter_by(username='accounts').first()
-        if not accounts_user:
-            accounts_user = User()
-            accounts_user.username = 'accounts'
-            accounts_user.email = 'accounts@hexamed.com'
-            accounts_user.password_hash = generate_password_hash('accounts123')
-            accounts_user.role = 'Accounts/SCM'
-            accounts_user.full_name = 'Accounts Manager'
-            accounts_user.floor = 'All'
-            accounts_user.department = 'Accounts'
-            db.session.add(accounts_user)
-            db.session.commit()
-            logging.info("Accounts user created with username: accounts, password: accounts123")
-
-        sample_vendors = [
-            {
-                'vendor_name': 'TechCorp Solutions',
-                'vendor_code': 'TC001',
-                'category': 'IT Equipment',
-                'contact_person': 'amaan',
-                'phone': '+91-9876543210',
-                'email': 'sales@techcorp.com',
-                'payment_terms': 'Net 30'
-            },
-            {
-                'vendor_name': 'Office Furniture Ltd',
-                'vendor_code': 'OF002',
-                'category': 'Furniture',
-                'contact_person': 'Sarah ',
-                'phone': '+91-9876543211',
-                'email': 'orders@officefurniture.com',
-                'payment_terms': 'Net 15'
-            },
-            {
-                'vendor_name': 'Medical Supplies Co',
-                'vendor_code': 'MS003',
-                'category': 'Medical Equipment',
-                'contact_person': 'Dr. ritik ',
-                'phone': '+91-9876543212',
-                'email': 'info@medicalsupplies.com',
-                'payment_terms': 'Advance'
-            }
-        ]
+    for engine in db.engines.values():
+        install_connection_health(engine, idle_threshold=app.config['DB_IDLE_VALIDATE_SECONDS'])
+
+init_read_routing(app, READ_ONLY_ENDPOINTS)
 
-        for vendor_data in sample_vendors:
-            existing_vendor = Vendor.query.filter_by(vendor_code=vendor_data['vendor_code']).first()
-            if not existing_vendor:
-                vendor = Vendor()
-                for key, value in vendor_data.items():
-                    setattr(vendor, key, value)
-                db.session.add(vendor)
+from warranty_alerts import init_warranty_scheduler
 
-        db.session.commit()
-        logging.info("Sample vendors created")
+init_warranty_scheduler(app)
+
+import routes
 
-    except Exception as e:
-        logging.error(f"Database initialization error: {e}")
-        logging.info("App will start but database functionality may be limited")
+if not app.config['LAZY_STARTUP']:
+    with app.app_context():
+        try:
+            # The version check is the connection test (see schema_migrations.py)
+            from schema_migrations import migrate
+            applied_migrations = migrate()
+            if applied_migrations:
+                print(f"Database schema migrated ({len(applied_migrations)} migration(s) applied)")
+
+            from seed_data import seed_defaults
+            seed_defaults()
+
+        except Exception as e:
+            logging.error(f"Database initialization error: {e}")
+            logging.info("App will start but database functionality may be limited")
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
-
-with app.app_context():
-    print("\nAvailable Routes:")
-    for rule in app.url_map.iter_rules():
-        print(f"{rule.endpoint:20s} -> {rule}")
\ No newline at end of file
@@ -0,0 +1,208 @@
+"""
+Approval routing for asset requests.
+
+The chain a request goes through depends on the requester's role. It is
+declared once in APPROVAL_CHAINS and compiled at import time into dict
+lookups used by can_approve_request(), approve_request(), the bulk approval
+endpoint and the dashboard / request list queries.
+
+Each AssetRequest also carries a denormalized queue entry
+(next_approver_role, next_approver_floor) recomputed by ORM events whenever
+its status, level, floor or requester changes, so "pending my approval" is a
+single indexed lookup. rebuild_approver_queue() recomputes it for all rows.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import and_, bindparam, event, inspect, select
+
+from models import db, AssetRequest, User
+
+# Requester role -> approver role for level 1, 2, ...; the last level is final
+APPROVAL_CHAINS = {
+    'User': ['Concern Manager', 'Admin', 'Accounts/SCM', 'MD'],
+    'Employee': ['Concern Manager', 'Admin', 'Accounts/SCM', 'MD'],
+    'Concern Manager': ['Admin', 'Accounts/SCM', 'MD'],
+    'Admin': ['Accounts/SCM', 'MD'],
+    'Accounts/SCM': ['Admin', 'MD'],
+}
+
+# Roles that may approve at any level (but never their own request)
+OVERRIDE_ROLES = {'MD'}
+
+# Approvers that only handle requests from their own floor
+FLOOR_SCOPED_ROLES = {'Concern Manager'}
+
+# Levels for requesters whose role has no chain (only an override role can approve)
+DEFAULT_MAX_LEVEL = 4
+
+
+def compile_policy(chains):
+    """Build (approver_at, max_levels, queues) lookups from the chain table
+
+    approver_at: (requester_role, level) -> approver role
+    max_levels:  requester_role -> final level
+    queues:      approver role -> {level: [requester roles]}
+    """
+    approver_at = {}
+    max_levels = {}
+    queues = {}
+    for requester_role, chain in chains.items():
+        max_levels[requester_role] = len(chain)
+        for level, approver_role in enumerate(chain, start=1):
+            approver_at[(requester_role, level)] = approver_role
+            queues.setdefault(approver_role, {}).setdefault(level, []).append(requester_role)
+    return approver_at, max_levels, queues
+
+
+_APPROVER_AT, _MAX_LEVELS, _QUEUES = compile_policy(APPROVAL_CHAINS)
+
+
+def max_level(requester_role):
+    """Approval level at which a request from requester_role is fully approved"""
+    return _MAX_LEVELS.get(requester_role, DEFAULT_MAX_LEVEL)
+
+
+def approver_role(requester_role, level):
+    return _APPROVER_AT.get((requester_role, level))
+
+
+def can_approve(user, asset_request, requester_role):
+    if user.id == asset_request.user_id:
+        return False
+    if user.role in OVERRIDE_ROLES:
+        return True
+    if approver_role(requester_role, asset_request.current_approval_level) != user.role:
+        return False
+    return user.role not in FLOOR_SCOPED_ROLES or user.floor == asset_request.floor
+
+
+def apply_decision(user, asset_request, action, requester_role):
+    """Move asset_request along its chain after user's Approved/Rejected action"""
+    if action == 'Approved':
+        # Override roles give final approval at any level
+        if user.role in OVERRIDE_ROLES or asset_request.current_approval_level >= max_level(requester_role):
+            asset_request.status = 'Approved'
+        else:
+            asset_request.current_approval_level += 1
+            asset_request.status = 'Pending'
+    elif action == 'Rejected':
+        asset_request.status = 'Rejected'
+    asset_request.updated_at = datetime.utcnow()
+
+
+def next_approver(status, level, requester_role, floor):
+    """(role, floor) that must act next on a request; floor only for floor-scoped roles"""
+    if status != 'Pending':
+        return None, None
+    role = approver_role(requester_role, level)
+    if role is None:
+        # Off-chain levels (e.g. escalated to MD) are left to the override roles
+        return None, None
+    return role, floor if role in FLOOR_SCOPED_ROLES else None
+
+
+def approvable_filter(user):
+    """SQL criterion on AssetRequest for the requests user can act on, or None"""
+    if user.role in OVERRIDE_ROLES:
+        return AssetRequest.user_id != user.id
+    if user.role not in _QUEUES:
+        return None
+
+    criterion = AssetRequest.next_approver_role == user.role
+    if user.role in FLOOR_SCOPED_ROLES:
+        criterion = and_(criterion, AssetRequest.next_approver_floor == user.floor)
+    return and_(criterion, AssetRequest.user_id != user.id)
+
+
+def approvable_requests_query(user):
+    """Query of pending requests awaiting user's decision"""
+    query = AssetRequest.query.filter(AssetRequest.status == 'Pending')
+    criterion = approvable_filter(user)
+    if criterion is None:
+        return query.filter(False)
+    return query.filter(criterion)
+
+
+def pending_approval_count(user):
+    """Number of requests waiting on user (0 without a query for non-approvers)"""
+    if approvable_filter(user) is None:
+        return 0
+    return approvable_requests_query(user).count()
+
+
+def approvable_request_ids(user, asset_requests):
+    """Ids of the requests in asset_requests that user may act on, decided
+    from their queue columns without further queries"""
+    if user.role not in OVERRIDE_ROLES and user.role not in _QUEUES:
+        return set()
+    scoped = user.role in FLOOR_SCOPED_ROLES
+    return {
+        r.id for r in asset_requests
+        if r.status == 'Pending' and r.user_id != user.id and (
+            user.role in OVERRIDE_ROLES
+            or (r.next_approver_role == user.role and (not scoped or r.next_approver_floor == user.floor))
+        )
+    }
+
+
+_QUEUE_FIELDS = ('status', 'current_approval_level', 'floor', 'user_id')
+
+
+@event.listens_for(AssetRequest, 'before_insert')
+@event.listens_for(AssetRequest, 'before_update')
+def _update_approver_queue(mapper, connection, target):
+    state = inspect(target)
+    if state.persistent and not any(state.attrs[name].history.has_changes() for name in _QUEUE_FIELDS):
+        return
+
+    requester = state.dict.get('requester')
+    if requester is not None and requester.id == target.user_id:
+        requester_role = requester.role
+    else:
+        requester_role = connection.execute(
+            select(User.role).where(User.id == target.user_id)).scalar()
+
+    target.next_approver_role, target.next_approver_floor = next_approver(
+        target.status, target.current_approval_level, requester_role, target.floor)
+
+
+@event.listens_for(User, 'after_update')
+def _requester_role_changed(mapper, connection, target):
+    # A promoted/demoted requester moves their pending requests to another chain
+    if inspect(target).attrs.role.history.has_changes():
+        _refresh_queue(connection, AssetRequest.user_id == target.id)
+
+
+def _refresh_queue(connection, criterion=None):
+    table = AssetRequest.__table__
+    clear = table.update().where(table.c.status != 'Pending')
+    rows = select(table.c.id, table.c.current_approval_level, table.c.floor, User.role).join(
+        User.__table__, User.__table__.c.id == table.c.user_id).where(table.c.status == 'Pending')
+    if criterion is not None:
+        clear = clear.where(criterion)
+        rows = rows.where(criterion)
+    connection.execute(clear.values(next_approver_role=None, next_approver_floor=None))
+
+    updates = []
+    for request_id, level, floor, requester_role in connection.execute(rows):
+        role, role_floor = next_approver('Pending', level, requester_role, floor)
+        updates.append({'request_id': request_id, 'role': role, 'role_floor': role_floor})
+    if updates:
+        connection.execute(
+            table.update().where(table.c.id == bindparam('request_id'))
+            .values(next_approver_role=bindparam('role'), next_approver_floor=bindparam('role_floor')),
+            updates,
+        )
+
+
+def rebuild_approver_queue(connection=None):
+    """Recompute next_approver_* for every request (after migrations or policy edits)
+
+    With a connection the caller owns the transaction; otherwise the session commits.
+    """
+    if connection is not None:
+        _refresh_queue(connection)
+        return
+    _refresh_queue(db.session.connection())
+    db.session.commit()
@@ -0,0 +1,90 @@
+"""
+Asset quantity limit evaluation.
+
+A limit is exceeded when its asset's current_quantity is above max_quantity
+and at its limit when the two are equal. The state is evaluated in SQL on the
+asset_limit/asset join instead of through AssetLimit.is_exceeded, which
+lazy-loads the asset for every limit. Assets that have no limit are found with
+an anti-join (NOT EXISTS) rather than an IN-list of every limited asset id.
+
+The same queries back the asset limits page and the limit alerts raised by
+stock_alerts.py (exceeded_limits_select()).
+"""
+
+from sqlalchemy import case, exists, func, select
+from sqlalchemy.orm import contains_eager
+
+from models import db, Asset, AssetLimit
+
+EXCEEDED = 'Exceeded'
+AT_LIMIT = 'At Limit'
+WITHIN = 'Within Limit'
+UNLIMITED = 'Unlimited'
+STATES = (EXCEEDED, AT_LIMIT, WITHIN)
+
+
+def limit_state():
+    """SQL expression for a limit's state; needs asset joined"""
+    return case(
+        (Asset.current_quantity > AssetLimit.max_quantity, EXCEEDED),
+        (Asset.current_quantity == AssetLimit.max_quantity, AT_LIMIT),
+        else_=WITHIN,
+    )
+
+
+def _state_filter(state):
+    if state == EXCEEDED:
+        return Asset.current_quantity > AssetLimit.max_quantity
+    if state == AT_LIMIT:
+        return Asset.current_quantity == AssetLimit.max_quantity
+    if state == WITHIN:
+        return Asset.current_quantity < AssetLimit.max_quantity
+    raise ValueError(f'Unknown limit state: {state}')
+
+
+def limits_query(state=None, alerts_only=False):
+    """AssetLimit query with each asset loaded in the same SELECT"""
+    query = AssetLimit.query.join(AssetLimit.asset).options(contains_eager(AssetLimit.asset))
+    if state:
+        query = query.filter(_state_filter(state))
+    if alerts_only:
+        query = query.filter(AssetLimit.alert_enabled.is_(True))
+    return query.order_by(Asset.asset_tag, AssetLimit.id)
+
+
+def exceeded_limits_query():
+    """Alert-enabled limits whose asset is over the maximum"""
+    return limits_query(EXCEEDED, alerts_only=True)
+
+
+def unlimited_assets_query():
+    """Assets with no limit configured"""
+    has_limit = exists().where(AssetLimit.asset_id == Asset.id)
+    return Asset.query.filter(~has_limit).order_by(Asset.asset_tag)
+
+
+def limit_counts():
+    """Number of limits in each state plus unlimited assets, in two aggregate queries"""
+    counts = dict.fromkeys(STATES + (UNLIMITED,), 0)
+    state = limit_state()
+    counts.update(db.session.execute(
+        select(state, func.count(AssetLimit.id))
+        .join(Asset, Asset.id == AssetLimit.asset_id)
+        .group_by(state)
+    ).all())
+    counts[UNLIMITED] = db.session.execute(
+        select(func.count(Asset.id)).where(~exists().where(AssetLimit.asset_id == Asset.id))
+    ).scalar()
+    return counts
+
+
+def exceeded_limits_select(asset_ids=None):
+    """Rows of (asset_id, asset_tag, name, current_quantity, max_quantity) over an alert-enabled limit"""
+    query = (select(AssetLimit.asset_id, Asset.asset_tag, Asset.name, Asset.current_quantity,
+                    AssetLimit.max_quantity)
+             .join(Asset, Asset.id == AssetLimit.asset_id)
+             .where(AssetLimit.alert_enabled.is_(True), _state_filter(EXCEEDED)))
+    if asset_ids is not None:
+        query = query.where(AssetLimit.asset_id.in_(asset_ids))
+    return query
+
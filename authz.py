@@ -0,0 +1,94 @@
+"""Session-embedded authorization claims.
+
+When SESSION_AUTHZ_CLAIM is enabled, login stores the user's id, role, floor,
+active flag and authz_version in the (signed) session cookie. Permission checks
+then only need to confirm that the claim's version still matches the user's
+current authz_version instead of loading the whole User row.
+"""
+import time
+
+from flask import session
+from sqlalchemy import event, inspect
+
+from app import app, db
+from db_routing import primary
+from models import User
+
+# Columns that affect authorization decisions; changing any of them bumps
+# User.authz_version so outstanding session claims are refreshed.
+AUTHZ_FIELDS = ('role', 'floor', 'is_active')
+
+# user_id -> (authz_version, fetched_at)
+_version_cache = {}
+
+
+def claims_enabled():
+    return app.config.get('SESSION_AUTHZ_CLAIM', False)
+
+
+def build_claim(user):
+    return {
+        'id': user.id,
+        'role': user.role,
+        'floor': user.floor,
+        'is_active': bool(user.is_active),
+        'v': user.authz_version or 0,
+    }
+
+
+def store_claim(user):
+    """Write a fresh claim for user into the session"""
+    session['authz'] = build_claim(user)
+    _version_cache[user.id] = (user.authz_version or 0, time.monotonic())
+
+
+def current_authz_version(user_id):
+    """Return the user's authz_version, using a short-lived per-process cache"""
+    ttl = app.config.get('AUTHZ_VERSION_TTL', 1.0)
+    now = time.monotonic()
+    cached = _version_cache.get(user_id)
+    if cached and now - cached[1] < ttl:
+        return cached[0]
+
+    # Always ask the primary so a role change is never hidden by replica lag
+    with primary():
+        row = db.session.query(User.authz_version).filter(User.id == user_id).first()
+    if row is None:
+        _version_cache.pop(user_id, None)
+        return None
+
+    version = row[0] or 0
+    _version_cache[user_id] = (version, now)
+    return version
+
+
+def load_claim(user_id):
+    """Return a valid claim for user_id, refreshing it from the database when stale"""
+    claim = session.get('authz')
+    if claim and claim.get('id') == user_id:
+        version = current_authz_version(user_id)
+        if version is None:
+            session.pop('authz', None)
+            return None
+        if claim.get('v') == version:
+            return claim
+
+    # From the primary, like the version check; populate_existing replaces a
+    # User this request may already have loaded from the replica
+    with primary():
+        user = db.session.get(User, user_id, populate_existing=True)
+    if not user:
+        session.pop('authz', None)
+        return None
+
+    store_claim(user)
+    session['role'] = user.role
+    return session['authz']
+
+
+@event.listens_for(User, 'before_update')
+def _bump_authz_version(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in AUTHZ_FIELDS):
+        target.authz_version = (target.authz_version or 0) + 1
+        _version_cache.pop(target.id, None)
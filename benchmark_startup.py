@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Startup-time comparison of the eager and lazy (LAZY_STARTUP) boot modes.
+
+Each run imports app.py in a fresh interpreter, as a cold boot or a worker
+without preload_app does, and times three things: the whole process, the
+import of app.py, and the first database query afterwards (which is where
+lazy mode pays for the mapper setup and connection it skipped at import).
+The database is a throwaway SQLite file brought up to date with
+schema_migrations.py and seed_data.py first, so both modes start from the
+steady state of an already deployed database. Pass --database-url to time
+against a real (already migrated) PostgreSQL instead.
+
+Usage:
+    python benchmark_startup.py
+    python benchmark_startup.py --runs 10 --modes lazy
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODES = {'eager': 'false', 'lazy': 'true'}
+
+# Run in each child; prints its timings as JSON on the last line
+PROBE = """
+import json, time
+started = time.perf_counter()
+from app import app, db
+imported = time.perf_counter()
+from sqlalchemy import select
+from models import User
+with app.app_context():
+    db.session.execute(select(User.id).limit(1)).all()
+queried = time.perf_counter()
+print(json.dumps({'import': imported - started, 'first_query': queried - imported}))
+"""
+
+
+def child_env(database_url, data_dir, lazy):
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_URL': database_url,
+        'UPLOAD_FOLDER': os.path.join(data_dir, 'uploads'),
+        'LAZY_STARTUP': lazy,
+    })
+    return env
+
+
+def prepare(database_url, data_dir):
+    env = child_env(database_url, data_dir, 'true')
+    for script in ('schema_migrations.py', 'seed_data.py'):
+        subprocess.run([sys.executable, script], cwd=BASE_DIR, env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def time_boot(database_url, data_dir, lazy):
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', PROBE], cwd=BASE_DIR, env=child_env(database_url, data_dir, lazy),
+                            check=True, capture_output=True, text=True)
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings['process'] = time.perf_counter() - started
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare cold-boot time with and without LAZY_STARTUP')
+    parser.add_argument('--runs', type=int, default=5, help='boots per mode')
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    parser.add_argument('--database-url', help='already migrated database to boot against '
+                                               '(default: a throwaway SQLite file)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        database_url = args.database_url or f"sqlite:///{os.path.join(data_dir, 'bench.db')}"
+        if not args.database_url:
+            prepare(database_url, data_dir)
+
+        results = {}
+        for _ in range(args.runs):
+            # Interleaved so both modes see the same disk cache and machine load
+            for mode in args.modes:
+                results.setdefault(mode, []).append(time_boot(database_url, data_dir, MODES[mode]))
+
+    print(f"{args.runs} cold boot(s) per mode; median (min) in ms")
+    print(f"{'mode':<8}{'process':>18}{'import app':>18}{'first query':>18}")
+    for mode in args.modes:
+        cells = []
+        for key in ('process', 'import', 'first_query'):
+            values = [run[key] * 1000 for run in results[mode]]
+            cells.append(f"{statistics.median(values):.0f} ({min(values):.0f})")
+        print(f"{mode:<8}" + ''.join(f"{cell:>18}" for cell in cells))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Load-test comparison of gunicorn worker profiles.
+
+Starts the app under gunicorn once per profile (using gunicorn_config.py and a
+throwaway SQLite database), logs in with the seeded admin account from several
+concurrent clients and hammers a mix of cheap and slow pages. Prints requests
+per second and latency percentiles per profile.
+
+Usage:
+    python benchmark_workers.py
+    python benchmark_workers.py --profiles sync gthread --clients 16 --duration 20
+"""
+
+import argparse
+import http.cookiejar
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+DEFAULT_PATHS = ['/health', '/dashboard', '/assets', '/download/assets']
+
+
+def wait_for_server(base_url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f'{base_url}/health', timeout=2) as response:
+                if response.status == 200:
+                    return True
+        except Exception:
+            time.sleep(0.5)
+    return False
+
+
+def start_server(profile, port, workers, threads, data_dir):
+    env = dict(os.environ)
+    env.update({
+        'GUNICORN_PROFILE': profile,
+        'PORT': str(port),
+        'WEB_CONCURRENCY': str(workers),
+        'GUNICORN_THREADS': str(threads),
+        'DATABASE_URL': f"sqlite:///{os.path.join(data_dir, 'bench.db')}",
+        'UPLOAD_FOLDER': os.path.join(data_dir, 'uploads'),
+    })
+    # The load test logs in as the admin user that eager startup seeds
+    for name in ('SQLALCHEMY_POOL_SIZE', 'SQLALCHEMY_MAX_OVERFLOW', 'SIZING_PLAN', 'LAZY_STARTUP'):
+        env.pop(name, None)
+    return subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn_config.py',
+         '--access-logfile', '/dev/null', 'app:app'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def run_client(base_url, paths, stop_at, latencies, errors, lock):
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    login_data = urllib.parse.urlencode({'username': 'admin', 'password': 'hexamed123'}).encode()
+    try:
+        opener.open(f'{base_url}/login', data=login_data, timeout=30).read()
+    except Exception:
+        with lock:
+            errors.append('login')
+        return
+
+    i = 0
+    while time.time() < stop_at:
+        path = paths[i % len(paths)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            opener.open(f'{base_url}{path}', timeout=60).read()
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def benchmark_profile(profile, args, port):
+    with tempfile.TemporaryDirectory() as data_dir:
+        server = start_server(profile, port, args.workers, args.threads, data_dir)
+        base_url = f'http://127.0.0.1:{port}'
+        try:
+            if not wait_for_server(base_url):
+                print(f"  {profile}: server did not start")
+                return None
+
+            latencies, errors = [], []
+            lock = threading.Lock()
+            stop_at = time.time() + args.duration
+            clients = [
+                threading.Thread(target=run_client,
+                                 args=(base_url, args.paths, stop_at, latencies, errors, lock))
+                for _ in range(args.clients)
+            ]
+            started = time.time()
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+            elapsed = time.time() - started
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    return {
+        'profile': profile,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': len(latencies) / elapsed if elapsed else 0,
+        'mean': statistics.mean(latencies) if latencies else 0,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare gunicorn worker profiles under load')
+    parser.add_argument('--profiles', nargs='+', default=['sync', 'gthread'])
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--duration', type=int, default=15, help='seconds per profile')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS)
+    args = parser.parse_args()
+
+    print(f"Load test: {args.clients} clients, {args.duration}s per profile, "
+          f"{args.workers} worker(s), {args.threads} threads for gthread")
+    print(f"Paths: {', '.join(args.paths)}")
+
+    results = []
+    for offset, profile in enumerate(args.profiles):
+        print(f"Running profile '{profile}'...")
+        result = benchmark_profile(profile, args, args.port + offset)
+        if result:
+            results.append(result)
+
+    print()
+    print(f"{'profile':<10}{'requests':>10}{'errors':>8}{'req/s':>10}"
+          f"{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for r in results:
+        print(f"{r['profile']:<10}{r['requests']:>10}{r['errors']:>8}{r['rps']:>10.1f}"
+              f"{r['mean'] * 1000:>10.1f}{r['p50'] * 1000:>10.1f}"
+              f"{r['p95'] * 1000:>10.1f}{r['p99'] * 1000:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+"""
+Content-addressed storage for uploaded files.
+
+Uploads are hashed (SHA-256) while they are written to a temporary file and
+then moved to UPLOAD_FOLDER/blobs/<aa>/<bb>/<sha256>. Identical content is
+stored once no matter how often it is uploaded. Each unique blob has a
+StoredBlob row whose ref_count tracks the UploadedFile and Bill rows pointing
+at it through their content_hash column (PO quotation and vendor documents are
+UploadedFile rows with po_id set). Blobs whose count drops to zero are left
+on disk for the orphan cleanup (upload_gc.py) to reclaim.
+
+The public filename of a stored upload is "<sha256><ext>", which is what the
+/uploads/<filename> and /download/<filename> routes receive; responses name
+the file as it was uploaded (original_filename).
+
+Upload views are wrapped in @upload_limit so oversized requests are refused
+with 413 before anything is written; see UPLOAD_LIMITS in app.py.
+"""
+
+import functools
+import hashlib
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+from collections import namedtuple
+from datetime import datetime
+
+from flask import has_request_context, request
+from sqlalchemy import event, exc
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.security import safe_join
+from werkzeug.utils import secure_filename
+
+from app import app
+from models import db, StoredBlob, UploadedFile, Bill
+from previews import schedule_preview
+
+BLOB_DIR = 'blobs'
+CHUNK_SIZE = 64 * 1024
+
+_BLOB_NAME = re.compile(r'^([0-9a-f]{64})(\.[A-Za-z0-9]+)?$')
+
+# Magic numbers for the file types in ALLOWED_EXTENSIONS
+_SIGNATURES = [
+    (b'%PDF-', 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'application/msword'),
+    (b'PK\x03\x04', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'),
+]
+
+IngestedFile = namedtuple('IngestedFile', 'sha256 path size mime_type')
+
+
+def blob_root():
+    return os.path.join(app.config['UPLOAD_FOLDER'], BLOB_DIR)
+
+
+def blob_path(sha256):
+    """Sharded location of a blob: blobs/ab/cd/abcd..."""
+    return os.path.join(blob_root(), sha256[:2], sha256[2:4], sha256)
+
+
+def public_filename(sha256, original_filename):
+    """Name used in upload URLs; the extension keeps MIME guessing working"""
+    ext = os.path.splitext(secure_filename(original_filename))[1].lower()
+    return sha256 + ext
+
+
+def resolve_blob(filename):
+    """Return the blob path for a "<sha256><ext>" filename, or None"""
+    match = _BLOB_NAME.match(filename)
+    if not match:
+        return None
+    path = blob_path(match.group(1))
+    return path if os.path.isfile(path) else None
+
+
+def blob_hash(path):
+    """Return the SHA-256 if path is a blob inside the store, else None"""
+    name = os.path.basename(path)
+    if not _BLOB_NAME.match(name) or os.path.abspath(path) != os.path.abspath(blob_path(name)):
+        return None
+    return name
+
+
+def resolve_upload(filename):
+    """Find the file behind an /uploads/<filename> link, or None
+
+    New uploads are addressed by hash. Older "<uuid>_<name>" links are served
+    from the flat upload folder until `python migrate_uploads.py` has moved
+    them, after which the row that owns the name points at the blob.
+    """
+    path = resolve_blob(filename)
+    if path:
+        return path
+
+    legacy_path = safe_join(app.config['UPLOAD_FOLDER'], filename)
+    if legacy_path and os.path.isfile(legacy_path):
+        return legacy_path
+
+    row = (db.session.query(UploadedFile.file_path).filter(UploadedFile.filename == filename).first()
+           or db.session.query(Bill.bill_file_path).filter(Bill.bill_filename == filename).first())
+    if row and row[0] and os.path.isfile(row[0]):
+        return row[0]
+    return None
+
+
+def original_filename(filename):
+    """Name to offer when serving an /uploads/<filename> link
+
+    Identical uploads share one public name, so this is the name of the
+    newest upload with that content. Bills stored before their original name
+    was kept, and unknown names, are offered under filename itself.
+    """
+    candidates = [
+        db.session.query(UploadedFile.uploaded_at, UploadedFile.original_filename)
+        .filter(UploadedFile.filename == filename).order_by(UploadedFile.id.desc()).first(),
+        db.session.query(Bill.created_at, Bill.original_filename)
+        .filter(Bill.bill_filename == filename, Bill.original_filename.isnot(None))
+        .order_by(Bill.id.desc()).first(),
+    ]
+    candidates = [row for row in candidates if row]
+    name = max(candidates, key=lambda row: row[0] or datetime.min)[1] if candidates else None
+    return os.path.basename(name.replace('\\', '/')) if name else filename
+
+
+def sniff_mime(head, fallback=None):
+    """Guess the MIME type from the first bytes of a file"""
+    for signature, mime_type in _SIGNATURES:
+        if head.startswith(signature):
+            return mime_type
+    return fallback or 'application/octet-stream'
+
+
+def upload_limit(kind):
+    """Cap the request body for an upload view at UPLOAD_LIMITS[kind] bytes
+
+    Werkzeug rejects the request with 413 before the form is parsed when the
+    Content-Length is too large, and stops reading a chunked body once it
+    passes the limit.
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def decorated_function(*args, **kwargs):
+            request.max_content_length = app.config['UPLOAD_LIMITS'][kind]
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def ingest(file, max_size=None):
+    """Stream a werkzeug FileStorage into the blob store in a single pass
+
+    Chunks are copied to a temp file next to the blobs while the size, the
+    SHA-256 and the sniffed MIME type are computed, so at most CHUNK_SIZE
+    bytes are held in memory. The temp file is then renamed into place, or
+    discarded if the content is already stored.
+    """
+    if max_size is None:
+        max_size = request.max_content_length if has_request_context() else None
+
+    root = blob_root()
+    os.makedirs(root, exist_ok=True)
+
+    digest = hashlib.sha256()
+    size = 0
+    mime_type = None
+    fd, tmp_path = tempfile.mkstemp(prefix='.upload-', dir=root)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = file.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if mime_type is None:
+                    mime_type = sniff_mime(chunk, file.content_type)
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise RequestEntityTooLarge()
+                digest.update(chunk)
+                out.write(chunk)
+
+        sha256 = digest.hexdigest()
+        path = blob_path(sha256)
+        if os.path.exists(path):
+            os.unlink(tmp_path)
+            # Refresh the mtime so the orphan cleanup's grace period covers the reuse
+            os.utime(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+    mime_type = mime_type or sniff_mime(b'', file.content_type)
+    _ensure_blob_row(sha256, size, mime_type)
+    schedule_preview(sha256, path, mime_type)
+    return IngestedFile(sha256, path, size, mime_type)
+
+
+def store_file(source_path):
+    """Add an existing file to the blob store without touching the original
+
+    The file is hashed in place and hard-linked (or copied, across
+    filesystems) into its blob location, so the caller can delete the
+    original once the rows pointing at it are committed.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    head = b''
+    with open(source_path, 'rb') as source:
+        while True:
+            chunk = source.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if not head:
+                head = chunk
+            digest.update(chunk)
+            size += len(chunk)
+
+    sha256 = digest.hexdigest()
+    mime_type = sniff_mime(head, mimetypes.guess_type(source_path)[0])
+    path = blob_path(sha256)
+    if os.path.exists(path):
+        os.utime(path)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = os.path.join(blob_root(), f'.migrate-{sha256}')
+        try:
+            os.link(source_path, tmp_path)
+        except OSError:
+            shutil.copy2(source_path, tmp_path)
+        os.replace(tmp_path, path)
+
+    _ensure_blob_row(sha256, size, mime_type)
+    return IngestedFile(sha256, path, size, mime_type)
+
+
+def _ensure_blob_row(sha256, size, mime_type):
+    if db.session.get(StoredBlob, sha256) is not None:
+        return
+
+    blob = StoredBlob()
+    blob.sha256 = sha256
+    blob.size = size
+    blob.mime_type = mime_type
+    blob.ref_count = 0
+    try:
+        # A concurrent upload of the same content may insert the row first
+        with db.session.begin_nested():
+            db.session.add(blob)
+    except exc.IntegrityError:
+        pass
+
+
+def save_uploaded_file(file, **links):
+    """Store file in the blob store and return a new (unsaved) UploadedFile"""
+    ingested = ingest(file)
+
+    uploaded_file = UploadedFile()
+    uploaded_file.filename = public_filename(ingested.sha256, file.filename)
+    uploaded_file.original_filename = file.filename
+    uploaded_file.file_path = ingested.path
+    uploaded_file.file_size = ingested.size
+    uploaded_file.mime_type = ingested.mime_type
+    uploaded_file.content_hash = ingested.sha256
+    for name, value in links.items():
+        setattr(uploaded_file, name, value)
+    return uploaded_file
+
+
+def attach_bill_file(bill, file):
+    """Store file in the blob store and point bill at it"""
+    ingested = ingest(file)
+    bill.bill_file_path = ingested.path
+    bill.bill_filename = public_filename(ingested.sha256, file.filename)
+    bill.original_filename = file.filename
+    bill.content_hash = ingested.sha256
+
+
+def _adjust_ref_count(connection, sha256, amount):
+    if sha256:
+        connection.execute(
+            StoredBlob.__table__.update()
+            .where(StoredBlob.sha256 == sha256)
+            .values(ref_count=StoredBlob.ref_count + amount)
+        )
+
+
+def _track_references(model):
+    @event.listens_for(model, 'after_insert')
+    def _add_reference(mapper, connection, target):
+        _adjust_ref_count(connection, target.content_hash, 1)
+
+    @event.listens_for(model, 'after_delete')
+    def _drop_reference(mapper, connection, target):
+        _adjust_ref_count(connection, target.content_hash, -1)
+
+    @event.listens_for(model, 'after_update')
+    def _move_reference(mapper, connection, target):
+        history = db.inspect(target).attrs.content_hash.history
+        if not history.has_changes():
+            return
+        for old in history.deleted:
+            _adjust_ref_count(connection, old, -1)
+        for new in history.added:
+            _adjust_ref_count(connection, new, 1)
+
+
+_track_references(UploadedFile)
+_track_references(Bill)
@@ -0,0 +1,194 @@
+"""
+Bulk approve / reject of asset requests.
+
+apply_bulk_action() applies one action to many requests in a single
+transaction. All requests (with their requesters) are loaded in one query,
+each one is checked against the approval policy, and the Approval and
+ActivityLog rows are written with one multi-row INSERT each. When
+Accounts/SCM approves, the candidate assets for the whole batch are loaded
+once and allocated in memory, so two requests in the batch never draw on the
+same stock.
+
+Requests that cannot be acted on are skipped and reported; they do not abort
+the rest of the batch.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import insert, or_
+from sqlalchemy.orm import joinedload
+
+from models import db, ActivityLog, Approval, Asset, AssetRequest, InventoryUpdate
+from approval_policy import apply_decision, can_approve
+
+ACTIONS = ('Approved', 'Rejected')
+MAX_BATCH_SIZE = 200
+FULFILMENT_STATUSES = ('Available', 'In Use')
+
+
+class BulkActionError(ValueError):
+    pass
+
+
+def parse_request_ids(values):
+    """Distinct integer ids from form/JSON values, in the order given"""
+    ids = []
+    for value in values or []:
+        try:
+            request_id = int(value)
+        except (TypeError, ValueError):
+            raise BulkActionError(f'Invalid request id: {value!r}')
+        if request_id not in ids:
+            ids.append(request_id)
+    return ids
+
+
+def _pick_asset(asset_request, candidates):
+    """First candidate that can fulfil asset_request, as approve_request() does"""
+    item_name = (asset_request.item_name or '').lower()
+    for asset in candidates:
+        if asset.status not in FULFILMENT_STATUSES or item_name not in (asset.name or '').lower():
+            continue
+        if asset.asset_type == 'Consumable Asset':
+            if (asset.current_quantity or 0) >= asset_request.quantity:
+                return asset
+        elif asset.asset_type == 'Fixed Asset' and asset.status == 'Available':
+            return asset
+    return None
+
+
+def _auto_fulfil(user, approved, results, now):
+    """Fulfil SCM-approved requests from stock; returns InventoryUpdate rows"""
+    names = {r.item_name for r in approved if r.item_name}
+    if not names:
+        return []
+    candidates = (Asset.query
+                  .filter(or_(*[Asset.name.ilike(f'%{name}%') for name in names]))
+                  .filter(Asset.status.in_(FULFILMENT_STATUSES))
+                  .order_by(Asset.id)
+                  .all())
+
+    inventory_updates = []
+    for asset_request in approved:
+        asset = _pick_asset(asset_request, candidates)
+        if asset is None:
+            continue
+
+        if asset.asset_type == 'Consumable Asset':
+            previous_quantity = asset.current_quantity
+            asset.current_quantity -= asset_request.quantity
+            if asset.current_quantity == 0:
+                asset.status = 'Out of Stock'
+            inventory_updates.append({
+                'asset_id': asset.id,
+                'previous_quantity': previous_quantity,
+                'new_quantity': asset.current_quantity,
+                'update_type': 'Consumption',
+                'reason': f'Auto-fulfilled request #{asset_request.id} for {asset_request.requester.full_name}',
+                'updated_by': user.id,
+                'created_at': now,
+            })
+        else:
+            asset.status = 'In Use'
+            asset.assigned_to = asset_request.user_id
+        asset.updated_at = now
+
+        asset_request.fulfilled_from_asset_id = asset.id
+        asset_request.fulfilled_quantity = asset_request.quantity
+        asset_request.fulfilled_by = user.id
+        asset_request.fulfilled_at = now
+        asset_request.fulfillment_notes = f'Auto-fulfilled by SCM from asset {asset.asset_tag}'
+        asset_request.status = 'Fulfilled'
+        results[asset_request.id] = {'result': 'fulfilled', 'status': 'Fulfilled',
+                                     'asset_tag': asset.asset_tag}
+    return inventory_updates
+
+
+def apply_bulk_action(user, request_ids, action, comments='', ip_address=None):
+    """Apply action to every request in request_ids and commit once
+
+    Returns {request_id: {'result': ..., 'status': ...}} where result is one
+    of approved, forwarded, fulfilled, rejected, not_found, not_pending or
+    forbidden.
+    """
+    if action not in ACTIONS:
+        raise BulkActionError(f'Unknown action: {action}')
+    if not request_ids:
+        raise BulkActionError('No requests selected.')
+    if len(request_ids) > MAX_BATCH_SIZE:
+        raise BulkActionError(f'At most {MAX_BATCH_SIZE} requests can be processed at once.')
+
+    asset_requests = (AssetRequest.query
+                      .options(joinedload(AssetRequest.requester))
+                      .filter(AssetRequest.id.in_(request_ids))
+                      .with_for_update(of=AssetRequest)
+                      .all())
+    by_id = {r.id: r for r in asset_requests}
+
+    now = datetime.utcnow()
+    results = {}
+    approvals = []
+    activities = []
+    approved = []
+    for request_id in request_ids:
+        asset_request = by_id.get(request_id)
+        if asset_request is None:
+            results[request_id] = {'result': 'not_found', 'status': None}
+            continue
+        if asset_request.status != 'Pending':
+            results[request_id] = {'result': 'not_pending', 'status': asset_request.status}
+            continue
+        if not can_approve(user, asset_request, asset_request.requester.role):
+            results[request_id] = {'result': 'forbidden', 'status': asset_request.status}
+            continue
+
+        approvals.append({
+            'request_id': request_id,
+            'approver_id': user.id,
+            'approval_level': asset_request.current_approval_level,
+            'action': action,
+            'comments': comments,
+            'approved_at': now,
+        })
+        activities.append({
+            'user_id': user.id,
+            'action': f'Request {action}',
+            'description': f'{action} request #{request_id} - {asset_request.item_name} (bulk)',
+            'request_id': request_id,
+            'ip_address': ip_address,
+            'timestamp': now,
+        })
+
+        apply_decision(user, asset_request, action, asset_request.requester.role)
+        if action == 'Rejected':
+            result = 'rejected'
+        elif asset_request.status == 'Approved':
+            result = 'approved'
+        else:
+            result = 'forwarded'
+        results[request_id] = {'result': result, 'status': asset_request.status}
+        if action == 'Approved':
+            approved.append(asset_request)
+
+    inventory_updates = []
+    if approved and user.role == 'Accounts/SCM':
+        inventory_updates = _auto_fulfil(user, approved, results, now)
+
+    try:
+        for model, rows in ((Approval, approvals), (ActivityLog, activities),
+                            (InventoryUpdate, inventory_updates)):
+            if rows:
+                db.session.execute(insert(model), rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return results
+
+
+def summarize(results):
+    """Counts per result, e.g. {'approved': 3, 'forbidden': 1}"""
+    counts = {}
+    for entry in results.values():
+        counts[entry['result']] = counts.get(entry['result'], 0) + 1
+    return counts
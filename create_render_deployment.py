@@ -26,6 +26,28 @@ def create_standalone_deployment():
         'app.py', 
         'models.py',
         'routes.py',
+        'approval_policy.py',
+        'asset_limits.py',
+        'bulk_approval.py',
+        'depreciation.py',
+        'depreciation_projection.py',
+        'maintenance_planner.py',
+        'authz.py',
+        'sizing.py',
+        'db_health.py',
+        'db_indexes.py',
+        'schema_migrations.py',
+        'seed_data.py',
+        'db_routing.py',
+        'blob_store.py',
+        'file_serving.py',
+        'previews.py',
+        'stock_alerts.py',
+        'vendor_scorecard.py',
+        'quotation_scoring.py',
+        'migrate_uploads.py',
+        'upload_gc.py',
+        'warranty_alerts.py',
         'gunicorn_config.py'
     ]
     
@@ -0,0 +1,99 @@
+"""
+Connection liveness handling without a round trip on every checkout.
+
+Instead of pool_pre_ping (a SELECT 1 each time a connection leaves the pool)
+connections are only pinged when they sat idle in the pool for longer than
+DB_IDLE_VALIDATE_SECONDS. Disconnects that still slip through are counted, and
+views marked with @read_only are retried once on a fresh connection.
+"""
+
+import functools
+import logging
+import threading
+import time
+
+from flask import request
+from sqlalchemy import event, exc
+
+from models import db
+
+# Counters reported by /health
+_metrics = {
+    'checkouts': 0,
+    'idle_validations': 0,
+    'stale_connections_replaced': 0,
+    'disconnects': 0,
+    'read_retries': 0,
+    'read_retry_failures': 0,
+}
+_metrics_lock = threading.Lock()
+
+# Endpoints that only read from the database (see read_only below)
+READ_ONLY_ENDPOINTS = set()
+
+
+def _count(name, amount=1):
+    with _metrics_lock:
+        _metrics[name] += amount
+
+
+def connection_metrics():
+    with _metrics_lock:
+        return dict(_metrics)
+
+
+def install_connection_health(engine, idle_threshold=60):
+    """Attach idle-aware validation and disconnect tracking to an engine"""
+    dialect = engine.dialect
+
+    @event.listens_for(engine, 'checkin')
+    def _record_checkin(dbapi_connection, connection_record):
+        connection_record.info['last_checkin'] = time.monotonic()
+
+    @event.listens_for(engine, 'checkout')
+    def _validate_idle_connection(dbapi_connection, connection_record, connection_proxy):
+        _count('checkouts')
+        last_checkin = connection_record.info.get('last_checkin')
+        # Fresh connections and recently used ones are trusted as-is
+        if last_checkin is None or time.monotonic() - last_checkin < idle_threshold:
+            return
+
+        _count('idle_validations')
+        try:
+            dialect.do_ping(dbapi_connection)
+        except Exception as e:
+            _count('stale_connections_replaced')
+            logging.warning(f"Discarding stale pooled connection: {e}")
+            # The pool retries the checkout with a new connection
+            raise exc.DisconnectionError() from e
+
+    @event.listens_for(engine, 'handle_error')
+    def _track_disconnect(context):
+        if context.is_disconnect:
+            _count('disconnects')
+
+
+def read_only(f):
+    """Mark a view as read-only so a disconnect mid-request is retried once"""
+    READ_ONLY_ENDPOINTS.add(f.__name__)
+
+    @functools.wraps(f)
+    def decorated_function(*args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return f(*args, **kwargs)
+
+        try:
+            return f(*args, **kwargs)
+        except exc.DBAPIError as e:
+            if not e.connection_invalidated:
+                raise
+            _count('read_retries')
+            logging.warning(f"Retrying {f.__name__} after database disconnect: {e.orig}")
+            db.session.rollback()
+
+        try:
+            return f(*args, **kwargs)
+        except exc.DBAPIError:
+            _count('read_retry_failures')
+            raise
+    return decorated_function
@@ -0,0 +1,298 @@
+"""
+Indexes declared on the models, applied to existing databases, and an audit.
+
+Every index lives in the models (`index=True` or `__table_args__`), sized to
+the filters and orderings the routes actually use. db.create_all() only
+creates indexes together with a new table, so ensure_indexes() adds the ones
+an existing table lacks through SQLAlchemy's DDL, on SQLite and PostgreSQL
+alike. schema_migrations.py runs it in the migration that introduces new
+indexes; an index whose columns have not been migrated yet is skipped.
+
+    python db_indexes.py apply   # create missing declared indexes
+    python db_indexes.py audit   # EXPLAIN the audited queries and report
+
+The audit runs EXPLAIN (EXPLAIN QUERY PLAN on SQLite) for AUDITED_QUERIES, a
+catalogue of the query shapes behind the list pages, counters and background
+jobs, and reports declared indexes missing from the database, queries that
+scan a whole table or sort without an index, indexes that none of the
+audited queries use and indexes in the database that no model declares (such
+as the ones schema.sql creates). On PostgreSQL it also lists indexes with no
+scans recorded in pg_stat_user_indexes. Without statistics (--analyze) the
+planners guess, and PostgreSQL prefers sequential scans on small tables, so
+audit a copy of production data and judge full scans by the row counts shown.
+"""
+
+import argparse
+import re
+import sys
+
+from sqlalchemy import exc, func, inspect, select, text
+
+from models import (db, ActivityLog, Asset, AssetLimit, AssetMaintenance, AssetRequest, Bill, ItemAssignment,
+                    ProcurementQuotation, PurchaseOrder, StockAlert, UploadedFile, VendorScorecard)
+
+EXPLAIN_DIALECTS = ('sqlite', 'postgresql')
+
+_INDEX_USED = re.compile(r'USING (?:COVERING )?INDEX (\w+)'
+                         r'|Index (?:Only )?Scan (?:Backward )?using (\w+)'
+                         r'|Bitmap Index Scan on (\w+)')
+_FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)$|Seq Scan on (\w+)')
+_SORT = re.compile(r'USE TEMP B-TREE FOR (?:ORDER BY|GROUP BY)|^(?:->\s*)?Sort\b')
+
+def _ranking(order):
+    return select(VendorScorecard).where(order.element.isnot(None)).order_by(order).limit(25)
+
+
+# name -> statement, mirroring the filters and orderings in routes.py and the background jobs
+AUDITED_QUERIES = {
+    'requests by floor, newest first': lambda: (
+        select(AssetRequest).where(AssetRequest.floor == 'Ground Floor')
+        .order_by(AssetRequest.created_at.desc()).limit(20)),
+    'requests by requester, newest first': lambda: (
+        select(AssetRequest).where(AssetRequest.user_id == 1).order_by(AssetRequest.created_at.desc()).limit(20)),
+    'all requests, newest first': lambda: (
+        select(AssetRequest).order_by(AssetRequest.created_at.desc()).limit(20)),
+    'request count by status and floor': lambda: (
+        select(func.count(AssetRequest.id))
+        .where(AssetRequest.status == 'Pending', AssetRequest.floor == 'Ground Floor')),
+    'approver queue': lambda: (
+        select(AssetRequest)
+        .where(AssetRequest.status == 'Pending', AssetRequest.next_approver_role == 'Floor Manager',
+               AssetRequest.next_approver_floor == 'Ground Floor', AssetRequest.user_id != 1)
+        .order_by(AssetRequest.created_at).limit(5)),
+    'assets by status, newest first': lambda: (
+        select(Asset).where(Asset.status == 'Available').order_by(Asset.created_at.desc()).limit(20)),
+    'warranties expiring': lambda: (
+        select(Asset.id).where(Asset.warranty_expiry <= func.current_date())),
+    'asset limits of an asset': lambda: (
+        select(AssetLimit).where(AssetLimit.asset_id == 1)),
+    'active stock alerts by type': lambda: (
+        select(StockAlert).where(StockAlert.is_active.is_(True), StockAlert.alert_type == 'Low Stock')),
+    'active stock alerts of assets': lambda: (
+        select(StockAlert.id).where(StockAlert.is_active.is_(True), StockAlert.asset_id.in_([1, 2, 3]))),
+    'upload by served name': lambda: (
+        select(UploadedFile.original_filename).where(UploadedFile.filename == 'a.pdf')
+        .order_by(UploadedFile.id.desc()).limit(1)),
+    'bill by served name': lambda: (
+        select(Bill.original_filename).where(Bill.bill_filename == 'a.pdf')
+        .order_by(Bill.id.desc()).limit(1)),
+    'bills by status, newest first': lambda: (
+        select(Bill).where(Bill.status == 'Pending').order_by(Bill.created_at.desc()).limit(15)),
+    'assignments by delivery status, newest first': lambda: (
+        select(ItemAssignment).where(ItemAssignment.delivery_status == 'Pending')
+        .order_by(ItemAssignment.created_at.desc()).limit(15)),
+    'assignments of a vendor, newest first': lambda: (
+        select(ItemAssignment).where(ItemAssignment.vendor_id == 1)
+        .order_by(ItemAssignment.created_at.desc()).limit(10)),
+    'all assignments, newest first': lambda: (
+        select(ItemAssignment).order_by(ItemAssignment.created_at.desc()).limit(200)),
+    'maintenance due': lambda: (
+        select(AssetMaintenance.id)
+        .where(AssetMaintenance.status == 'Scheduled', AssetMaintenance.scheduled_date <= func.current_date())),
+    'maintenance by status, newest first': lambda: (
+        select(AssetMaintenance).where(AssetMaintenance.status == 'Scheduled')
+        .order_by(AssetMaintenance.created_at.desc()).limit(15)),
+    'quotations of a request': lambda: (
+        select(ProcurementQuotation).where(ProcurementQuotation.request_id == 1)),
+    'quotations by status, newest first': lambda: (
+        select(ProcurementQuotation).where(ProcurementQuotation.status == 'Pending')
+        .order_by(ProcurementQuotation.created_at.desc()).limit(15)),
+    'purchase orders by status, newest first': lambda: (
+        select(PurchaseOrder).where(PurchaseOrder.status == 'Draft')
+        .order_by(PurchaseOrder.created_at.desc()).limit(15)),
+    'purchase orders of a vendor, newest first': lambda: (
+        select(PurchaseOrder).where(PurchaseOrder.vendor_id == 1)
+        .order_by(PurchaseOrder.created_at.desc()).limit(10)),
+    'vendor ranking by on-time rate': lambda: _ranking(VendorScorecard.on_time_rate.desc()),
+    'vendor ranking by PO spend': lambda: _ranking(VendorScorecard.po_spend.desc()),
+    'vendor ranking by PO count': lambda: _ranking(VendorScorecard.po_count.desc()),
+    'vendor ranking by quotation price': lambda: _ranking(VendorScorecard.avg_quotation_price.asc()),
+    'recent activity': lambda: (
+        select(ActivityLog).order_by(ActivityLog.timestamp.desc()).limit(10)),
+}
+
+
+def missing_indexes(bind):
+    """Declared indexes that existing tables lack, as (index, reason skipped) pairs
+
+    reason is None for indexes that can be created now.
+    """
+    inspector = inspect(bind)
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name in existing:
+                continue
+            absent = [column.name for column in index.columns if column.name not in columns]
+            missing.append((index, f"column {', '.join(absent)} not migrated yet" if absent else None))
+    return missing
+
+
+def ensure_indexes(connection=None):
+    """Create the declared indexes that existing tables lack; returns their names"""
+    if connection is None:
+        with db.engine.begin() as connection:
+            return ensure_indexes(connection)
+    created = []
+    for index, skipped in missing_indexes(connection):
+        if skipped is None:
+            index.create(connection)
+            created.append(index.name)
+    return created
+
+
+def explain(connection, statement):
+    """Plan lines for statement on connection's dialect (one of EXPLAIN_DIALECTS)"""
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True}))
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        return [row[3] for row in connection.execute(text(f'EXPLAIN QUERY PLAN {sql}'))]
+    if dialect == 'postgresql':
+        return [row[0].strip() for row in connection.execute(text(f'EXPLAIN {sql}'))]
+    raise ValueError(f'Cannot read query plans on {dialect}; the audit supports {", ".join(EXPLAIN_DIALECTS)}')
+
+
+def audit(connection):
+    """Report on declared, used and unused indexes for the audited queries"""
+    inspector = inspect(connection)
+    declared = {index.name: table.name for table in db.metadata.sorted_tables for index in table.indexes}
+    unique = {index.name for table in db.metadata.sorted_tables for index in table.indexes if index.unique}
+    in_database = {}
+    for table in db.metadata.sorted_tables:
+        if inspector.has_table(table.name):
+            for index in inspector.get_indexes(table.name):
+                in_database[index['name']] = table.name
+                if index.get('unique'):
+                    unique.add(index['name'])
+
+    plans = {}
+    failed = {}
+    used = set()
+    full_scans = {}
+    sorts = []
+    for name, build in AUDITED_QUERIES.items():
+        try:
+            plans[name] = lines = explain(connection, build())
+        except exc.DBAPIError as e:
+            # Usually a column the database has not been migrated to yet
+            connection.rollback()
+            failed[name] = str(e.orig).strip()
+            continue
+        for line in lines:
+            used.update(group for match in _INDEX_USED.finditer(line) for group in match.groups() if group)
+            scan = _FULL_SCAN.search(line)
+            if scan:
+                full_scans.setdefault(name, set()).add(scan.group(1) or scan.group(2))
+            if _SORT.search(line) and name not in sorts:
+                sorts.append(name)
+
+    return {
+        'dialect': connection.dialect.name,
+        'plans': plans,
+        'failed': failed,
+        'missing': [(index.name, index.table.name, skipped) for index, skipped in missing_indexes(connection)],
+        'full_scans': {name: sorted(tables) for name, tables in full_scans.items()},
+        'sorts': sorts,
+        # Unique indexes enforce constraints, so they are never reported as unused
+        'unused': sorted((name, table) for name, table in in_database.items()
+                         if name not in used and name not in unique),
+        'undeclared': sorted((name, table) for name, table in in_database.items() if name not in declared),
+        'never_scanned': _never_scanned(connection),
+    }
+
+
+def _never_scanned(connection):
+    if connection.dialect.name != 'postgresql':
+        return None
+    return [tuple(row) for row in connection.execute(text(
+        "SELECT indexrelname, relname FROM pg_stat_user_indexes WHERE idx_scan = 0 ORDER BY relname, indexrelname"))]
+
+
+def _row_count(connection, table):
+    return connection.execute(text(f'SELECT COUNT(*) FROM {connection.dialect.identifier_preparer.quote(table)}')).scalar()
+
+
+def print_report(connection, report, verbose=False):
+    print(f"Index audit ({report['dialect']}, {len(report['plans'])} queries)")
+
+    if report['failed']:
+        print("\nQueries that could not be explained:")
+        for name, error in report['failed'].items():
+            print(f"  {name}: {error}")
+
+    print("\nDeclared indexes missing from the database:")
+    for name, table, skipped in report['missing']:
+        print(f"  {table}.{name}" + (f" ({skipped})" if skipped else " (python db_indexes.py apply)"))
+    if not report['missing']:
+        print("  none")
+
+    print("\nQueries scanning a whole table:")
+    for name, tables in report['full_scans'].items():
+        print(f"  {name}: " + ', '.join(f'{table} ({_row_count(connection, table)} rows)' for table in tables))
+    if not report['full_scans']:
+        print("  none")
+
+    print("\nQueries sorting without an index:")
+    for name in report['sorts']:
+        print(f"  {name}")
+    if not report['sorts']:
+        print("  none")
+
+    print("\nIndexes not used by any audited query:")
+    for name, table in report['unused']:
+        print(f"  {table}.{name}")
+    if not report['unused']:
+        print("  none")
+
+    print("\nIndexes in the database that no model declares:")
+    for name, table in report['undeclared']:
+        print(f"  {table}.{name}")
+    if not report['undeclared']:
+        print("  none")
+
+    if report['never_scanned'] is not None:
+        print("\nIndexes never scanned since statistics were reset (pg_stat_user_indexes):")
+        for name, table in report['never_scanned']:
+            print(f"  {table}.{name}")
+        if not report['never_scanned']:
+            print("  none")
+
+    if verbose:
+        for name, lines in report['plans'].items():
+            print(f"\n{name}:")
+            for line in lines:
+                print(f"  {line}")
+
+
+if __name__ == '__main__':
+    from app import app
+
+    parser = argparse.ArgumentParser(description='Apply and audit the indexes declared on the models')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    subcommands.add_parser('apply', help='create declared indexes missing from existing tables')
+    audit_parser = subcommands.add_parser('audit', help='EXPLAIN the audited queries and report on indexes')
+    audit_parser.add_argument('--analyze', action='store_true',
+                              help='run ANALYZE first so the planner decides with current statistics')
+    audit_parser.add_argument('--verbose', action='store_true', help='print every query plan')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.command == 'apply':
+            created = ensure_indexes()
+            print(f"Created {len(created)} index(es)" + (f": {', '.join(created)}" if created else ""))
+        elif db.engine.dialect.name not in EXPLAIN_DIALECTS:
+            sys.exit(f"Cannot audit a {db.engine.dialect.name} database: query plans are only read on "
+                     f"{' and '.join(EXPLAIN_DIALECTS)}")
+        else:
+            if args.analyze:
+                with db.engine.begin() as connection:
+                    connection.execute(text('ANALYZE'))
+            with db.engine.connect() as connection:
+                report = audit(connection)
+                print_report(connection, report, verbose=args.verbose)
+            # Non-zero when the database is behind the models, for deploy checks
+            sys.exit(1 if report['failed'] or any(skipped is None for _, _, skipped in report['missing']) else 0)
@@ -0,0 +1,115 @@
+"""
+Optional read-replica routing.
+
+When DATABASE_READ_URL is set, app.py registers it as the 'replica' bind and
+GET requests to views marked @read_only (dashboard, analytics, downloads,
+search and the list/detail pages) run their queries against the replica.
+Flushes always go to the primary. After a user's own commit their session is
+pinned to the primary for DB_REPLICA_STICKY_SECONDS so they read their writes.
+
+For local testing any second SQLite or PostgreSQL database can act as the
+replica; `python db_routing.py sync-sqlite` copies a SQLite primary into a
+SQLite replica file to simulate replication.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+REPLICA_BIND = 'replica'
+
+
+class RoutingSession(Session):
+    """Session that sends reads to the replica bind while a request asks for it"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and _replica_requested():
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _replica_requested():
+    return has_request_context() and g.get('use_replica', False)
+
+
+@contextmanager
+def primary():
+    """Force queries inside the block to the primary, e.g. for authz checks"""
+    if not has_request_context():
+        yield
+        return
+    previous = g.get('use_replica', False)
+    g.use_replica = False
+    try:
+        yield
+    finally:
+        g.use_replica = previous
+
+
+def init_read_routing(app, read_only_endpoints):
+    """Route flagged read-only GET requests to the replica, with stickiness"""
+    sticky_seconds = app.config.get('DB_REPLICA_STICKY_SECONDS', 5)
+
+    @app.before_request
+    def _choose_database():
+        g.use_replica = (
+            REPLICA_BIND in app.config.get('SQLALCHEMY_BINDS', {})
+            and request.method in ('GET', 'HEAD')
+            and request.endpoint in read_only_endpoints
+            and session.get('db_sticky_until', 0) < time.time()
+        )
+
+    @event.listens_for(RoutingSession, 'after_flush')
+    def _note_write(db_session, flush_context):
+        if has_request_context():
+            g.db_wrote = True
+
+    @event.listens_for(RoutingSession, 'after_commit')
+    def _pin_to_primary(db_session):
+        if has_request_context() and g.pop('db_wrote', False):
+            session['db_sticky_until'] = time.time() + sticky_seconds
+
+
+def sync_sqlite_replica(primary_url, replica_url):
+    """Copy a SQLite primary into a SQLite replica (local stand-in for replication)"""
+    import sqlite3
+
+    def path(url):
+        if not url.startswith('sqlite:///'):
+            raise ValueError(f"Not a SQLite URL: {url}")
+        db_path = url[len('sqlite:///'):]
+        # Flask-SQLAlchemy resolves relative SQLite paths against the instance folder
+        if not os.path.isabs(db_path):
+            db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', db_path)
+        return db_path
+
+    source = sqlite3.connect(path(primary_url))
+    target = sqlite3.connect(path(replica_url))
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'sync-sqlite':
+        print("Usage: python db_routing.py sync-sqlite")
+        sys.exit(1)
+
+    primary_url = os.environ.get('DATABASE_URL', 'sqlite:///hexamed.db')
+    replica_url = os.environ.get('DATABASE_READ_URL')
+    if not replica_url:
+        print("DATABASE_READ_URL is not set")
+        sys.exit(1)
+
+    sync_sqlite_replica(primary_url, replica_url)
+    print(f"Copied {primary_url} to {replica_url}")
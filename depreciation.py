@@ -0,0 +1,241 @@
+"""
+Batch depreciation engine for the asset register.
+
+Instead of calling AssetDepreciation.update_book_value() row by row (which
+lazy-loads each asset), the engine reads cost, salvage value, annual charge,
+useful life, method and start date for a batch of records in one query, turns
+them into arrays and computes every book value in one vectorized pass with
+NumPy. Results are written back with bulk UPDATEs to asset_depreciation and
+to asset.current_value (which the lifecycle dashboard sums).
+
+Methods:
+    Straight Line      accumulated = months / 12 * annual_depreciation
+    Declining Balance  book value = cost * (1 - 2 / life) ** (months / 12)
+Both stop at cost - salvage_value. Months are whole calendar months since
+depreciation_start_date, as dateutil's relativedelta counts them.
+
+NumPy is optional; without it the same formulas run in a plain Python loop.
+
+Run it monthly from cron (records already calculated this month are skipped):
+    0 2 1 * *  cd /app && python depreciation.py
+    python depreciation.py --as-of 2025-03-31 --force --dry-run
+"""
+
+import argparse
+import calendar
+from collections import namedtuple
+from datetime import date, datetime
+
+from sqlalchemy import or_, select, update
+
+from models import db, Asset, AssetDepreciation
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DECLINING_BALANCE = 'Declining Balance'
+DECLINING_FACTOR = 2.0  # double-declining balance
+
+Valuation = namedtuple('Valuation', ['accumulated_depreciation', 'book_value'])
+
+# Columns loaded per record; purchase_cost comes from the asset
+INPUT_COLUMNS = (
+    AssetDepreciation.id,
+    AssetDepreciation.asset_id,
+    Asset.purchase_cost,
+    AssetDepreciation.salvage_value,
+    AssetDepreciation.annual_depreciation,
+    AssetDepreciation.useful_life_years,
+    AssetDepreciation.depreciation_method,
+    AssetDepreciation.depreciation_start_date,
+    AssetDepreciation.accumulated_depreciation,
+    AssetDepreciation.book_value,
+)
+
+
+class DepreciationInputs:
+    """Column arrays for a set of depreciation records (lists without NumPy)"""
+
+    def __init__(self, rows):
+        rows = [row for row in rows if row.purchase_cost is not None and row.depreciation_start_date]
+        self.rows = rows
+        self.ids = [row.id for row in rows]
+        self.asset_ids = [row.asset_id for row in rows]
+        self.start_dates = [row.depreciation_start_date for row in rows]
+        self.previous = [(row.accumulated_depreciation, row.book_value) for row in rows]
+        cost = [float(row.purchase_cost) for row in rows]
+        salvage = [float(row.salvage_value or 0) for row in rows]
+        annual = [float(row.annual_depreciation or 0) for row in rows]
+        life = [float(row.useful_life_years or 0) for row in rows]
+        declining = [row.depreciation_method == DECLINING_BALANCE for row in rows]
+        if np is not None:
+            cost, salvage, annual, life = (np.array(values, dtype=float) for values in (cost, salvage, annual, life))
+            declining = np.array(declining, dtype=bool)
+        self.cost, self.salvage, self.annual, self.life, self.declining = cost, salvage, annual, life, declining
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def months_between(start, end):
+    """Whole calendar months from start to end (0 if start is in the future)"""
+    # As relativedelta: the start day is clamped to the end month's length,
+    # so Jan 31 -> Feb 29 is a whole month
+    start_day = min(start.day, calendar.monthrange(end.year, end.month)[1])
+    months = (end.year - start.year) * 12 + end.month - start.month - (end.day < start_day)
+    return max(months, 0)
+
+
+def accumulated_depreciation(cost, salvage, annual, life, method, months):
+    """Depreciation charged after months for one asset"""
+    limit = max(cost - salvage, 0)
+    if method == DECLINING_BALANCE:
+        if life <= 0:
+            return 0
+        book_value = cost * max(1 - DECLINING_FACTOR / life, 0) ** (months / 12)
+        return min(max(cost - book_value, 0), limit)
+    return min(max(months / 12 * annual, 0), limit)
+
+
+def elapsed_months(inputs, as_of):
+    """Months elapsed for every record in inputs at as_of"""
+    if np is None:
+        return [months_between(start, as_of) for start in inputs.start_dates]
+    starts = np.array(inputs.start_dates, dtype='datetime64[D]')
+    start_months = starts.astype('datetime64[M]')
+    start_days = (starts - start_months.astype('datetime64[D]')).astype(int)
+    as_of_day = np.datetime64(as_of, 'D')
+    as_of_month = as_of_day.astype('datetime64[M]')
+    as_of_days = int((as_of_day - as_of_month.astype('datetime64[D]')).astype(int))
+    month_length = calendar.monthrange(as_of.year, as_of.month)[1]
+    start_days = np.minimum(start_days, month_length - 1)  # clamped as in months_between
+    months = (as_of_month - start_months).astype(int) - (as_of_days < start_days)
+    return np.maximum(months, 0)
+
+
+def accumulated_array(inputs, months):
+    """Vectorized accumulated depreciation
+
+    months is one value per record, or (records x periods) for schedules;
+    the result has the same shape.
+    """
+    if np is None:
+        def one(i, m):
+            method = DECLINING_BALANCE if inputs.declining[i] else None
+            return accumulated_depreciation(inputs.cost[i], inputs.salvage[i], inputs.annual[i],
+                                            inputs.life[i], method, m)
+        return [[one(i, m) for m in row] if isinstance(row, (list, tuple)) else one(i, row)
+                for i, row in enumerate(months)]
+
+    months = np.asarray(months, dtype=float)
+    cost, salvage, annual, life, declining = (inputs.cost, inputs.salvage, inputs.annual,
+                                              inputs.life, inputs.declining)
+    if months.ndim == 2:
+        cost, salvage, annual, life, declining = (a[:, None] for a in (cost, salvage, annual, life, declining))
+
+    limit = np.maximum(cost - salvage, 0)
+    years = months / 12
+    straight = years * annual
+    with np.errstate(divide='ignore', invalid='ignore'):
+        base = np.clip(1 - np.where(life > 0, DECLINING_FACTOR / life, 0), 0, None)
+    declining_charge = np.where(life > 0, cost - cost * base ** years, 0)
+    charge = np.where(declining, declining_charge, straight)
+    return np.minimum(np.maximum(charge, 0), limit)
+
+
+def value_inputs(inputs, as_of=None):
+    """[(accumulated, book_value)] rounded to paise, one per record"""
+    as_of = as_of or date.today()
+    accumulated = accumulated_array(inputs, elapsed_months(inputs, as_of))
+    if np is not None:
+        accumulated = np.round(accumulated, 2)
+        book_values = np.round(inputs.cost - accumulated, 2)
+        return list(zip(accumulated.tolist(), book_values.tolist()))
+    return [(round(acc, 2), round(cost - acc, 2)) for acc, cost in zip(accumulated, inputs.cost)]
+
+
+def current_valuations(records, as_of=None):
+    """{record id: Valuation} for loaded AssetDepreciation rows, without writing
+
+    Used by read-only pages; the asset relationship should be eager-loaded.
+    """
+    Row = namedtuple('Row', [column.key for column in INPUT_COLUMNS])
+    rows = [Row(r.id, r.asset_id, r.asset.purchase_cost if r.asset else None, r.salvage_value,
+                r.annual_depreciation, r.useful_life_years, r.depreciation_method,
+                r.depreciation_start_date, r.accumulated_depreciation, r.book_value)
+            for r in records]
+    inputs = DepreciationInputs(rows)
+    return {record_id: Valuation(*values)
+            for record_id, values in zip(inputs.ids, value_inputs(inputs, as_of))}
+
+
+def _load_batch(after_id, batch_size, stale_before):
+    query = (select(*INPUT_COLUMNS)
+             .join(Asset, Asset.id == AssetDepreciation.asset_id)
+             .where(AssetDepreciation.id > after_id)
+             .order_by(AssetDepreciation.id)
+             .limit(batch_size))
+    if stale_before is not None:
+        query = query.where(or_(AssetDepreciation.last_calculated_date.is_(None),
+                                AssetDepreciation.last_calculated_date < stale_before))
+    return db.session.execute(query).all()
+
+
+def run_depreciation(as_of=None, batch_size=1000, force=False, dry_run=False):
+    """Recalculate stored book values; returns (checked, updated)
+
+    Without force, records already calculated in as_of's month are skipped,
+    so the monthly job can be re-run safely.
+    """
+    as_of = as_of or date.today()
+    stale_before = None if force else as_of.replace(day=1)
+    checked = updated = 0
+    last_id = 0
+
+    while True:
+        rows = _load_batch(last_id, batch_size, stale_before)
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        inputs = DepreciationInputs(rows)
+        checked += len(inputs)
+        depreciation_rows = []
+        asset_rows = []
+        for record_id, asset_id, previous, (accumulated, book_value) in zip(
+                inputs.ids, inputs.asset_ids, inputs.previous, value_inputs(inputs, as_of)):
+            if previous != (accumulated, book_value):
+                updated += 1
+                asset_rows.append({'id': asset_id, 'current_value': book_value})
+            depreciation_rows.append({'id': record_id, 'accumulated_depreciation': accumulated,
+                                      'book_value': book_value, 'last_calculated_date': as_of})
+
+        if dry_run or not depreciation_rows:
+            continue
+        db.session.execute(update(AssetDepreciation), depreciation_rows)
+        if asset_rows:
+            db.session.execute(update(Asset), asset_rows)
+        db.session.commit()
+
+    return checked, updated
+
+
+if __name__ == '__main__':
+    from app import app
+
+    parser = argparse.ArgumentParser(description='Recalculate depreciation and book values for all assets')
+    parser.add_argument('--as-of', type=lambda value: datetime.strptime(value, '%Y-%m-%d').date(),
+                        help='valuation date (YYYY-MM-DD), default today')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--force', action='store_true', help='also recalculate records done this month')
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    with app.app_context():
+        checked, updated = run_depreciation(as_of=args.as_of, batch_size=args.batch_size,
+                                            force=args.force, dry_run=args.dry_run)
+    engine = 'numpy' if np is not None else 'python'
+    print(("[dry run] " if args.dry_run else "") +
+          f"Checked {checked} depreciation record(s), {updated} book value(s) changed ({engine})")
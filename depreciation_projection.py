@@ -0,0 +1,205 @@
+"""
+Projected book values for the asset register.
+
+project() computes the book value of every depreciable asset today and on
+each of the next N anniversaries in one vectorized pass (records x periods,
+see depreciation.accumulated_array) and rolls the results up per category.
+
+Results are cached per worker, keyed by the years / valuation date asked for
+and a fingerprint of the asset set (record count, total cost and the latest
+updated_at of assets and depreciation records). The fingerprint is one
+aggregate query, so a change made through another worker is noticed on its
+next request. ORM events on Asset and AssetDepreciation also clear this
+worker's cache straight away.
+"""
+
+import csv
+import io
+import threading
+from collections import OrderedDict
+from datetime import date
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import event, func, inspect, select
+
+from models import db, Asset, AssetDepreciation
+from depreciation import INPUT_COLUMNS, DepreciationInputs, accumulated_array, elapsed_months, np
+
+MAX_YEARS = 30
+CACHE_SIZE = 16
+UNCATEGORIZED = 'Uncategorized'
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_generation = 0
+
+
+class Projection:
+    def __init__(self, as_of, dates, assets, categories, totals):
+        self.as_of = as_of
+        self.dates = dates
+        self.assets = assets          # [{asset_id, asset_tag, name, category, book_values}]
+        self.categories = categories  # category -> [book value per date]
+        self.totals = totals          # [book value per date]
+
+    def to_dict(self, include_assets=False):
+        data = {
+            'as_of': self.as_of.isoformat(),
+            'dates': [d.isoformat() for d in self.dates],
+            'categories': [{'category': name, 'book_values': values}
+                           for name, values in self.categories.items()],
+            'totals': self.totals,
+        }
+        if include_assets:
+            data['assets'] = self.assets
+        return data
+
+
+def _rollup(categories, book_values, periods):
+    """Sum book values per category; returns (OrderedDict, totals)"""
+    if np is not None and len(categories):
+        names, inverse = np.unique(np.array(categories, dtype=object), return_inverse=True)
+        sums = np.zeros((len(names), periods))
+        np.add.at(sums, inverse, book_values)
+        sums = np.round(sums, 2)
+        rollup = OrderedDict((str(name), row) for name, row in zip(names.tolist(), sums.tolist()))
+        return rollup, np.round(sums.sum(axis=0), 2).tolist()
+
+    rollup = OrderedDict()
+    for category, values in sorted(zip(categories, book_values), key=lambda item: item[0]):
+        sums = rollup.setdefault(category, [0.0] * periods)
+        for i, value in enumerate(values):
+            sums[i] += value
+    for category, sums in rollup.items():
+        rollup[category] = [round(value, 2) for value in sums]
+    totals = [round(sum(column), 2) for column in zip(*rollup.values())] or [0.0] * periods
+    return rollup, totals
+
+
+def project(years, as_of=None):
+    """Uncached projection of book values at as_of and each of the next years"""
+    as_of = as_of or date.today()
+    dates = [as_of + relativedelta(years=k) for k in range(years + 1)]
+    rows = db.session.execute(
+        select(*INPUT_COLUMNS, Asset.asset_tag, Asset.name, Asset.category)
+        .join(Asset, Asset.id == AssetDepreciation.asset_id)
+        .order_by(Asset.category, Asset.asset_tag)
+    ).all()
+    inputs = DepreciationInputs(rows)
+
+    base = elapsed_months(inputs, as_of)
+    if np is not None:
+        months = base[:, None] + 12 * np.arange(years + 1)
+        book_values = np.round(inputs.cost[:, None] - accumulated_array(inputs, months), 2)
+        book_value_rows = book_values.tolist()
+    else:
+        months = [[m + 12 * k for k in range(years + 1)] for m in base]
+        book_value_rows = [[round(cost - acc, 2) for acc in row]
+                           for cost, row in zip(inputs.cost, accumulated_array(inputs, months))]
+        book_values = book_value_rows
+
+    categories = [row.category or UNCATEGORIZED for row in inputs.rows]
+    assets = [{'asset_id': row.asset_id, 'asset_tag': row.asset_tag, 'name': row.name,
+               'category': category, 'book_values': values}
+              for row, category, values in zip(inputs.rows, categories, book_value_rows)]
+    rollup, totals = _rollup(categories, book_values, years + 1)
+    return Projection(as_of, dates, assets, rollup, totals)
+
+
+def _fingerprint():
+    return tuple(db.session.execute(
+        select(func.count(AssetDepreciation.id), func.sum(Asset.purchase_cost),
+               func.max(AssetDepreciation.updated_at), func.max(Asset.updated_at))
+        .select_from(AssetDepreciation)
+        .join(Asset, Asset.id == AssetDepreciation.asset_id)
+    ).one())
+
+
+def get_projection(years, as_of=None):
+    """Cached project()"""
+    years = max(1, min(int(years), MAX_YEARS))
+    as_of = as_of or date.today()
+    key = (_generation, _fingerprint(), years, as_of)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    projection = project(years, as_of)
+    with _cache_lock:
+        _cache[key] = projection
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return projection
+
+
+def invalidate():
+    global _generation
+    with _cache_lock:
+        _generation += 1
+        _cache.clear()
+
+
+@event.listens_for(AssetDepreciation, 'after_insert')
+@event.listens_for(AssetDepreciation, 'after_update')
+@event.listens_for(AssetDepreciation, 'after_delete')
+@event.listens_for(Asset, 'after_insert')
+@event.listens_for(Asset, 'after_delete')
+def _depreciation_changed(mapper, connection, target):
+    invalidate()
+
+
+@event.listens_for(Asset, 'after_update')
+def _asset_changed(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in ('purchase_cost', 'category', 'asset_tag', 'name')):
+        invalidate()
+
+
+def _header(projection):
+    return [d.strftime('%Y-%m-%d') for d in projection.dates]
+
+
+def write_xlsx(projection, fileobj):
+    """Write category and asset sheets with openpyxl's write-only (streaming) mode"""
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    workbook = openpyxl.Workbook(write_only=True)
+    header_font = Font(bold=True)
+
+    def header_row(sheet, labels):
+        cells = []
+        for label in labels:
+            cell = WriteOnlyCell(sheet, value=label)
+            cell.font = header_font
+            cells.append(cell)
+        sheet.append(cells)
+
+    by_category = workbook.create_sheet('By Category')
+    header_row(by_category, ['Category'] + _header(projection))
+    for category, values in projection.categories.items():
+        by_category.append([category] + values)
+    by_category.append(['Total'] + projection.totals)
+
+    by_asset = workbook.create_sheet('By Asset')
+    header_row(by_asset, ['Asset Tag', 'Name', 'Category'] + _header(projection))
+    for asset in projection.assets:
+        by_asset.append([asset['asset_tag'], asset['name'], asset['category']] + asset['book_values'])
+
+    workbook.save(fileobj)
+
+
+def iter_csv(projection):
+    """Per-category projection as CSV lines (fallback when openpyxl is missing)"""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    rows = [['Category'] + _header(projection)]
+    rows += [[category] + values for category, values in projection.categories.items()]
+    rows.append(['Total'] + projection.totals)
+    for row in rows:
+        writer.writerow(row)
+        yield output.getvalue()
+        output.seek(0)
+        output.truncate()
@@ -0,0 +1,81 @@
+"""
+Serving of uploaded attachments.
+
+Responses carry a strong ETag and honour If-None-Match, If-Modified-Since and
+Range requests. Content-addressed blobs never change, so their ETag is the
+SHA-256 and browsers may cache them for a year; legacy flat files are
+revalidated on every use.
+
+With FILE_SERVING_MODE=x-accel-redirect (nginx) or x-sendfile (Apache,
+lighttpd) the worker only checks access and headers and the front proxy sends
+the bytes, so large downloads do not hold a gunicorn worker. For nginx,
+X_ACCEL_PREFIX must be an internal location aliased to UPLOAD_FOLDER.
+"""
+
+import os
+
+from flask import abort, current_app, request
+from werkzeug.utils import send_file
+
+from blob_store import blob_hash, original_filename, resolve_upload
+
+BLOB_MAX_AGE = 365 * 24 * 3600
+
+
+def apply_cache_policy(response, immutable):
+    """Browser-only caching: a year for content-addressed files, else revalidate"""
+    # Attachments sit behind a login, so shared caches must not keep them
+    response.cache_control.public = None
+    response.cache_control.private = True
+    if immutable:
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = BLOB_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+def _offload_path(path):
+    """Path under UPLOAD_FOLDER used by the proxy, or None if outside it"""
+    root = os.path.abspath(current_app.config['UPLOAD_FOLDER'])
+    path = os.path.abspath(path)
+    if not path.startswith(root + os.sep):
+        return None
+    return os.path.relpath(path, root).replace(os.sep, '/')
+
+
+def serve_upload(filename, as_attachment=False):
+    path = resolve_upload(filename)
+    if not path:
+        abort(404)
+
+    content_hash = blob_hash(path)
+    download_name = original_filename(filename)
+    mode = current_app.config.get('FILE_SERVING_MODE', '')
+    relative_path = _offload_path(path) if mode else None
+
+    if relative_path is None:
+        response = send_file(
+            path, request.environ, download_name=download_name, as_attachment=as_attachment,
+            conditional=True, etag=content_hash or True, response_class=current_app.response_class,
+        )
+    else:
+        response = send_file(
+            path, request.environ, download_name=download_name, as_attachment=as_attachment,
+            conditional=False, etag=content_hash or True, use_x_sendfile=True,
+            response_class=current_app.response_class,
+        )
+        etag = response.get_etag()[0]
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+            response.set_etag(etag)
+        else:
+            del response.headers['X-Sendfile']
+            if mode == 'x-accel-redirect':
+                prefix = current_app.config.get('X_ACCEL_PREFIX', '/protected-uploads/')
+                response.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + relative_path
+            else:
+                response.headers['X-Sendfile'] = path
+
+    return apply_cache_policy(response, immutable=bool(content_hash))
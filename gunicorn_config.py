@@ -1,11 +1,24 @@
 
 import os
+import json
+import logging
+
+from sizing import compute_plan, describe
+
+# Worker profile:
+#   sync    - one request at a time per worker (default)
+#   gthread - a thread pool per worker, for slow exports/uploads
+#   gevent  - cooperative greenlets (requires gevent and psycogreen)
+profile = os.environ.get('GUNICORN_PROFILE', 'sync')
+
+# Workers, threads and the per-worker DB pool come from CPU, memory and the
+# DB_MAX_CONNECTIONS budget (see sizing.py); env overrides still apply.
+plan = compute_plan(profile)
+os.environ['SIZING_PLAN'] = json.dumps(plan)
 
 # Gunicorn configuration for production
 bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
-workers = os.environ.get('WEB_CONCURRENCY', 1)
-worker_class = 'sync'
-worker_connections = 1000
+workers = plan['workers']
 timeout = 120
 keepalive = 2
 max_requests = 1000
@@ -14,3 +27,39 @@ preload_app = True
 accesslog = '-'
 errorlog = '-'
 loglevel = 'info'
+
+if profile == 'gthread':
+    worker_class = 'gthread'
+    threads = plan['threads']
+elif profile == 'gevent':
+    worker_class = 'gevent'
+    worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 100))
+    # gevent must monkey-patch before the app (and psycopg2) is imported
+    preload_app = False
+else:
+    worker_class = 'sync'
+
+
+def when_ready(server):
+    server.log.info(describe(plan))
+    if preload_app:
+        # Finish the ORM mapper setup (which LAZY_STARTUP leaves to the first
+        # query) in the master, so forked and respawned workers inherit it
+        from sqlalchemy.orm import configure_mappers
+        configure_mappers()
+
+
+def post_fork(server, worker):
+    if profile == 'gevent':
+        try:
+            from psycogreen.gevent import patch_psycopg
+            patch_psycopg()
+        except ImportError:
+            logging.warning("psycogreen not installed; psycopg2 calls will block the gevent worker")
+
+    if preload_app:
+        # The master imported app.py and opened connections before forking;
+        # discard them so workers never share a socket with each other.
+        from app import app, db
+        with app.app_context():
+            db.engine.dispose(close=False)
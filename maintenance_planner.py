@@ -0,0 +1,169 @@
+"""
+Recurring maintenance planner.
+
+A MaintenancePlan repeats every interval_months from start_date, either for
+one asset or for every asset in a category (disposed assets are skipped).
+materialize() turns active plans into concrete Scheduled AssetMaintenance
+rows for the next --horizon-days. For category plans the asset ids are
+streamed in batches; each batch costs one lookup of the occurrences that
+already exist and one multi-row INSERT for the missing ones. The unique
+index on (plan_id, asset_id, scheduled_date) makes re-runs, and runs racing
+each other, idempotent. Cancelled or completed occurrences are never
+recreated.
+
+due_in_window() is the query behind the lifecycle dashboard and
+/api/maintenance/due. It is served by the (status, scheduled_date) index.
+
+Run daily from cron so the horizon keeps rolling forward:
+    30 5 * * *  cd /app && python maintenance_planner.py --horizon-days 90
+"""
+
+import argparse
+from datetime import date, timedelta
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import select
+
+from models import db, Asset, AssetMaintenance, MaintenancePlan, insert_ignoring_duplicates
+
+DEFAULT_HORIZON_DAYS = 90
+EXCLUDED_ASSET_STATUSES = ('Disposed',)
+
+
+def occurrences(plan, start, end):
+    """Dates of plan's occurrences between start and end (inclusive)"""
+    if not plan.interval_months or plan.interval_months <= 0:
+        return []
+    elapsed = relativedelta(start, plan.start_date)
+    k = max(0, (elapsed.years * 12 + elapsed.months) // plan.interval_months)
+    dates = []
+    while True:
+        # Always offset from start_date so month-end dates don't drift
+        when = plan.start_date + relativedelta(months=k * plan.interval_months)
+        if when > end:
+            return dates
+        if when >= start:
+            dates.append(when)
+        k += 1
+
+
+def plan_asset_ids(plan, batch_size):
+    """Yield lists of asset ids covered by plan"""
+    if plan.asset_id:
+        yield [plan.asset_id]
+        return
+    query = (select(Asset.id)
+             .where(Asset.category == plan.category, Asset.status.notin_(EXCLUDED_ASSET_STATUSES))
+             .order_by(Asset.id))
+    last_id = 0
+    while True:
+        ids = db.session.execute(query.where(Asset.id > last_id).limit(batch_size)).scalars().all()
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def materialize_plan(plan, today=None, horizon_days=DEFAULT_HORIZON_DAYS, batch_size=1000, asset_ids=None):
+    """Insert plan's missing occurrences within the horizon; returns rows created"""
+    today = today or date.today()
+    dates = occurrences(plan, today, today + timedelta(days=horizon_days))
+    if not dates:
+        return 0
+
+    created = 0
+    batches = [asset_ids] if asset_ids is not None else plan_asset_ids(plan, batch_size)
+    for ids in batches:
+        existing = set(db.session.execute(
+            select(AssetMaintenance.asset_id, AssetMaintenance.scheduled_date)
+            .where(AssetMaintenance.plan_id == plan.id,
+                   AssetMaintenance.asset_id.in_(ids),
+                   AssetMaintenance.scheduled_date.between(dates[0], dates[-1]))
+        ).all())
+        rows = [{
+            'plan_id': plan.id,
+            'asset_id': asset_id,
+            'maintenance_type': plan.maintenance_type or 'Preventive',
+            'scheduled_date': when,
+            'description': plan.description,
+            'service_provider': plan.service_provider,
+            'status': 'Scheduled',
+            'next_maintenance_date': when + relativedelta(months=plan.interval_months),
+            'created_by': plan.created_by,
+        } for asset_id in ids for when in dates if (asset_id, when) not in existing]
+        if rows:
+            result = db.session.execute(insert_ignoring_duplicates(AssetMaintenance.__table__), rows)
+            # Rows a concurrent run inserted first are skipped, not created
+            created += result.rowcount if result.rowcount >= 0 else len(rows)
+    return created
+
+
+def materialize(horizon_days=DEFAULT_HORIZON_DAYS, today=None, batch_size=1000):
+    """Materialize every active plan, committing per plan; returns (plans, created)"""
+    plans = MaintenancePlan.query.filter(MaintenancePlan.is_active.is_(True)).order_by(MaintenancePlan.id).all()
+    created = 0
+    for plan in plans:
+        created += materialize_plan(plan, today=today, horizon_days=horizon_days, batch_size=batch_size)
+        db.session.commit()
+    return len(plans), created
+
+
+def schedule_follow_up(maintenance, user_id):
+    """After maintenance is completed, make sure its next occurrence exists
+
+    Plan-generated rows are topped up from the plan; one-off rows with a
+    next_maintenance_date get a single follow-up row. Returns the date or None.
+    """
+    plan = maintenance.plan
+    if plan and plan.is_active:
+        # Occurrences are only materialized from today on, so a late completion
+        # is followed by the next occurrence that is still ahead
+        today = date.today()
+        start = max(maintenance.scheduled_date + timedelta(days=1), today)
+        next_dates = occurrences(plan, start, start + relativedelta(months=plan.interval_months))
+        if not next_dates:
+            return None
+        # Reach at least the next occurrence, even if it lies beyond the usual horizon
+        horizon_days = max(DEFAULT_HORIZON_DAYS, (next_dates[0] - today).days)
+        materialize_plan(plan, today=today, horizon_days=horizon_days, asset_ids=[maintenance.asset_id])
+        return next_dates[0]
+
+    when = maintenance.next_maintenance_date
+    if not when or when <= maintenance.scheduled_date:
+        return None
+    exists = AssetMaintenance.query.filter_by(asset_id=maintenance.asset_id, scheduled_date=when,
+                                              status='Scheduled').first()
+    if exists is None:
+        follow_up = AssetMaintenance()
+        follow_up.asset_id = maintenance.asset_id
+        follow_up.maintenance_type = maintenance.maintenance_type
+        follow_up.scheduled_date = when
+        follow_up.description = maintenance.description
+        follow_up.service_provider = maintenance.service_provider
+        follow_up.created_by = user_id
+        db.session.add(follow_up)
+    return when
+
+
+def due_in_window(start, end, statuses=('Scheduled',), asset_id=None, category=None):
+    """Query of maintenance due between start and end, soonest first"""
+    query = AssetMaintenance.query.filter(AssetMaintenance.status.in_(statuses),
+                                          AssetMaintenance.scheduled_date.between(start, end))
+    if asset_id:
+        query = query.filter(AssetMaintenance.asset_id == asset_id)
+    if category:
+        query = query.join(Asset, Asset.id == AssetMaintenance.asset_id).filter(Asset.category == category)
+    return query.order_by(AssetMaintenance.scheduled_date, AssetMaintenance.id)
+
+
+if __name__ == '__main__':
+    from app import app
+
+    parser = argparse.ArgumentParser(description='Materialize recurring maintenance over a rolling horizon')
+    parser.add_argument('--horizon-days', type=int, default=DEFAULT_HORIZON_DAYS)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    with app.app_context():
+        plans, created = materialize(horizon_days=args.horizon_days, batch_size=args.batch_size)
+    print(f"Materialized {plans} plan(s): {created} maintenance occurrence(s) created")
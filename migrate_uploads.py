@@ -0,0 +1,103 @@
+"""
+Move uploads from the old flat UPLOAD_FOLDER into the sharded blob store.
+
+Rows in uploaded_file and bill that have no content_hash yet are processed in
+id order, batch by batch. Each file is linked into uploads/blobs/<aa>/<bb>/,
+the row's file_path / bill_file_path and content_hash are updated, the batch
+is committed and only then are the original flat files removed. Re-running
+the script is safe; finished rows are skipped.
+
+The filename columns are left as they are so existing links keep working
+(see blob_store.resolve_upload).
+
+Usage:
+    python migrate_uploads.py
+    python migrate_uploads.py --batch-size 200 --dry-run
+"""
+
+import argparse
+import os
+
+from app import app, db
+from models import UploadedFile, Bill
+from blob_store import blob_root, store_file
+
+
+def locate(stored_path, filename):
+    """Find a legacy upload on disk; stored paths may come from another host"""
+    if stored_path and os.path.isfile(stored_path):
+        return stored_path
+    if filename:
+        candidate = os.path.join(app.config['UPLOAD_FOLDER'], os.path.basename(filename))
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def migrate_model(model, path_attr, name_attr, batch_size, dry_run):
+    """Migrate one table; returns (moved, missing)"""
+    moved = missing = 0
+    last_id = 0
+    root = blob_root()
+
+    while True:
+        rows = (model.query
+                .filter(model.id > last_id, model.content_hash.is_(None),
+                        getattr(model, name_attr).isnot(None))
+                .order_by(model.id)
+                .limit(batch_size)
+                .all())
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        originals = set()
+        for row in rows:
+            source = locate(getattr(row, path_attr), getattr(row, name_attr))
+            if source is None:
+                missing += 1
+                print(f"  {model.__tablename__} #{row.id}: file not found ({getattr(row, name_attr)})")
+                continue
+            moved += 1
+            if dry_run:
+                continue
+
+            stored = store_file(source)
+            setattr(row, path_attr, stored.path)
+            row.content_hash = stored.sha256
+            if not os.path.abspath(source).startswith(os.path.abspath(root) + os.sep):
+                originals.add(source)
+
+        if dry_run:
+            db.session.rollback()
+            continue
+
+        if not db.session.dirty:
+            continue
+        db.session.commit()
+        for path in originals:
+            try:
+                os.unlink(path)
+            except OSError as e:
+                print(f"  Could not remove {path}: {e}")
+        print(f"  {model.__tablename__}: migrated up to id {last_id}")
+
+    return moved, missing
+
+
+def migrate_uploads(batch_size=500, dry_run=False):
+    with app.app_context():
+        os.makedirs(blob_root(), exist_ok=True)
+        for model, path_attr, name_attr in ((UploadedFile, 'file_path', 'filename'),
+                                            (Bill, 'bill_file_path', 'bill_filename')):
+            moved, missing = migrate_model(model, path_attr, name_attr, batch_size, dry_run)
+            verb = 'would move' if dry_run else 'moved'
+            print(f"{model.__tablename__}: {verb} {moved} file(s), {missing} missing")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move flat uploads into the sharded blob store')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+    migrate_uploads(batch_size=args.batch_size, dry_run=args.dry_run)
@@ -3,9 +3,25 @@ import json
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_sqlalchemy import SQLAlchemy
+from db_routing import RoutingSession
 #
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+def insert_ignoring_duplicates(model):
+    """INSERT for model that skips rows hitting a unique index (SQLite / PostgreSQL)"""
+    from sqlalchemy import insert
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return insert(model)
+    return dialect_insert(model).on_conflict_do_nothing()
+
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -18,6 +34,7 @@ class User(db.Model):
     department = db.Column(db.String(100))  
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
+    authz_version = db.Column(db.Integer, default=0)  # Bumped when role/floor/is_active change
 
     requests = db.relationship('AssetRequest', foreign_keys='AssetRequest.user_id', backref='requester', lazy=True)
 
@@ -46,10 +63,14 @@ class AssetRequest(db.Model):
     # Item classification for PO generation
     item_classification = db.Column(db.String(20))  # 'Regular' or 'Specific' - set by SCM
 
-    status = db.Column(db.String(20), default='Pending') 
+    status = db.Column(db.String(20), default='Pending', index=True)
     current_approval_level = db.Column(db.Integer, default=1)
     floor = db.Column(db.String(50))  
 
+    # Approver queue, kept in sync by approval_policy.py: who must act next
+    next_approver_role = db.Column(db.String(50))
+    next_approver_floor = db.Column(db.String(50))  # Only set for floor-scoped approvers
+
     fulfilled_from_asset_id = db.Column(db.Integer, db.ForeignKey('asset.id'))
     fulfilled_quantity = db.Column(db.Integer, default=0)
     fulfilled_by = db.Column(db.Integer, db.ForeignKey('user.id'))
@@ -66,9 +87,32 @@ class AssetRequest(db.Model):
     fulfilled_from_asset = db.relationship('Asset', foreign_keys=[fulfilled_from_asset_id])
     fulfilled_by_user = db.relationship('User', foreign_keys=[fulfilled_by])
 
+    __table_args__ = (
+        # Approver queues (approval_policy.py), oldest first as the dashboard lists them
+        db.Index('ix_asset_request_approver_queue', 'next_approver_role', 'next_approver_floor', 'status',
+                 'created_at'),
+        # Status counts (overall and per floor) and the pending queue in created order
+        db.Index('ix_asset_request_status_floor', 'status', 'floor', 'created_at'),
+        # Request lists, newest first: per floor, per requester and for everyone
+        db.Index('ix_asset_request_floor_created', 'floor', 'created_at'),
+        db.Index('ix_asset_request_user_created', 'user_id', 'created_at'),
+        db.Index('ix_asset_request_created', 'created_at'),
+    )
+
     def __repr__(self):
         return f'<AssetRequest {self.item_name}>'
 
+class StoredBlob(db.Model):
+    """One row per unique uploaded file content, keyed by its SHA-256"""
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.Integer, nullable=False)
+    mime_type = db.Column(db.String(100))
+    ref_count = db.Column(db.Integer, default=0, nullable=False)  # UploadedFile/Bill rows using it
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<StoredBlob {self.sha256[:12]} refs={self.ref_count}>'
+
 class UploadedFile(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
@@ -76,11 +120,17 @@ class UploadedFile(db.Model):
     file_path = db.Column(db.String(500), nullable=False)
     file_size = db.Column(db.Integer)
     mime_type = db.Column(db.String(100))
+    content_hash = db.Column(db.String(64), db.ForeignKey('stored_blob.sha256'))  # See blob_store.py
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     request_id = db.Column(db.Integer, db.ForeignKey('asset_request.id'), nullable=True)
     po_id = db.Column(db.Integer, db.ForeignKey('purchase_order.id'), nullable=True)
 
+    __table_args__ = (
+        # /uploads/<filename> lookups, newest first (blob_store.py)
+        db.Index('ix_uploaded_file_filename', 'filename', 'id'),
+    )
+
     def __repr__(self):
         return f'<UploadedFile {self.original_filename}>'
 
@@ -112,6 +162,10 @@ class ActivityLog(db.Model):
     user = db.relationship('User', backref='activities')
     request = db.relationship('AssetRequest', backref='activities')
 
+    __table_args__ = (
+        db.Index('ix_activity_log_timestamp', 'timestamp'),
+    )
+
     def __repr__(self):
         return f'<ActivityLog {self.action} by {self.user.username}>'
 
@@ -131,7 +185,7 @@ class Asset(db.Model):
     location = db.Column(db.String(200))
     assigned_to = db.Column(db.Integer, db.ForeignKey('user.id'))
     status = db.Column(db.String(50), default='Available')  
-    warranty_expiry = db.Column(db.Date)
+    warranty_expiry = db.Column(db.Date, index=True)
     notes = db.Column(db.Text)
 
     # Inventory fields for consumable assets
@@ -144,6 +198,10 @@ class Asset(db.Model):
 
     assigned_user = db.relationship('User', backref='assigned_assets')
 
+    __table_args__ = (
+        db.Index('ix_asset_status_created', 'status', 'created_at'),
+    )
+
     @property
     def is_below_threshold(self):
         """Check if consumable asset is below minimum threshold"""
@@ -162,6 +220,8 @@ class Bill(db.Model):
     description = db.Column(db.Text)
     bill_file_path = db.Column(db.String(500))  # Path to uploaded bill file
     bill_filename = db.Column(db.String(255))
+    original_filename = db.Column(db.String(255))  # Name the bill file was uploaded under
+    content_hash = db.Column(db.String(64), db.ForeignKey('stored_blob.sha256'))  # See blob_store.py
     status = db.Column(db.String(50), default='Pending')  # Pending, Verified, Rejected
     verification_comments = db.Column(db.Text)
 
@@ -178,6 +238,12 @@ class Bill(db.Model):
     uploader = db.relationship('User', foreign_keys=[uploaded_by], backref='uploaded_bills')
     verifier = db.relationship('User', foreign_keys=[verified_by], backref='verified_bills')
 
+    __table_args__ = (
+        db.Index('ix_bill_status_created', 'status', 'created_at'),
+        # /uploads/<filename> lookups, newest first (blob_store.py)
+        db.Index('ix_bill_filename', 'bill_filename', 'id'),
+    )
+
     def __repr__(self):
         return f'<Bill {self.bill_number} - {self.vendor_name}>'
 
@@ -220,6 +286,13 @@ class ItemAssignment(db.Model):
     assigner = db.relationship('User', foreign_keys=[assigned_by], backref='assignments_made')
     assignee = db.relationship('User', foreign_keys=[assigned_to], backref='assignments_received')
 
+    __table_args__ = (
+        # Assignment lists, newest first: by delivery status, per vendor and for everyone
+        db.Index('ix_item_assignment_status_created', 'delivery_status', 'created_at'),
+        db.Index('ix_item_assignment_vendor_created', 'vendor_id', 'created_at'),
+        db.Index('ix_item_assignment_created', 'created_at'),
+    )
+
     def __repr__(self):
         return f'<ItemAssignment {self.item_name} to {self.assignee.full_name}>'
 
@@ -255,6 +328,14 @@ class AssetMaintenance(db.Model):
     updated_by = db.Column(db.Integer, db.ForeignKey('user.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    plan_id = db.Column(db.Integer, db.ForeignKey('maintenance_plan.id'))  # Set when generated by a MaintenancePlan
+
+    __table_args__ = (
+        db.Index('ix_asset_maintenance_due', 'status', 'scheduled_date'),
+        db.Index('ix_asset_maintenance_status_created', 'status', 'created_at'),
+        # One generated occurrence per plan, asset and date
+        db.Index('uq_asset_maintenance_occurrence', 'plan_id', 'asset_id', 'scheduled_date', unique=True),
+    )
 
     asset = db.relationship('Asset', backref='maintenance_records')
     creator = db.relationship('User', foreign_keys=[created_by], backref='created_maintenances')
@@ -263,6 +344,33 @@ class AssetMaintenance(db.Model):
     def __repr__(self):
         return f'<AssetMaintenance {self.asset.asset_tag} - {self.maintenance_type}>'
 
+class MaintenancePlan(db.Model):
+    """Recurring maintenance for one asset or every asset in a category (see maintenance_planner.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    asset_id = db.Column(db.Integer, db.ForeignKey('asset.id'))
+    category = db.Column(db.String(100))
+    maintenance_type = db.Column(db.String(50), default='Preventive')
+    description = db.Column(db.Text, nullable=False)
+    interval_months = db.Column(db.Integer, nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    service_provider = db.Column(db.String(200))
+    is_active = db.Column(db.Boolean, default=True)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    asset = db.relationship('Asset', backref='maintenance_plans')
+    creator = db.relationship('User', backref='created_maintenance_plans')
+    occurrences = db.relationship('AssetMaintenance', backref='plan', lazy='dynamic')
+
+    @property
+    def target(self):
+        return self.asset.asset_tag if self.asset else f'Category: {self.category}'
+
+    def __repr__(self):
+        return f'<MaintenancePlan {self.name} every {self.interval_months} month(s)>'
+
 class AssetDepreciation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     asset_id = db.Column(db.Integer, db.ForeignKey('asset.id'), nullable=False)
@@ -280,23 +388,26 @@ class AssetDepreciation(db.Model):
     asset = db.relationship('Asset', backref='depreciation_record', uselist=False)
 
     def calculate_current_depreciation(self):
-        """Calculate current depreciation based on time elapsed"""
+        """Calculate current depreciation based on time elapsed
+
+        Single-record version of depreciation.py; use run_depreciation() or
+        current_valuations() for many assets.
+        """
         from datetime import date
-        from dateutil.relativedelta import relativedelta
+        from depreciation import accumulated_depreciation, months_between
 
         if not self.depreciation_start_date:
             return 0
 
-        today = date.today()
-        months_elapsed = relativedelta(today, self.depreciation_start_date).years * 12 + relativedelta(today, self.depreciation_start_date).months
-
-        total_depreciation = (months_elapsed / 12) * self.annual_depreciation
-        return min(total_depreciation, self.asset.purchase_cost - self.salvage_value)
+        months_elapsed = months_between(self.depreciation_start_date, date.today())
+        return accumulated_depreciation(self.asset.purchase_cost or 0, self.salvage_value or 0,
+                                        self.annual_depreciation or 0, self.useful_life_years or 0,
+                                        self.depreciation_method, months_elapsed)
 
     def update_book_value(self):
         """Update book value based on current depreciation"""
         self.accumulated_depreciation = self.calculate_current_depreciation()
-        self.book_value = self.asset.purchase_cost - self.accumulated_depreciation
+        self.book_value = (self.asset.purchase_cost or 0) - self.accumulated_depreciation
         self.last_calculated_date = datetime.utcnow().date()
 
     def __repr__(self):
@@ -312,6 +423,12 @@ class WarrantyAlert(db.Model):
     acknowledged_by = db.Column(db.Integer, db.ForeignKey('user.id'))
     acknowledged_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    threshold_days = db.Column(db.Integer)  # 90/30/7 for generated alerts, see warranty_alerts.py
+
+    # One generated alert per asset, expiry date and threshold
+    __table_args__ = (
+        db.Index('uq_warranty_alert_threshold', 'asset_id', 'alert_type', 'alert_date', 'threshold_days', unique=True),
+    )
 
     asset = db.relationship('Asset', backref='warranty_alerts')
     acknowledger = db.relationship('User', backref='acknowledged_alerts')
@@ -319,6 +436,27 @@ class WarrantyAlert(db.Model):
     def __repr__(self):
         return f'<WarrantyAlert {self.asset.asset_tag} - {self.alert_type}>'
 
+class StockAlert(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    asset_id = db.Column(db.Integer, db.ForeignKey('asset.id'), nullable=False)
+    alert_type = db.Column(db.String(50), nullable=False)  # Low Stock, Limit Exceeded (see stock_alerts.py)
+    quantity = db.Column(db.Integer)  # asset's current quantity while the alert is active
+    threshold = db.Column(db.Integer)  # minimum threshold or maximum limit that was crossed
+    message = db.Column(db.Text, nullable=False)
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    resolved_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_stock_alert_active', 'is_active', 'alert_type'),
+        db.Index('ix_stock_alert_asset', 'asset_id', 'alert_type'),
+    )
+
+    asset = db.relationship('Asset', backref='stock_alerts')
+
+    def __repr__(self):
+        return f'<StockAlert {self.asset_id} - {self.alert_type}>'
+
 class ProcurementQuotation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     request_id = db.Column(db.Integer, db.ForeignKey('asset_request.id'), nullable=False)
@@ -348,6 +486,12 @@ class ProcurementQuotation(db.Model):
     submitter = db.relationship('User', foreign_keys=[submitted_by], backref='submitted_quotations')
     evaluator = db.relationship('User', foreign_keys=[evaluated_by], backref='evaluated_quotations')
 
+    __table_args__ = (
+        # Per-request comparison (quotation_scoring.py) and the quotation list
+        db.Index('ix_procurement_quotation_request', 'request_id'),
+        db.Index('ix_procurement_quotation_status_created', 'status', 'created_at'),
+    )
+
     @property
     def cost_per_unit(self):
         return self.total_cost / self.quoted_quantity if self.quoted_quantity > 0 else 0
@@ -416,6 +560,11 @@ class PurchaseOrder(db.Model):
     md_approver = db.relationship('User', foreign_keys=[approved_by_md], backref='approved_pos')
     uploaded_files = db.relationship('UploadedFile', backref='purchase_order', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_purchase_order_status_created', 'status', 'created_at'),
+        db.Index('ix_purchase_order_vendor_created', 'vendor_id', 'created_at'),
+    )
+
     def generate_po_number(self):
         """Generate unique PO number"""
         from datetime import datetime
@@ -441,9 +590,28 @@ class PurchaseOrder(db.Model):
     def __repr__(self):
         return f'<PurchaseOrder {self.po_number} - {self.vendor_name}>'
 
+class VendorScorecard(db.Model):
+    """Per-vendor aggregates, kept current on commit by vendor_scorecard.py"""
+    vendor_id = db.Column(db.Integer, db.ForeignKey('vendor.id'), primary_key=True)
+    assignment_count = db.Column(db.Integer, nullable=False, default=0)
+    delivered_count = db.Column(db.Integer, nullable=False, default=0)  # with expected and actual dates
+    on_time_count = db.Column(db.Integer, nullable=False, default=0)
+    on_time_rate = db.Column(db.Float, index=True)  # percent of delivered; None until one is delivered
+    po_count = db.Column(db.Integer, nullable=False, default=0, index=True)  # excluding cancelled
+    po_spend = db.Column(db.Float, nullable=False, default=0, index=True)  # sum of grand_total
+    quotation_count = db.Column(db.Integer, nullable=False, default=0)
+    quotation_unit_price_total = db.Column(db.Float, nullable=False, default=0)
+    avg_quotation_price = db.Column(db.Float, index=True)  # mean cost_per_unit
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    vendor = db.relationship('Vendor', backref=db.backref('scorecard', uselist=False))
+
+    def __repr__(self):
+        return f'<VendorScorecard {self.vendor_id}>'
+
 class AssetLimit(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    asset_id = db.Column(db.Integer, db.ForeignKey('asset.id'), nullable=False)
+    asset_id = db.Column(db.Integer, db.ForeignKey('asset.id'), nullable=False, index=True)
     max_quantity = db.Column(db.Integer, nullable=False)
     alert_enabled = db.Column(db.Boolean, default=True)
     notes = db.Column(db.Text)
@@ -466,4 +634,13 @@ class AssetLimit(db.Model):
         return self.asset.current_quantity == self.max_quantity
 
     def __repr__(self):
-        return f'<AssetLimit {self.asset.asset_tag} - Max: {self.max_quantity}>'
\ No newline at end of file
+        return f'<AssetLimit {self.asset.asset_tag} - Max: {self.max_quantity}>'
+
+class SchemaVersion(db.Model):
+    """Migrations applied to this database, written by schema_migrations.py"""
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SchemaVersion {self.version}>'
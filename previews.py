@@ -0,0 +1,162 @@
+"""
+Thumbnail previews for uploaded bills, quotations and vendor documents.
+
+After an upload is stored, a small PNG (first page of a PDF, or a downscaled
+image) is rendered on a background thread pool and cached on disk under
+UPLOAD_FOLDER/previews/<aa>/<sha256>.png. Previews are keyed by content hash,
+so a file uploaded many times is rendered once.
+
+A preview requested while it is still rendering gets a transparent
+placeholder at once, served uncached, so the <img> stays in place (its
+onerror handler only hides files that cannot be previewed) and the real
+thumbnail shows on the next page view. A render that fails leaves a
+<sha256>.failed marker next to the preview; the file is then answered with
+404 instead of being rendered again on every view.
+
+Rendering needs Pillow for images and PyMuPDF for PDFs. Both are optional;
+without them previews are simply not offered and review pages fall back to
+the plain download links.
+"""
+
+import base64
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, request
+from werkzeug.utils import send_file
+
+from app import app
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+PREVIEW_DIR = 'previews'
+IMAGE_TYPES = {'image/png', 'image/jpeg', 'image/gif'}
+FAILED_SUFFIX = '.failed'
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()
+
+# 1x1 transparent PNG served while a preview is still rendering
+PLACEHOLDER_PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAAC0lEQVR4nGNgAAIAAAUAAXpeqz8AAAAASUVORK5CYII=')
+
+
+def can_preview(mime_type):
+    if mime_type == 'application/pdf':
+        return fitz is not None
+    return mime_type in IMAGE_TYPES and Image is not None
+
+
+def preview_path(sha256):
+    return os.path.join(app.config['UPLOAD_FOLDER'], PREVIEW_DIR, sha256[:2], sha256 + '.png')
+
+
+def failure_marker_path(sha256):
+    return os.path.join(app.config['UPLOAD_FOLDER'], PREVIEW_DIR, sha256[:2], sha256 + FAILED_SUFFIX)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        # Created lazily so gunicorn workers do not inherit threads from the master
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=app.config['PREVIEW_WORKERS'],
+                                           thread_name_prefix='preview')
+        return _executor
+
+
+def render_preview(source_path, mime_type, dest_path, max_px):
+    """Write a PNG thumbnail of source_path to dest_path"""
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.preview-', suffix='.png', dir=os.path.dirname(dest_path))
+    os.close(fd)
+    try:
+        if mime_type == 'application/pdf':
+            with fitz.open(source_path) as document:
+                page = document[0]
+                zoom = max_px / max(page.rect.width, page.rect.height)
+                page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False).save(tmp_path)
+        else:
+            with Image.open(source_path) as image:
+                image.seek(0)
+                image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+                image.thumbnail((max_px, max_px))
+                image.save(tmp_path, 'PNG', optimize=True)
+        os.replace(tmp_path, dest_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def _run(sha256, source_path, mime_type, dest_path, max_px):
+    try:
+        render_preview(source_path, mime_type, dest_path, max_px)
+    except Exception as e:
+        logging.warning(f"Preview generation failed for {sha256[:12]}: {e}")
+        marker_path = failure_marker_path(sha256)
+        try:
+            os.makedirs(os.path.dirname(marker_path), exist_ok=True)
+            with open(marker_path, 'w') as marker:
+                marker.write(f'{e}\n')
+        except OSError as marker_error:
+            logging.warning(f"Could not record the failed preview for {sha256[:12]}: {marker_error}")
+    finally:
+        with _executor_lock:
+            _pending.discard(sha256)
+
+
+def schedule_preview(sha256, source_path, mime_type):
+    """Queue a preview for a stored blob unless it exists or is already queued"""
+    if not sha256 or not can_preview(mime_type):
+        return False
+    dest_path = preview_path(sha256)
+    if os.path.exists(dest_path):
+        return True
+    if os.path.exists(failure_marker_path(sha256)):
+        return False
+
+    with _executor_lock:
+        if sha256 in _pending:
+            return True
+        _pending.add(sha256)
+    _get_executor().submit(_run, sha256, source_path, mime_type, dest_path, app.config['PREVIEW_MAX_PX'])
+    return True
+
+
+def _send_preview(sha256, path):
+    from file_serving import apply_cache_policy
+
+    response = send_file(path, request.environ, mimetype='image/png', conditional=True,
+                         etag=f'{sha256}-preview', response_class=current_app.response_class)
+    return apply_cache_policy(response, immutable=True)
+
+
+def preview_response(sha256, source_path, mime_type):
+    """Serve the cached preview, or the placeholder while it renders
+
+    Returns 404 when the file cannot be previewed (unsupported type, or a
+    failed render) so <img onerror> handlers can hide the thumbnail.
+    """
+    path = preview_path(sha256) if sha256 else None
+    if path and os.path.exists(path):
+        return _send_preview(sha256, path)
+
+    if not (source_path and os.path.isfile(source_path) and schedule_preview(sha256, source_path, mime_type)):
+        return current_app.response_class(status=404)
+
+    response = current_app.response_class(PLACEHOLDER_PNG, mimetype='image/png')
+    response.headers['Retry-After'] = '2'
+    response.cache_control.no_store = True
+    return response
@@ -0,0 +1,265 @@
+"""
+Quotation comparison and scoring.
+
+The quotations for one or many requests are loaded in one query and each is
+scored against the other quotations for the same request:
+
+- price: landed cost per unit (total_cost, which includes additional_costs,
+  over quoted_quantity); the cheapest scores 1, the others cheapest / own;
+- delivery: days parsed from delivery_timeline ("7-10 business days",
+  "2 weeks", "ex-stock"); the fastest scores 1 and the slowest 0;
+- payment: days of credit parsed from payment_terms ("Net 45", "30 days",
+  "100% advance" = 0); the longest credit scores 1 and the shortest 0;
+- validity: validity_period in days; the longest scores 1, the others own / longest.
+
+Delivery and payment are scaled over the range of the request's quotations
+rather than as a ratio to the best, since a ratio to 0 days (ex-stock,
+advance payment) would push every other quotation close to 0. When all of a
+request's quotations agree on a factor, they all score 1 on it.
+
+Terms that cannot be parsed score a neutral 0.5. evaluation_score is the
+weighted sum of the four on a 0-100 scale. With numpy installed the
+per-request bests and the scores are computed as arrays over every
+quotation at once; otherwise the same arithmetic runs in plain Python.
+"""
+
+import argparse
+import re
+
+from sqlalchemy import bindparam, select, update
+
+from models import db, ProcurementQuotation, Vendor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+RATIO, RANGE = 'ratio', 'range'
+
+# name -> (weight, lower is better, scaling: RATIO to the best or RANGE between best and worst)
+FACTORS = {
+    'price': (0.5, True, RATIO),
+    'delivery': (0.2, True, RANGE),
+    'payment': (0.15, False, RANGE),
+    'validity': (0.15, False, RATIO),
+}
+NEUTRAL = 0.5
+IN_CHUNK = 500
+
+_NUMBER = re.compile(r'\d+(?:\.\d+)?')
+_UNIT_DAYS = (('business day', 7 / 5), ('working day', 7 / 5), ('week', 7), ('month', 30), ('day', 1))
+_IMMEDIATE = re.compile(r'\b(immediate|immediately|ex[- ]?stock|same day|in stock)\b')
+_UPFRONT = re.compile(r'\b(advance|prepaid|upfront|cod|cash on delivery|on delivery|against delivery)\b')
+
+COLUMNS = (ProcurementQuotation.id, ProcurementQuotation.request_id, ProcurementQuotation.vendor_id,
+           Vendor.vendor_name, ProcurementQuotation.quotation_number, ProcurementQuotation.status,
+           ProcurementQuotation.quoted_price, ProcurementQuotation.quoted_quantity,
+           ProcurementQuotation.additional_costs, ProcurementQuotation.total_cost,
+           ProcurementQuotation.delivery_timeline, ProcurementQuotation.payment_terms,
+           ProcurementQuotation.validity_period, ProcurementQuotation.warranty_period,
+           ProcurementQuotation.evaluation_score)
+
+
+def _days(text):
+    numbers = _NUMBER.findall(text)
+    if not numbers:
+        return None
+    days = max(float(number) for number in numbers)  # upper end of a range
+    for unit, factor in _UNIT_DAYS:
+        if unit in text:
+            return days * factor
+    return days
+
+
+def delivery_days(timeline):
+    """Days until delivery from free text, or None"""
+    if not timeline:
+        return None
+    text = timeline.lower()
+    if _IMMEDIATE.search(text):
+        return 0.0
+    return _days(text)
+
+
+def payment_days(terms):
+    """Days of credit from free text (0 for advance / on delivery), or None"""
+    if not terms:
+        return None
+    text = terms.lower()
+    if _UPFRONT.search(text):
+        return 0.0
+    return _days(text)
+
+
+def unit_cost(row):
+    """Landed cost per unit, as ProcurementQuotation.cost_per_unit"""
+    return row.total_cost / row.quoted_quantity if row.quoted_quantity and row.quoted_quantity > 0 else None
+
+
+def _factor_scores(groups, values, lower, scaling):
+    low, high = {}, {}
+    for group, value in zip(groups, values):
+        if value is not None:
+            low[group] = min(low.get(group, value), value)
+            high[group] = max(high.get(group, value), value)
+    scores = []
+    for group, value in zip(groups, values):
+        if value is None:
+            scores.append(NEUTRAL)
+            continue
+        best, worst = (low[group], high[group]) if lower else (high[group], low[group])
+        if scaling == RANGE:
+            scores.append(abs(value - worst) / abs(best - worst) if best != worst else 1.0)
+        else:
+            numerator, denominator = (best, value) if lower else (value, best)
+            scores.append(numerator / denominator if denominator > 0 else 1.0)
+    return scores
+
+
+def _factor_scores_array(inverse, group_count, values, lower, scaling):
+    values = np.array(values, dtype=float)  # None -> nan
+    known = ~np.isnan(values)
+    low, high = np.full(group_count, np.inf), np.full(group_count, -np.inf)
+    np.minimum.at(low, inverse[known], values[known])
+    np.maximum.at(high, inverse[known], values[known])
+    best, worst = (low[inverse], high[inverse]) if lower else (high[inverse], low[inverse])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if scaling == RANGE:
+            scores = np.where(best != worst, np.abs(values - worst) / np.abs(best - worst), 1.0)
+        else:
+            numerator, denominator = (best, values) if lower else (values, best)
+            scores = np.where(denominator > 0, numerator / denominator, 1.0)
+    return np.where(known, scores, NEUTRAL)
+
+
+def score(groups, factor_values):
+    """Scores for quotations grouped by request
+
+    factor_values maps each FACTORS name to one value (or None) per
+    quotation. Returns ({name: [0-1 per quotation]}, [0-100 per quotation]).
+    """
+    if not groups:
+        return {name: [] for name in FACTORS}, []
+    if np is not None:
+        _, inverse = np.unique(np.asarray(groups), return_inverse=True)
+        inverse = inverse.ravel()
+        group_count = int(inverse.max()) + 1
+        components = {name: _factor_scores_array(inverse, group_count, factor_values[name], lower, scaling)
+                      for name, (_, lower, scaling) in FACTORS.items()}
+        total = sum(weight * components[name] for name, (weight, _, _) in FACTORS.items())
+        return ({name: np.round(values, 3).tolist() for name, values in components.items()},
+                np.round(total * 100, 1).tolist())
+
+    components = {name: _factor_scores(groups, factor_values[name], lower, scaling)
+                  for name, (_, lower, scaling) in FACTORS.items()}
+    totals = [round(100 * sum(FACTORS[name][0] * components[name][i] for name in FACTORS), 1)
+              for i in range(len(groups))]
+    return {name: [round(value, 3) for value in values] for name, values in components.items()}, totals
+
+
+def load(request_ids):
+    """Quotation rows for request_ids, in IN_CHUNK-sized queries"""
+    request_ids = sorted(set(request_ids))
+    rows = []
+    for start in range(0, len(request_ids), IN_CHUNK):
+        rows.extend(db.session.execute(
+            select(*COLUMNS)
+            .join(Vendor, Vendor.id == ProcurementQuotation.vendor_id)
+            .where(ProcurementQuotation.request_id.in_(request_ids[start:start + IN_CHUNK]))
+            .order_by(ProcurementQuotation.request_id, ProcurementQuotation.id)
+        ).all())
+    return rows
+
+
+def compare(request_ids):
+    """{request_id: [quotation dicts, best score first]} with fresh scores"""
+    rows = load(request_ids)
+    factor_values = {
+        'price': [unit_cost(row) for row in rows],
+        'delivery': [delivery_days(row.delivery_timeline) for row in rows],
+        'payment': [payment_days(row.payment_terms) for row in rows],
+        'validity': [row.validity_period for row in rows],
+    }
+    components, totals = score([row.request_id for row in rows], factor_values)
+
+    comparison = {request_id: [] for request_id in request_ids}
+    for i, row in enumerate(rows):
+        comparison[row.request_id].append({
+            'id': row.id,
+            'quotation_number': row.quotation_number,
+            'vendor_id': row.vendor_id,
+            'vendor_name': row.vendor_name,
+            'status': row.status,
+            'quoted_price': row.quoted_price,
+            'quoted_quantity': row.quoted_quantity,
+            'additional_costs': row.additional_costs or 0,
+            'total_cost': row.total_cost,
+            'unit_cost': round(factor_values['price'][i], 2) if factor_values['price'][i] is not None else None,
+            'delivery_timeline': row.delivery_timeline,
+            'delivery_days': factor_values['delivery'][i],
+            'payment_terms': row.payment_terms,
+            'payment_days': factor_values['payment'][i],
+            'validity_days': row.validity_period,
+            'warranty_period': row.warranty_period,
+            'scores': {name: components[name][i] for name in FACTORS},
+            'score': totals[i],
+            'stored_score': row.evaluation_score,
+        })
+    for quotations in comparison.values():
+        quotations.sort(key=lambda quotation: (-quotation['score'], quotation['unit_cost'] or 0))
+        for rank, quotation in enumerate(quotations, 1):
+            quotation['rank'] = rank
+    return comparison
+
+
+def price_summary(quotations):
+    """Lowest / highest / average total cost and their spread, or None"""
+    costs = [quotation['total_cost'] for quotation in quotations]
+    if not costs:
+        return None
+    return {'min_price': min(costs), 'max_price': max(costs), 'avg_price': sum(costs) / len(costs),
+            'price_variance': max(costs) - min(costs)}
+
+
+def score_requests(request_ids):
+    """Recompute and store evaluation_score for request_ids (caller commits); returns compare()"""
+    comparison = compare(request_ids)
+    changed = [{'quotation_id': quotation['id'], 'new_score': quotation['score']}
+               for quotations in comparison.values() for quotation in quotations
+               if quotation['stored_score'] != quotation['score']]
+    if changed:
+        table = ProcurementQuotation.__table__
+        db.session.execute(
+            update(table).where(table.c.id == bindparam('quotation_id')).values(evaluation_score=bindparam('new_score')),
+            changed)
+    return comparison
+
+
+def rescore_all(batch_size=IN_CHUNK):
+    """Score every request with quotations, committing per batch; returns requests scored"""
+    scored = 0
+    last_id = 0
+    while True:
+        request_ids = db.session.execute(
+            select(ProcurementQuotation.request_id).distinct()
+            .where(ProcurementQuotation.request_id > last_id)
+            .order_by(ProcurementQuotation.request_id).limit(batch_size)).scalars().all()
+        if not request_ids:
+            return scored
+        score_requests(request_ids)
+        db.session.commit()
+        scored += len(request_ids)
+        last_id = request_ids[-1]
+
+
+if __name__ == '__main__':
+    from app import app
+
+    parser = argparse.ArgumentParser(description='Recompute evaluation_score for every quotation')
+    parser.add_argument('--batch-size', type=int, default=IN_CHUNK)
+    args = parser.parse_args()
+
+    with app.app_context():
+        scored = rescore_all(batch_size=args.batch_size)
+    print(f"Scored quotations for {scored} request(s)")
@@ -1,20 +1,42 @@
+import logging
 import os
 import uuid
 
 import json
 
 import shutil
+import tempfile
+from types import SimpleNamespace
 from datetime import datetime, date, timedelta
 
 from models import (User, AssetRequest, UploadedFile, Approval, ActivityLog, Asset, Bill, 
-                   InventoryUpdate, Vendor, ItemAssignment, AssetMaintenance, AssetDepreciation, 
-                   WarrantyAlert, ProcurementQuotation, PurchaseOrder, AssetLimit)
+                   InventoryUpdate, Vendor, ItemAssignment, AssetMaintenance, MaintenancePlan, AssetDepreciation, 
+                   WarrantyAlert, ProcurementQuotation, PurchaseOrder, AssetLimit, StoredBlob,
+                   VendorScorecard)
 
-from dateutil.relativedelta import relativedelta
-from flask import render_template, request, redirect, url_for, session, flash, send_from_directory, jsonify
+from flask import (render_template, request, redirect, url_for, session, flash, jsonify, has_request_context,
+                   send_file, stream_with_context)
 from werkzeug.utils import secure_filename
 from sqlalchemy import text, or_, inspect, and_
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload, selectinload
 from app import app, db
+from approval_policy import (apply_decision, can_approve, approvable_requests_query, approvable_request_ids,
+                             pending_approval_count)
+from asset_limits import (STATES as LIMIT_STATES, exceeded_limits_query, limit_counts, limits_query,
+                          unlimited_assets_query)
+from authz import claims_enabled, load_claim, store_claim
+from blob_store import attach_bill_file, save_uploaded_file, upload_limit
+from bulk_approval import BulkActionError, apply_bulk_action, parse_request_ids, summarize
+from file_serving import serve_upload
+from maintenance_planner import (DEFAULT_HORIZON_DAYS as MAINTENANCE_HORIZON_DAYS, due_in_window,
+                                 materialize_plan, schedule_follow_up)
+from previews import preview_response
+from stock_alerts import LIMIT_EXCEEDED, LOW_STOCK, active_alert_counts, active_alerts_query
+from vendor_scorecard import (RANKINGS as SCORECARD_RANKINGS, ranked_query as ranked_scorecards,
+                              to_dict as scorecard_dict)
+from warranty_alerts import ALERT_TYPE as WARRANTY_ALERT_TYPE
+from db_health import connection_metrics, read_only
 
 @app.template_filter('from_json')
 def from_json_filter(value):
@@ -25,11 +47,31 @@ def from_json_filter(value):
         except:
             return []
     return []
+
 from models import (User, AssetRequest, UploadedFile, Approval, ActivityLog, Asset, Bill, 
                    InventoryUpdate, Vendor, ItemAssignment, AssetMaintenance, AssetDepreciation, 
                    WarrantyAlert, ProcurementQuotation)
 
 ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg', 'gif', 'doc', 'docx'}
+DASHBOARD_ALERT_ROWS = 50
+
+@app.context_processor
+def inject_pending_approvals():
+    """Pending-approval count for the nav badge (one indexed COUNT per page)"""
+    if not has_request_context() or 'user_id' not in session:
+        return {}
+    try:
+        if claims_enabled():
+            claim = load_claim(session['user_id'])
+            approver = SimpleNamespace(**claim) if claim else None
+        else:
+            approver = User.query.get(session['user_id'])
+        return {'pending_approval_count': pending_approval_count(approver) if approver else 0}
+    except SQLAlchemyError as e:
+        # The badge is optional, but the session belongs to the view: leave
+        # rolling back (and any pending work) to it
+        logging.warning(f"Pending-approval badge unavailable: {e}", exc_info=True)
+        return {}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -63,8 +105,16 @@ def require_role(roles):
                 flash('Please log in to access this page.', 'warning')
                 return redirect(url_for('login'))
 
-            user = User.query.get(session['user_id'])
-            if not user or user.role not in roles:
+            if claims_enabled():
+                # Decide from the signed session claim; only the user's
+                # authz_version is checked against the database.
+                claim = load_claim(session['user_id'])
+                allowed = claim is not None and claim['is_active'] and claim['role'] in roles
+            else:
+                user = User.query.get(session['user_id'])
+                allowed = user is not None and user.role in roles
+
+            if not allowed:
                 flash('You do not have permission to access this page.', 'danger')
                 return redirect(url_for('dashboard'))
             return f(*args, **kwargs)
@@ -73,49 +123,22 @@ def require_role(roles):
     return decorator
 
 def can_approve_request(user, asset_request):
-    """Check if user can approve/reject a request"""
-    # Users cannot approve their own requests
-    if user.id == asset_request.user_id:
-        return False
-
-    requester = User.query.get(asset_request.user_id)
+    """Check if user can approve/reject a request (see approval_policy.py)"""
+    requester = asset_request.requester
     if not requester:
         return False
-
-    # MD can approve anything at any level
-    if user.role == 'MD':
-        return True
-
-    # Approval flow based on requester's role:
-    if requester.role in ['User', 'Employee']:  # Regular users
-        # User → CM (1) → Admin (2) → SCM (3) → MD (4)
-        if user.role == 'Concern Manager' and asset_request.current_approval_level == 1 and user.floor == asset_request.floor:
-            return True
-        elif user.role == 'Admin' and asset_request.current_approval_level == 2:
-            return True
-        elif user.role == 'Accounts/SCM' and asset_request.current_approval_level == 3:
-            return True
-    elif requester.role == 'Concern Manager':
-        # CM → Admin (1) → SCM (2) → MD (3)
-        if user.role == 'Admin' and asset_request.current_approval_level == 1:
-            return True
-        elif user.role == 'Accounts/SCM' and asset_request.current_approval_level == 2:
-            return True
-    elif requester.role == 'Admin':
-        # Admin → SCM (1) → MD (2)
-        if user.role == 'Accounts/SCM' and asset_request.current_approval_level == 1:
-            return True
-    elif requester.role == 'Accounts/SCM':
-        # SCM → Admin (1) → MD (2)
-        if user.role == 'Admin' and asset_request.current_approval_level == 1:
-            return True
-
-    return False
+    return can_approve(user, asset_request, requester.role)
 
 @app.route('/health')
 def health_check():
     """Health check endpoint that works without database"""
-    return {'status': 'OK', 'message': 'Hexamed Asset Management System is running'}, 200
+    return {
+        'status': 'OK',
+        'message': 'Hexamed Asset Management System is running',
+        'sizing': app.config.get('SIZING_PLAN'),
+        'db_connections': connection_metrics(),
+        'read_replica': 'replica' in app.config.get('SQLALCHEMY_BINDS', {}),
+    }, 200
 
 @app.route('/')
 def index():
@@ -139,6 +162,8 @@ def login():
             session['username'] = user.username
             session['role'] = user.role
             session['full_name'] = user.full_name
+            if claims_enabled():
+                store_claim(user)
 
             log_activity(user.id, 'Login', f'User {username} logged in successfully')
             flash(f'Welcome back, {user.full_name}!', 'success')
@@ -162,6 +187,7 @@ def logout():
     return redirect(url_for('login'))
 
 @app.route('/dashboard')
+@read_only
 @require_login
 def dashboard():
     user = User.query.get(session['user_id'])
@@ -178,63 +204,19 @@ def dashboard():
         # Regular users and concern managers see only their floor
         user_requests = AssetRequest.query.filter_by(user_id=user.id, floor=user.floor).order_by(AssetRequest.created_at.desc()).limit(5).all()
 
-    pending_requests = []
-    if user.role == 'Concern Manager':
-        # CM sees regular user requests at level 1 on their floor
-        pending_requests = AssetRequest.query.join(User, AssetRequest.user_id == User.id).filter(
-            AssetRequest.status == 'Pending', 
-            AssetRequest.current_approval_level == 1, 
-            AssetRequest.floor == user.floor,
-            User.role.in_(['User', 'Employee'])
-        ).limit(5).all()
-    elif user.role == 'Admin':
-        # Admin sees:
-        # - Regular user requests at level 2
-        # - CM requests at level 1
-        # - SCM requests at level 1
-        pending_requests = AssetRequest.query.join(User, AssetRequest.user_id == User.id).filter(
-            AssetRequest.status == 'Pending',
-            or_(
-                and_(AssetRequest.current_approval_level == 2, User.role.in_(['User', 'Employee'])),
-                and_(AssetRequest.current_approval_level == 1, User.role == 'Concern Manager'),
-                and_(AssetRequest.current_approval_level == 1, User.role == 'Accounts/SCM')
-            )
-        ).limit(5).all()
-    elif user.role == 'Accounts/SCM':
-        # SCM sees:
-        # - Regular user requests at level 3
-        # - CM requests at level 2
-        # - Admin requests at level 1
-        pending_requests = AssetRequest.query.join(User, AssetRequest.user_id == User.id).filter(
-            AssetRequest.status == 'Pending',
-            or_(
-                and_(AssetRequest.current_approval_level == 3, User.role.in_(['User', 'Employee'])),
-                and_(AssetRequest.current_approval_level == 2, User.role == 'Concern Manager'),
-                and_(AssetRequest.current_approval_level == 1, User.role == 'Admin')
-            )
-        ).limit(5).all()
-    elif user.role == 'MD':
-        # MD sees all pending requests (can approve anything)
-        pending_requests = AssetRequest.query.filter(
-            AssetRequest.status == 'Pending'
-        ).limit(5).all()
+    # Pending requests waiting on this user, generated from the approval policy
+    pending_requests = approvable_requests_query(user).order_by(AssetRequest.created_at).limit(5).all()
 
-    # Get low stock alerts for consumable assets
-    low_stock_assets = []
-    exceeded_limit_assets = []
+    # Low stock and exceeded limit alerts, raised as inventory changes (stock_alerts.py)
+    low_stock_alerts = []
+    limit_alerts = []
+    alert_counts = {}
     if user.role in ['Admin', 'MD', 'Accounts/SCM']:
-        low_stock_assets = Asset.query.filter(
-            Asset.asset_type == 'Consumable Asset',
-            Asset.current_quantity <= Asset.minimum_threshold
-        ).all()
-        
-        # Get assets that exceed their limits
-        exceeded_limits = AssetLimit.query.filter(
-            AssetLimit.alert_enabled == True
-        ).join(Asset).filter(
-            Asset.current_quantity > AssetLimit.max_quantity
-        ).all()
-        exceeded_limit_assets = [limit.asset for limit in exceeded_limits]
+        alert_counts = active_alert_counts()
+        if alert_counts[LOW_STOCK]:
+            low_stock_alerts = active_alerts_query(LOW_STOCK).limit(DASHBOARD_ALERT_ROWS).all()
+        if alert_counts[LIMIT_EXCEEDED]:
+            limit_alerts = active_alerts_query(LIMIT_EXCEEDED).limit(DASHBOARD_ALERT_ROWS).all()
 
     recent_activities = ActivityLog.query.order_by(ActivityLog.timestamp.desc()).limit(10).all()
 
@@ -280,12 +262,15 @@ def dashboard():
                          user=user, 
                          user_requests=user_requests,
                          pending_requests=pending_requests,
+                         approvable_ids={r.id for r in pending_requests},
                          recent_activities=recent_activities,
                          stats=stats,
-                         low_stock_assets=low_stock_assets,
-                         exceeded_limit_assets=exceeded_limit_assets)
+                         low_stock_alerts=low_stock_alerts,
+                         limit_alerts=limit_alerts,
+                         alert_counts=alert_counts)
 
 @app.route('/request', methods=['GET', 'POST'])
+@upload_limit('request')
 @require_login
 def create_request():
     if request.method == 'POST':
@@ -345,17 +330,7 @@ def create_request():
         uploaded_files = request.files.getlist('files')
         for file in uploaded_files:
             if file and file.filename and allowed_file(file.filename):
-                filename = str(uuid.uuid4()) + '_' + secure_filename(file.filename)
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(file_path)
-
-                uploaded_file = UploadedFile()
-                uploaded_file.filename = filename
-                uploaded_file.original_filename = file.filename
-                uploaded_file.file_path = file_path
-                uploaded_file.file_size = os.path.getsize(file_path)
-                uploaded_file.mime_type = file.content_type
-                uploaded_file.request_id = asset_request.id
+                uploaded_file = save_uploaded_file(file, request_id=asset_request.id)
                 db.session.add(uploaded_file)
 
         db.session.commit()
@@ -371,6 +346,7 @@ def create_request():
     return render_template('request_form.html')
 
 @app.route('/requests')
+@read_only
 @require_login
 def view_requests():
     user = User.query.get(session['user_id'])
@@ -391,7 +367,9 @@ def view_requests():
 
     # Get assets for availability checking (for SCM role)
     assets = Asset.query.all() if user.role == 'Accounts/SCM' else []
-    return render_template('requests.html', requests=requests, user=user, assets=assets)
+    approvable_ids = approvable_request_ids(user, requests.items)
+    return render_template('requests.html', requests=requests, user=user, assets=assets,
+                           approvable_ids=approvable_ids)
 
 @app.route('/approve/<int:request_id>/<action>')
 @require_login
@@ -411,32 +389,7 @@ def approve_request(request_id, action):
     approval.comments = request.args.get('comments', '')
     db.session.add(approval)
 
-    if action == 'Approved':
-        requester = User.query.get(asset_request.user_id)
-
-        # MD can approve at any level - final approval
-        if user.role == 'MD':
-            asset_request.status = 'Approved'
-        else:
-            # Determine max levels based on requester role
-            max_levels = 4  # Default for regular users
-            if requester.role == 'Concern Manager':
-                max_levels = 3  # CM → Admin → SCM → MD
-            elif requester.role == 'Admin':
-                max_levels = 2  # Admin → SCM → MD
-            elif requester.role == 'Accounts/SCM':
-                max_levels = 2  # SCM → Admin → MD
-
-            # Check if we've reached the final level
-            if asset_request.current_approval_level >= max_levels:
-                asset_request.status = 'Approved'
-            else:
-                asset_request.current_approval_level += 1
-                asset_request.status = 'Pending'
-    elif action == 'Rejected':
-        asset_request.status = 'Rejected'
-
-    asset_request.updated_at = datetime.utcnow()
+    apply_decision(user, asset_request, action, asset_request.requester.role)
     db.session.commit()
 
     log_activity(user.id, f'Request {action}', 
@@ -517,6 +470,44 @@ def approve_request(request_id, action):
 
     return redirect(url_for('view_requests'))
 
+@app.route('/approve/bulk', methods=['POST'])
+@require_login
+def bulk_approve_requests():
+    """Approve or reject many requests at once; JSON in -> JSON out, form -> redirect"""
+    user = User.query.get(session['user_id'])
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        raw_ids = data.get('request_ids')
+        action = data.get('action')
+        comments = data.get('comments', '')
+    else:
+        raw_ids = request.form.getlist('request_ids')
+        action = request.form.get('action')
+        comments = request.form.get('comments', '')
+
+    try:
+        results = apply_bulk_action(user, parse_request_ids(raw_ids), action, comments or '',
+                                    ip_address=request.remote_addr)
+    except BulkActionError as e:
+        if request.is_json:
+            return jsonify({'error': str(e)}), 400
+        flash(str(e), 'danger')
+        return redirect(url_for('view_requests'))
+
+    if request.is_json:
+        return jsonify({'results': {str(request_id): entry for request_id, entry in results.items()}})
+
+    counts = summarize(results)
+    done = sum(counts.get(key, 0) for key in ('approved', 'forwarded', 'fulfilled', 'rejected'))
+    skipped = len(results) - done
+    message = f'{action} {done} request(s).'
+    if counts.get('fulfilled'):
+        message += f" {counts['fulfilled']} fulfilled from stock."
+    if skipped:
+        message += f' {skipped} skipped (not pending or not awaiting your approval).'
+    flash(message, 'success' if done else 'warning')
+    return redirect(url_for('view_requests'))
+
 @app.route('/assign-from-asset/<int:request_id>', methods=['GET', 'POST'])
 @require_role(['Accounts/SCM', 'Admin', 'MD'])
 def assign_from_asset(request_id):
@@ -604,6 +595,7 @@ def assign_from_asset(request_id):
     return render_template('assign_from_asset.html', request=asset_request, assets=available_assets)
 
 @app.route('/admin')
+@read_only
 @require_role(['Admin', 'MD'])
 def admin_panel():
     users = User.query.all()
@@ -686,6 +678,7 @@ def toggle_vendor(vendor_id):
     return redirect(url_for('view_vendors'))
 
 @app.route('/activity')
+@read_only
 @require_login
 def activity_log():
     user = User.query.get(session['user_id'])
@@ -698,15 +691,23 @@ def activity_log():
 @app.route('/uploads/<filename>')
 @require_login
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    return serve_upload(filename)
 
 @app.errorhandler(404)
 def not_found(error):
     return render_template('base.html', error='Page not found'), 404
 
+@app.errorhandler(413)
+def upload_too_large(error):
+    db.session.rollback()
+    limit = request.max_content_length or app.config['MAX_CONTENT_LENGTH']
+    flash(f'Upload is too large. The limit for this form is {limit // (1024 * 1024)} MB.', 'danger')
+    return redirect(request.url)
+
 
 
 @app.route('/assets')
+@read_only
 @require_login
 def view_assets():
     page = request.args.get('page', 1, type=int)
@@ -727,7 +728,7 @@ def view_assets():
     elif status:
         query = query.filter_by(status=status)
 
-    assets = query.order_by(Asset.created_at.desc()).paginate(
+    assets = query.options(selectinload(Asset.asset_limits)).order_by(Asset.created_at.desc()).paginate(
         page=page, per_page=15, error_out=False)
 
     categories = db.session.query(Asset.category).distinct().all()
@@ -1007,6 +1008,7 @@ def bulk_upload_vendors():
     return render_template('bulk_upload_vendors.html')
 
 @app.route('/asset/<int:asset_id>')
+@read_only
 @require_login
 def view_asset_detail(asset_id):
     from datetime import date
@@ -1018,9 +1020,23 @@ def view_asset_detail(asset_id):
 @app.route('/download/<filename>')
 @require_login
 def download_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename, as_attachment=True)
+    return serve_upload(filename, as_attachment=True)
+
+@app.route('/preview/<int:file_id>')
+@require_login
+def file_preview(file_id):
+    uploaded = UploadedFile.query.get_or_404(file_id)
+    return preview_response(uploaded.content_hash, uploaded.file_path, uploaded.mime_type)
+
+@app.route('/preview/bill/<int:bill_id>')
+@require_role(['Admin', 'MD', 'Accounts/SCM'])
+def bill_preview(bill_id):
+    bill = Bill.query.get_or_404(bill_id)
+    blob = StoredBlob.query.get(bill.content_hash) if bill.content_hash else None
+    return preview_response(bill.content_hash, bill.bill_file_path, blob.mime_type if blob else None)
 
 @app.route('/bills')
+@read_only
 @require_role(['Admin', 'MD', 'Accounts/SCM'])
 def view_bills():
     page = request.args.get('page', 1, type=int)
@@ -1037,6 +1053,7 @@ def view_bills():
     return render_template('bills.html', bills=bills, selected_status=status, user=user)
 
 @app.route('/bill/upload/<int:request_id>', methods=['GET', 'POST'])
+@upload_limit('bill')
 @require_role(['Accounts/SCM'])
 def upload_bill(request_id):
     asset_request = AssetRequest.query.get_or_404(request_id)
@@ -1058,11 +1075,7 @@ def upload_bill(request_id):
         # Handle file upload
         bill_file = request.files.get('bill_file')
         if bill_file and bill_file.filename and allowed_file(bill_file.filename):
-            filename = str(uuid.uuid4()) + '_' + secure_filename(bill_file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            bill_file.save(file_path)
-            bill.bill_file_path = file_path
-            bill.bill_filename = filename
+            attach_bill_file(bill, bill_file)
 
         db.session.add(bill)
         db.session.commit()
@@ -1076,6 +1089,7 @@ def upload_bill(request_id):
     return render_template('upload_bill.html', request=asset_request)
 
 @app.route('/scm/upload-bill', methods=['GET', 'POST'])
+@upload_limit('bill')
 @require_role(['Accounts/SCM'])
 def scm_upload_bill():
     if request.method == 'POST':
@@ -1104,11 +1118,7 @@ def scm_upload_bill():
         # Handle file upload
         bill_file = request.files.get('bill_file')
         if bill_file and bill_file.filename and allowed_file(bill_file.filename):
-            filename = str(uuid.uuid4()) + '_' + secure_filename(bill_file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            bill_file.save(file_path)
-            bill.bill_file_path = file_path
-            bill.bill_filename = filename
+            attach_bill_file(bill, bill_file)
 
         db.session.add(bill)
         db.session.commit()
@@ -1287,6 +1297,7 @@ def fulfill_request(request_id):
     return render_template('fulfill_request.html', request=asset_request, assets=available_assets)
 
 @app.route('/download/requests')
+@read_only
 @require_login
 def download_requests():
     import csv
@@ -1326,6 +1337,7 @@ def download_requests():
     return response
 
 @app.route('/download/assets')
+@read_only
 @require_login
 def download_assets():
     import csv
@@ -1361,6 +1373,7 @@ def download_assets():
     return response
 
 @app.route('/download/bills')
+@read_only
 @require_role(['Admin', 'MD', 'Accounts/SCM'])
 def download_bills():
     import csv
@@ -1394,6 +1407,7 @@ def download_bills():
     return response
 
 @app.route('/download/assignments')
+@read_only
 @require_role(['Admin', 'MD', 'Accounts/SCM'])
 def download_assignments():
     format_type = request.args.get('format', 'csv')
@@ -1516,6 +1530,7 @@ def download_assignments():
     return response
 
 @app.route('/assignment/<int:assignment_id>')
+@read_only
 @require_login
 def view_assignment_detail(assignment_id):
     assignment = ItemAssignment.query.get_or_404(assignment_id)
@@ -1523,6 +1538,7 @@ def view_assignment_detail(assignment_id):
     return render_template('assignment_detail.html', assignment=assignment, user=user)
 
 @app.route('/download/recent-activity')
+@read_only
 @require_role(['Admin', 'MD', 'Accounts/SCM'])
 def download_recent_activity():
     try:
@@ -1698,6 +1714,7 @@ def download_recent_activity():
     return response
 
 @app.route('/vendors')
+@read_only
 @require_login
 def view_vendors():
     page = request.args.get('page', 1, type=int)
@@ -1748,14 +1765,49 @@ def add_vendor():
 
     return render_template('add_vendor.html')
 
+@app.route('/vendors/scorecard')
+@read_only
+@require_role(['Admin', 'MD', 'Accounts/SCM'])
+def vendor_scorecard():
+    page = request.args.get('page', 1, type=int)
+    ranking = request.args.get('rank', 'on_time_rate')
+    if ranking not in SCORECARD_RANKINGS:
+        ranking = 'on_time_rate'
+
+    scorecards = ranked_scorecards(ranking).paginate(page=page, per_page=25, error_out=False)
+    user = User.query.get(session['user_id'])
+    return render_template('vendor_scorecard.html', scorecards=scorecards, ranking=ranking, user=user)
+
+@app.route('/api/vendors/scorecard')
+@read_only
+@require_role(['Admin', 'MD', 'Accounts/SCM'])
+def vendor_scorecard_api():
+    page = request.args.get('page', 1, type=int)
+    per_page = min(request.args.get('per_page', 50, type=int), 500)
+    ranking = request.args.get('rank', 'on_time_rate')
+    if ranking not in SCORECARD_RANKINGS:
+        return jsonify({'error': f'rank must be one of: {", ".join(SCORECARD_RANKINGS)}'}), 400
+
+    scorecards = ranked_scorecards(ranking).paginate(page=page, per_page=per_page, error_out=False)
+    return jsonify({
+        'rank': ranking,
+        'page': scorecards.page,
+        'pages': scorecards.pages,
+        'total': scorecards.total,
+        'results': [scorecard_dict(scorecard) for scorecard in scorecards.items],
+    })
+
 @app.route('/vendor/<int:vendor_id>')
+@read_only
 @require_login
 def view_vendor_detail(vendor_id):
     vendor = Vendor.query.get_or_404(vendor_id)
     # Get assignments for this vendor
     assignments = ItemAssignment.query.filter_by(vendor_id=vendor_id).order_by(ItemAssignment.created_at.desc()).limit(10).all()
+    scorecard = db.session.get(VendorScorecard, vendor_id)
     user = User.query.get(session['user_id'])
-    return render_template('vendor_detail.html', vendor=vendor, assignments=assignments, user=user)
+    return render_template('vendor_detail.html', vendor=vendor, assignments=assignments, scorecard=scorecard,
+                           user=user)
 
 @app.route('/vendor/<int:vendor_id>/edit', methods=['GET', 'POST'])
 @require_role(['Admin', 'MD', 'Accounts/SCM'])
@@ -1786,6 +1838,7 @@ def edit_vendor(vendor_id):
     return render_template('edit_vendor.html', vendor=vendor)
 
 @app.route('/assignments')
+@read_only
 @require_login
 def view_assignments():
     page = request.args.get('page', 1, type=int)
@@ -1873,6 +1926,7 @@ def update_assignment_status(assignment_id):
     return redirect(url_for('view_assignments'))
 
 @app.route('/asset-assignments')
+@read_only
 @require_role(['Admin', 'MD', 'Accounts/SCM'])
 def view_asset_assignments():
     page = request.args.get('page', 1, type=int)
@@ -1889,46 +1943,35 @@ def view_asset_assignments():
 
 # Asset Lifecycle Management Routes
 @app.route('/asset-lifecycle')
+@read_only
 @require_login
 def asset_lifecycle_dashboard():
     user = User.query.get(session['user_id'])
 
-    # Get maintenance schedules
-    maintenance_schedules = AssetMaintenance.query.filter_by(
-        status='Scheduled'
-    ).order_by(AssetMaintenance.scheduled_date).all()
-
-    # Get warranty alerts
-    warranty_alerts = WarrantyAlert.query.filter_by(
-        alert_type='Warranty Expiry'
-    ).order_by(WarrantyAlert.alert_date).all()
-
-    # Get assets with warranty expiring soon
     from datetime import date, timedelta
     today = date.today()
-    thirty_days_later = today + timedelta(days=30)
     seven_days_later = today + timedelta(days=7)
 
-    warranty_expiring = Asset.query.filter(
-        Asset.warranty_expiry.isnot(None),
-        Asset.warranty_expiry <= thirty_days_later,
-        Asset.warranty_expiry >= today
-    ).order_by(Asset.warranty_expiry).all()
+    # Upcoming warranty expiries, precomputed by warranty_alerts.py
+    warranty_alerts = (WarrantyAlert.query
+                       .options(joinedload(WarrantyAlert.asset))
+                       .filter(WarrantyAlert.alert_type == WARRANTY_ALERT_TYPE,
+                               WarrantyAlert.is_active.is_(True),
+                               WarrantyAlert.alert_date >= today)
+                       .order_by(WarrantyAlert.alert_date)
+                       .all())
 
     # Get maintenance due in next 7 days
-    maintenance_due = AssetMaintenance.query.filter(
-        AssetMaintenance.scheduled_date <= seven_days_later,
-        AssetMaintenance.scheduled_date >= today,
-        AssetMaintenance.status == 'Scheduled'
-    ).order_by(AssetMaintenance.scheduled_date).all()
+    maintenance_due = due_in_window(today, seven_days_later).options(joinedload(AssetMaintenance.asset)).all()
 
     # Get active alerts
     active_alerts = WarrantyAlert.query.filter_by(is_active=True).limit(5).all()
 
     # Calculate statistics
-    warranty_expiring_count = len(warranty_expiring)
+    warranty_expiring_count = len(warranty_alerts)
     maintenance_due_count = len(maintenance_due)
-    current_book_value = sum([a.current_value for a in Asset.query.all() if a.current_value]) or 0
+    # asset.current_value is kept up to date by depreciation.run_depreciation()
+    current_book_value = db.session.query(db.func.coalesce(db.func.sum(Asset.current_value), 0)).scalar()
     active_alerts_count = WarrantyAlert.query.filter_by(is_active=True).count()
 
     stats = {
@@ -1940,15 +1983,14 @@ def asset_lifecycle_dashboard():
 
     return render_template('asset_lifecycle.html', 
                          user=user,
-                         maintenance_schedules=maintenance_schedules,
                          warranty_alerts=warranty_alerts,
-                         warranty_expiring=warranty_expiring,
                          maintenance_due=maintenance_due,
                          active_alerts=active_alerts,
                          stats=stats,
                          today=today)
 
 @app.route('/maintenance')
+@read_only
 @require_role(['Admin', 'MD', 'Accounts/SCM'])
 def view_maintenance():
     page = request.args.get('page', 1, type=int)
@@ -2003,18 +2045,162 @@ def complete_maintenance(maintenance_id):
     maintenance.maintenance_notes = request.form.get('notes', '')
     maintenance.updated_by = session['user_id']
 
+    next_date = schedule_follow_up(maintenance, session['user_id'])
     db.session.commit()
 
     log_activity(session['user_id'], 'Maintenance Completed', 
                 f'Completed maintenance for asset {maintenance.asset.asset_tag}')
-    flash('Maintenance marked as completed!', 'success')
+    if next_date:
+        flash(f'Maintenance marked as completed! Next maintenance is scheduled for {next_date.strftime("%Y-%m-%d")}.', 'success')
+    else:
+        flash('Maintenance marked as completed!', 'success')
     return redirect(url_for('asset_lifecycle_dashboard'))
 
+@app.route('/maintenance/plans', methods=['GET', 'POST'])
+@require_role(['Admin', 'MD', 'Accounts/SCM'])
+def maintenance_plans():
+    if request.method == 'POST':
+        asset_id = request.form.get('asset_id', type=int)
+        category = request.form.get('category', '').strip()
+        interval_months = request.form.get('interval_months', type=int)
+        if not (asset_id or category) or not interval_months or interval_months < 1:
+            flash('Choose an asset or a category and an interval of at least one month.', 'danger')
+            return redirect(url_for('maintenance_plans'))
+
+        plan = MaintenancePlan()
+        plan.name = request.form['name']
+        plan.asset_id = asset_id
+        plan.category = None if asset_id else category
+        plan.maintenance_type = request.form.get('maintenance_type', 'Preventive')
+        plan.description = request.form['description']
+        plan.interval_months = interval_months
+        plan.start_date = datetime.strptime(request.form['start_date'], '%Y-%m-%d').date()
+        plan.service_provider = request.form.get('service_provider', '')
+        plan.created_by = session['user_id']
+        db.session.add(plan)
+        db.session.flush()
+
+        created = materialize_plan(plan)
+        db.session.commit()
+
+        log_activity(session['user_id'], 'Maintenance Plan Created',
+                    f'Created maintenance plan "{plan.name}" for {plan.target} every {plan.interval_months} month(s)')
+        flash(f'Maintenance plan created. {created} maintenance task(s) scheduled for the next '
+              f'{MAINTENANCE_HORIZON_DAYS} days.', 'success')
+        return redirect(url_for('maintenance_plans'))
+
+    plans = MaintenancePlan.query.options(joinedload(MaintenancePlan.asset)).order_by(
+        MaintenancePlan.is_active.desc(), MaintenancePlan.name).all()
+    assets = Asset.query.order_by(Asset.asset_tag).all()
+    categories = [c for (c,) in db.session.query(Asset.category).distinct().order_by(Asset.category) if c]
+    return render_template('maintenance_plans.html', plans=plans, assets=assets, categories=categories,
+                           horizon_days=MAINTENANCE_HORIZON_DAYS)
+
+@app.route('/maintenance/plans/<int:plan_id>/deactivate', methods=['POST'])
+@require_role(['Admin', 'MD', 'Accounts/SCM'])
+def deactivate_maintenance_plan(plan_id):
+    plan = MaintenancePlan.query.get_or_404(plan_id)
+    plan.is_active = False
+    # Drop the occurrences that have not happened yet
+    cancelled = AssetMaintenance.query.filter(
+        AssetMaintenance.plan_id == plan.id,
+        AssetMaintenance.status == 'Scheduled',
+        AssetMaintenance.scheduled_date >= date.today()
+    ).update({'status': 'Cancelled', 'updated_by': session['user_id']}, synchronize_session=False)
+    db.session.commit()
+
+    log_activity(session['user_id'], 'Maintenance Plan Deactivated',
+                f'Deactivated maintenance plan "{plan.name}", cancelled {cancelled} upcoming task(s)')
+    flash(f'Maintenance plan deactivated; {cancelled} upcoming task(s) cancelled.', 'success')
+    return redirect(url_for('maintenance_plans'))
+
+@app.route('/api/maintenance/due')
+@read_only
+@require_role(['Admin', 'MD', 'Accounts/SCM'])
+def maintenance_due_api():
+    """Scheduled maintenance due in a date window (?from=&to= or ?days=N), paginated"""
+    try:
+        start = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') else date.today()
+        end = (datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to')
+               else start + timedelta(days=request.args.get('days', 7, type=int)))
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+
+    page = request.args.get('page', 1, type=int)
+    per_page = min(request.args.get('per_page', 50, type=int), 500)
+    results = due_in_window(start, end, asset_id=request.args.get('asset_id', type=int),
+                            category=request.args.get('category')).options(
+        joinedload(AssetMaintenance.asset)).paginate(page=page, per_page=per_page, error_out=False)
+
+    return jsonify({
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'page': results.page,
+        'pages': results.pages,
+        'total': results.total,
+        'results': [{
+            'id': m.id,
+            'asset_id': m.asset_id,
+            'asset_tag': m.asset.asset_tag,
+            'maintenance_type': m.maintenance_type,
+            'scheduled_date': m.scheduled_date.isoformat(),
+            'plan_id': m.plan_id,
+            'service_provider': m.service_provider,
+            'description': m.description,
+        } for m in results.items],
+    })
+
 @app.route('/view_depreciation')
+@read_only
 @require_role(['Admin', 'MD', 'Accounts/SCM'])
 def view_depreciation():
-    depreciation_records = AssetDepreciation.query.order_by(AssetDepreciation.created_at.desc()).all()
-    return render_template('depreciation.html', depreciation_records=depreciation_records)
+    depreciation_records = (AssetDepreciation.query
+                            .options(joinedload(AssetDepreciation.asset))
+                            .order_by(AssetDepreciation.created_at.desc())
+                            .all())
+    # Valued as of today in one pass; the monthly depreciation.py run stores them.
+    # depreciation, depreciation_projection and quotation_scoring load numpy,
+    # so they are imported by the views that use them, not at startup.
+    from depreciation import current_valuations
+    valuations = current_valuations(depreciation_records)
+    return render_template('depreciation.html', depreciation_records=depreciation_records,
+                           valuations=valuations)
+
+@app.route('/api/depreciation/projection')
+@read_only
+@require_role(['Admin', 'MD', 'Accounts/SCM'])
+def depreciation_projection_api():
+    """Projected book value per category (and per asset with ?assets=1) for the next N years"""
+    from depreciation_projection import MAX_YEARS as MAX_PROJECTION_YEARS, get_projection
+    years = request.args.get('years', 5, type=int)
+    if years is None or not 1 <= years <= MAX_PROJECTION_YEARS:
+        return jsonify({'error': f'years must be between 1 and {MAX_PROJECTION_YEARS}'}), 400
+    projection = get_projection(years)
+    return jsonify(projection.to_dict(include_assets=request.args.get('assets') == '1'))
+
+@app.route('/download/depreciation-projection')
+@read_only
+@require_role(['Admin', 'MD', 'Accounts/SCM'])
+def download_depreciation_projection():
+    from depreciation_projection import MAX_YEARS as MAX_PROJECTION_YEARS, get_projection, iter_csv, write_xlsx
+    years = max(1, min(request.args.get('years', 5, type=int) or 5, MAX_PROJECTION_YEARS))
+    projection = get_projection(years)
+    filename = f'depreciation_projection_{projection.as_of.isoformat()}_{years}y'
+
+    try:
+        import openpyxl  # noqa: F401
+    except ImportError:
+        # Fallback to CSV if openpyxl is not available
+        response = app.response_class(stream_with_context(iter_csv(projection)), mimetype='text/csv')
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}.csv'
+        return response
+
+    # Written to a temp file and streamed from there, so large registers are not held in memory
+    output = tempfile.TemporaryFile()
+    write_xlsx(projection, output)
+    output.seek(0)
+    return send_file(output, as_attachment=True, download_name=f'{filename}.xlsx',
+                     mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
 
 @app.route('/custom_reports')
 @require_role(['Admin', 'MD', 'Accounts/SCM'])
@@ -2023,6 +2209,7 @@ def custom_reports():
 
 # Analytics Dashboard
 @app.route('/analytics')
+@read_only
 @require_role(['Admin', 'MD', 'Accounts/SCM'])
 def analytics_dashboard():
     user = User.query.get(session['user_id'])
@@ -2127,30 +2314,73 @@ def analytics_dashboard():
 
 # Quotation Management Routes
 @app.route('/quotations')
+@read_only
 @require_role(['Admin', 'MD', 'Accounts/SCM'])
 def view_quotations():
     page = request.args.get('page', 1, type=int)
     status = request.args.get('status', '')
+    request_id = request.args.get('request_id', type=int)
+    user = User.query.get(session['user_id'])
 
-    query = ProcurementQuotation.query
+    if request_id:
+        # Side-by-side comparison of one request's quotations, best score first
+        from quotation_scoring import compare as compare_quotations, price_summary as quotation_price_summary
+        asset_request = AssetRequest.query.get_or_404(request_id)
+        comparison = compare_quotations([request_id])[request_id]
+        quotations_by_id = {quotation.id: quotation for quotation in ProcurementQuotation.query.options(
+            joinedload(ProcurementQuotation.vendor)).filter_by(request_id=request_id)}
+        return render_template('quotations.html',
+                             asset_request=asset_request,
+                             quotations=[quotations_by_id[entry['id']] for entry in comparison],
+                             scores={entry['id']: entry for entry in comparison},
+                             comparison_stats=quotation_price_summary(comparison),
+                             user=user)
+
+    query = ProcurementQuotation.query.options(joinedload(ProcurementQuotation.vendor))
     if status:
         query = query.filter_by(status=status)
 
     quotations = query.order_by(ProcurementQuotation.created_at.desc()).paginate(
         page=page, per_page=15, error_out=False)
 
-    user = User.query.get(session['user_id'])
     return render_template('quotations.html', 
                          quotations=quotations,
                          selected_status=status,
                          user=user)
 
+@app.route('/api/quotations/compare')
+@read_only
+@require_role(['Admin', 'MD', 'Accounts/SCM'])
+def compare_quotations_api():
+    from quotation_scoring import (FACTORS as QUOTATION_FACTORS, compare as compare_quotations,
+                                   price_summary as quotation_price_summary)
+    try:
+        request_ids = sorted({int(value) for values in request.args.getlist('request_id')
+                              for value in values.split(',') if value.strip()})
+    except ValueError:
+        return jsonify({'error': 'request_id must be a list of integers'}), 400
+    if not request_ids:
+        return jsonify({'error': 'Give at least one request_id'}), 400
+    if len(request_ids) > 200:
+        return jsonify({'error': 'At most 200 requests can be compared at once'}), 400
+
+    comparison = compare_quotations(request_ids)
+    return jsonify({
+        'weights': {name: weight for name, (weight, _, _) in QUOTATION_FACTORS.items()},
+        'requests': [{'request_id': request_id, 'summary': quotation_price_summary(quotations),
+                      'quotations': quotations}
+                     for request_id, quotations in comparison.items()],
+    })
+
 @app.route('/quotation/add', methods=['GET', 'POST'])
 @require_role(['Admin', 'MD', 'Accounts/SCM'])
 def add_quotation():
     if request.method == 'POST':
+        if not request.form.get('request_id'):
+            flash('Select the request this quotation is for.', 'error')
+            return redirect(url_for('add_quotation'))
         quotation = ProcurementQuotation()
-        quotation.request_id = int(request.form['request_id']) if request.form['request_id'] else None
+        quotation.request_id = int(request.form['request_id'])
         quotation.vendor_id = int(request.form['vendor_id'])
         quotation.quotation_number = request.form['quotation_number']
         quotation.quoted_price = float(request.form['quoted_price'])
@@ -2165,19 +2395,27 @@ def add_quotation():
         quotation.submitted_by = session['user_id']
 
         db.session.add(quotation)
+        db.session.flush()
+        # A new quotation moves the bar for the others on the same request
+        from quotation_scoring import score_requests as score_quotations
+        comparison = score_quotations([quotation.request_id])[quotation.request_id]
         db.session.commit()
 
         log_activity(session['user_id'], 'Quotation Added', 
                     f'Added quotation {quotation.quotation_number} from {quotation.vendor.vendor_name}')
-        flash('Quotation added successfully!', 'success')
-        return redirect(url_for('view_quotations'))
+        entry = next(entry for entry in comparison if entry['id'] == quotation.id)
+        flash(f'Quotation added successfully! Score {entry["score"]}/100, '
+              f'ranked {entry["rank"]} of {len(comparison)}.', 'success')
+        return redirect(url_for('view_quotations', request_id=quotation.request_id))
 
     vendors = Vendor.query.filter_by(is_active=True).all()
     requests = AssetRequest.query.filter_by(status='Approved').all()
-    return render_template('add_quotation.html', vendors=vendors, requests=requests)
+    return render_template('add_quotation.html', vendors=vendors, requests=requests,
+                           selected_request_id=request.args.get('request_id', type=int))
 
 # API Search Route for global search
 @app.route('/api/search')
+@read_only
 @require_login
 def api_search():
     query = request.args.get('q', '').strip()
@@ -2285,11 +2523,15 @@ def delete_all_data():
         db.session.execute(text('DELETE FROM inventory_update'))
         db.session.execute(text('DELETE FROM item_assignment'))
         db.session.execute(text('DELETE FROM asset_maintenance'))
+        db.session.execute(text('DELETE FROM maintenance_plan'))
         db.session.execute(text('DELETE FROM asset_depreciation'))
         db.session.execute(text('DELETE FROM warranty_alert'))
         db.session.execute(text('DELETE FROM procurement_quotation'))
+        db.session.execute(text('DELETE FROM stock_alert'))
         db.session.execute(text('DELETE FROM asset'))
+        db.session.execute(text('DELETE FROM vendor_scorecard'))
         db.session.execute(text('DELETE FROM vendor'))
+        db.session.execute(text('DELETE FROM stored_blob'))
         db.session.execute(text('DELETE FROM user'))
 
         # Clear uploads folder
@@ -2343,6 +2585,7 @@ def delete_all_data():
 
 # Purchase Order Routes
 @app.route('/purchase-orders')
+@read_only
 @require_role(['Admin', 'MD', 'Accounts/SCM'])
 def view_purchase_orders():
     page = request.args.get('page', 1, type=int)
@@ -2366,6 +2609,7 @@ def view_purchase_orders():
                          user=user)
 
 @app.route('/purchase-order/create', methods=['GET', 'POST'])
+@upload_limit('purchase_order')
 @require_role(['Accounts/SCM'])
 def create_purchase_order():
     if request.method == 'POST':
@@ -2413,33 +2657,13 @@ def create_purchase_order():
             uploaded_files = request.files.getlist('quotation_files')
             for file in uploaded_files:
                 if file and file.filename and allowed_file(file.filename):
-                    filename = str(uuid.uuid4()) + '_' + secure_filename(file.filename)
-                    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                    file.save(file_path)
-
-                    uploaded_file = UploadedFile()
-                    uploaded_file.filename = filename
-                    uploaded_file.original_filename = file.filename
-                    uploaded_file.file_path = file_path
-                    uploaded_file.file_size = os.path.getsize(file_path)
-                    uploaded_file.mime_type = file.content_type
-                    uploaded_file.po_id = po.id  # Link to PO instead of request
+                    uploaded_file = save_uploaded_file(file, po_id=po.id)  # Link to PO instead of request
                     db.session.add(uploaded_file)
 
             vendor_docs = request.files.getlist('vendor_documents')
             for file in vendor_docs:
                 if file and file.filename and allowed_file(file.filename):
-                    filename = str(uuid.uuid4()) + '_' + secure_filename(file.filename)
-                    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                    file.save(file_path)
-
-                    uploaded_file = UploadedFile()
-                    uploaded_file.filename = filename
-                    uploaded_file.original_filename = file.filename
-                    uploaded_file.file_path = file_path
-                    uploaded_file.file_size = os.path.getsize(file_path)
-                    uploaded_file.mime_type = file.content_type
-                    uploaded_file.po_id = po.id  # Link to PO instead of request
+                    uploaded_file = save_uploaded_file(file, po_id=po.id)  # Link to PO instead of request
                     db.session.add(uploaded_file)
         else:
             po.status = 'Approved'
@@ -2454,6 +2678,7 @@ def create_purchase_order():
     return render_template('create_purchase_order.html', vendors=vendors)
 
 @app.route('/purchase-order/<int:po_id>')
+@read_only
 @require_login
 def view_purchase_order_detail(po_id):
     po = PurchaseOrder.query.get_or_404(po_id)
@@ -2506,6 +2731,7 @@ def generate_final_purchase_order(po_id):
     return redirect(url_for('view_purchase_orders'))
 
 @app.route('/purchase-order/<int:po_id>/print')
+@read_only
 @require_login
 def print_purchase_order(po_id):
     po = PurchaseOrder.query.get_or_404(po_id)
@@ -2614,17 +2840,23 @@ def create_po_from_request(request_id):
 
 # Asset Limits Management Routes
 @app.route('/asset-limits')
+@read_only
 @require_role(['Admin', 'MD', 'Accounts/SCM'])
 def view_asset_limits():
-    # Get all asset limits
-    asset_limits = AssetLimit.query.join(Asset).order_by(Asset.asset_tag).all()
-    
-    # Get assets that exceed their limits
-    exceeded_limits = [limit for limit in asset_limits if limit.is_exceeded and limit.alert_enabled]
-    
+    page = request.args.get('page', 1, type=int)
+    state = request.args.get('state', '')
+    if state not in LIMIT_STATES:
+        state = ''
+    # ?alerts=1 keeps only alert-enabled limits, as counted by the stock alerts
+    alerts_only = request.args.get('alerts') == '1'
+
+    asset_limits = limits_query(state=state or None, alerts_only=alerts_only).paginate(
+        page=page, per_page=20, error_out=False)
+    exceeded_limits = exceeded_limits_query().all()
+    limit_summary = limit_counts()
+
     # Get assets that don't have limits set yet
-    assets_with_limits = [limit.asset_id for limit in asset_limits]
-    available_assets = Asset.query.filter(~Asset.id.in_(assets_with_limits)).all()
+    available_assets = unlimited_assets_query().all()
     
     user = User.query.get(session['user_id'])
     
@@ -2632,6 +2864,10 @@ def view_asset_limits():
                          asset_limits=asset_limits,
                          exceeded_limits=exceeded_limits,
                          available_assets=available_assets,
+                         limit_summary=limit_summary,
+                         limit_states=LIMIT_STATES,
+                         selected_state=state,
+                         alerts_only=alerts_only or None,
                          user=user)
 
 @app.route('/asset-limits/add', methods=['POST'])
@@ -0,0 +1,251 @@
+"""
+Versioned schema migrations.
+
+schema_version records every migration applied to the database. migrate()
+runs at startup: it reads the highest applied version, a single query, and
+returns straight away when that is the newest migration in MIGRATIONS.
+Otherwise it takes the migration lock, so that of several workers booting
+together only one migrates while the others wait and then find nothing left
+to do, and applies the pending migrations in order, each in one transaction
+with its schema_version row.
+
+The lock is a PostgreSQL advisory lock, or for a SQLite file an exclusive
+transaction on `<database>.migrate-lock` next to it (which leaves the
+database itself free for the migrations to write).
+
+A new database is created from the models with create_all() and stamped with
+the newest version. Migrations only run against databases that predate them;
+1-4 bring databases from before versioning up to date. create_all() can also
+create a table that is new to an older database in its current shape, so a
+migration must not assume it is the first to touch a table: add columns with
+add_columns(), which skips columns that already exist. SQLite runs DDL
+outside the transaction, which is another reason for migrations to be safe
+to re-run.
+
+    python schema_migrations.py          # apply pending migrations
+    python schema_migrations.py status   # list applied and pending migrations
+"""
+
+import argparse
+import logging
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import exc, func, insert, inspect, select, text
+
+from models import db, AssetRequest, SchemaVersion
+
+LOCK_KEY = 48_656_781  # PostgreSQL advisory lock id, the same in every process migrating this database
+LOCK_TIMEOUT = 600  # seconds a SQLite process waits for another one's migration
+
+# (version, description, function taking a connection), in the order they apply
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Register the decorated function as migration `version`"""
+    def register(apply):
+        if MIGRATIONS and version <= MIGRATIONS[-1][0]:
+            raise ValueError(f'Migration {version} registered after {MIGRATIONS[-1][0]}')
+        MIGRATIONS.append((version, description, apply))
+        return apply
+    return register
+
+
+def add_columns(connection, table, columns):
+    """Add the (name, type and default DDL) columns that table lacks; returns the names added"""
+    inspector = inspect(connection)
+    if not inspector.has_table(table):
+        return []
+    existing = {column['name'] for column in inspector.get_columns(table)}
+    quote = connection.dialect.identifier_preparer.quote
+    added = []
+    for name, ddl in columns:
+        if name not in existing:
+            connection.execute(text(f'ALTER TABLE {quote(table)} ADD COLUMN {quote(name)} {ddl}'))
+            added.append(name)
+    return added
+
+
+@migration(1, 'Create tables added since the first release')
+def _create_missing_tables(connection):
+    db.metadata.create_all(connection)
+
+
+@migration(2, 'Add columns added since the first release')
+def _add_missing_columns(connection):
+    add_columns(connection, 'asset', [
+        ('asset_type', "VARCHAR(50) DEFAULT 'Fixed Asset'"),
+        ('current_quantity', 'INTEGER DEFAULT 1'),
+        ('minimum_threshold', 'INTEGER DEFAULT 5'),
+        ('unit_of_measurement', "VARCHAR(50) DEFAULT 'Piece'"),
+    ])
+    add_columns(connection, 'asset_request', [
+        ('is_bulk_request', 'BOOLEAN DEFAULT FALSE'),
+        ('bulk_items', 'TEXT'),
+        ('item_classification', 'VARCHAR(20)'),
+        ('floor', 'VARCHAR(50)'),
+        ('fulfilled_from_asset_id', 'INTEGER'),
+        ('fulfilled_quantity', 'INTEGER DEFAULT 0'),
+        ('fulfilled_by', 'INTEGER'),
+        ('fulfilled_at', 'TIMESTAMP'),
+        ('fulfillment_notes', 'TEXT'),
+        ('next_approver_role', 'VARCHAR(50)'),
+        ('next_approver_floor', 'VARCHAR(50)'),
+    ])
+    add_columns(connection, 'user', [
+        ('floor', 'VARCHAR(50)'),
+        ('department', 'VARCHAR(100)'),
+        ('authz_version', 'INTEGER DEFAULT 0'),
+    ])
+    add_columns(connection, 'uploaded_file', [('po_id', 'INTEGER'), ('content_hash', 'VARCHAR(64)')])
+    add_columns(connection, 'bill', [('content_hash', 'VARCHAR(64)')])
+    add_columns(connection, 'warranty_alert', [('threshold_days', 'INTEGER')])
+    add_columns(connection, 'asset_maintenance', [('plan_id', 'INTEGER')])
+    add_columns(connection, 'purchase_order', [
+        ('delivery_address', 'TEXT'),
+        ('vendor_address', 'TEXT'),
+        ('vendor_gst', 'VARCHAR(50)'),
+        ('delivery_terms', 'VARCHAR(200)'),
+        ('warranty_terms', 'TEXT'),
+        ('special_instructions', 'TEXT'),
+        ('quotation_files', 'TEXT'),
+        ('vendor_documents', 'TEXT'),
+    ])
+
+    # Files can belong to a purchase order instead of a request. SQLite cannot
+    # drop NOT NULL without rebuilding the table, so it keeps the constraint.
+    if connection.dialect.name == 'postgresql':
+        request_id = next(column for column in inspect(connection).get_columns('uploaded_file')
+                           if column['name'] == 'request_id')
+        if not request_id['nullable']:
+            connection.execute(text('ALTER TABLE uploaded_file ALTER COLUMN request_id DROP NOT NULL'))
+
+
+@migration(3, 'Fill the approver queue (approval_policy.py)')
+def _fill_approver_queue(connection):
+    from approval_policy import rebuild_approver_queue
+    rebuild_approver_queue(connection)
+
+
+@migration(4, 'Create the indexes declared on the models (db_indexes.py)')
+def _create_declared_indexes(connection):
+    from db_indexes import ensure_indexes
+    ensure_indexes(connection)
+
+
+@migration(5, 'Keep the name bill files were uploaded under')
+def _add_bill_original_filename(connection):
+    add_columns(connection, 'bill', [('original_filename', 'VARCHAR(255)')])
+
+
+@migration(6, 'Extend the approver queue index with status and created_at')
+def _extend_approver_queue_index(connection):
+    # Same name, new columns: ensure_indexes() would take the old one as present
+    index = next(index for index in AssetRequest.__table__.indexes if index.name == 'ix_asset_request_approver_queue')
+    index.drop(connection, checkfirst=True)
+    index.create(connection)
+
+
+@migration(7, 'Index the upload and bill file names served by /uploads')
+def _index_file_names(connection):
+    from db_indexes import ensure_indexes
+    ensure_indexes(connection)
+
+
+def latest_version():
+    return MIGRATIONS[-1][0]
+
+
+def current_version(connection):
+    """Highest applied version, 0 when none is, or None without a schema_version table"""
+    try:
+        return connection.execute(select(func.coalesce(func.max(SchemaVersion.version), 0))).scalar()
+    except exc.DBAPIError:
+        connection.rollback()
+        return None
+
+
+@contextmanager
+def migration_lock(engine):
+    """Hold the lock that lets one process at a time migrate engine's database"""
+    if engine.dialect.name == 'postgresql':
+        with engine.connect() as connection:
+            connection.execute(text('SELECT pg_advisory_lock(:key)'), {'key': LOCK_KEY})
+            connection.commit()
+            try:
+                yield
+            finally:
+                connection.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': LOCK_KEY})
+                connection.commit()
+    elif engine.dialect.name == 'sqlite' and engine.url.database not in (None, '', ':memory:'):
+        lock = sqlite3.connect(f'{engine.url.database}.migrate-lock', timeout=LOCK_TIMEOUT, isolation_level=None)
+        try:
+            lock.execute('BEGIN EXCLUSIVE')
+            yield
+        finally:
+            lock.close()
+    else:
+        # In-memory SQLite is private to this process; other databases go unlocked
+        yield
+
+
+def migrate():
+    """Bring the database up to the newest migration; returns the versions applied"""
+    with db.engine.connect() as connection:
+        if current_version(connection) == latest_version():
+            return []
+
+    with migration_lock(db.engine):
+        with db.engine.begin() as connection:
+            SchemaVersion.__table__.create(connection, checkfirst=True)
+            version = current_version(connection)
+            if version == 0 and set(inspect(connection).get_table_names()) == {SchemaVersion.__tablename__}:
+                # New database: the models already describe the newest schema
+                db.metadata.create_all(connection)
+                now = datetime.utcnow()
+                connection.execute(insert(SchemaVersion), [
+                    {'version': number, 'description': description, 'applied_at': now}
+                    for number, description, _ in MIGRATIONS])
+                logging.info(f"Created the database schema at version {latest_version()}")
+                return [number for number, _, _ in MIGRATIONS]
+
+        applied = []
+        for number, description, apply in MIGRATIONS:
+            if number <= version:
+                continue
+            with db.engine.begin() as connection:
+                apply(connection)
+                connection.execute(insert(SchemaVersion).values(
+                    version=number, description=description, applied_at=datetime.utcnow()))
+            logging.info(f"Applied migration {number}: {description}")
+            applied.append(number)
+        return applied
+
+
+def status():
+    """[(version, description, applied_at or None)] for every migration"""
+    with db.engine.connect() as connection:
+        if current_version(connection) is None:
+            applied = {}
+        else:
+            applied = dict(connection.execute(select(SchemaVersion.version, SchemaVersion.applied_at)).all())
+    return [(number, description, applied.get(number)) for number, description, _ in MIGRATIONS]
+
+
+if __name__ == '__main__':
+    from app import app
+
+    parser = argparse.ArgumentParser(description='Apply or list versioned schema migrations')
+    parser.add_argument('command', nargs='?', choices=('upgrade', 'status'), default='upgrade')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.command == 'status':
+            for number, description, applied_at in status():
+                print(f"{number:>4}  {applied_at.strftime('%Y-%m-%d %H:%M') if applied_at else 'pending':<16}  "
+                      f"{description}")
+        else:
+            applied = migrate()
+            print(f"Applied {len(applied)} migration(s); schema at version {latest_version()}")
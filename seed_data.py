@@ -0,0 +1,107 @@
+"""
+Default users and sample vendors.
+
+A new database needs the admin and accounts logins (and the sample vendors
+the procurement pages start from). seed_defaults() looks all of them up in
+two queries and inserts only the missing ones, so password hashes are
+computed only for users it actually creates.
+
+app.py calls it at startup unless LAZY_STARTUP is set; lazy deployments run
+it once per deploy, after the migrations:
+    python schema_migrations.py && python seed_data.py
+"""
+
+import argparse
+import logging
+
+from sqlalchemy import select
+from werkzeug.security import generate_password_hash
+
+from models import db, User, Vendor
+
+DEFAULT_USERS = [
+    {
+        'username': 'admin',
+        'email': 'admin@hexamed.com',
+        'password': 'hexamed123',
+        'role': 'MD',
+        'full_name': 'System Administrator',
+        'floor': 'All',
+        'department': 'Admin Block',
+    },
+    {
+        'username': 'accounts',
+        'email': 'accounts@hexamed.com',
+        'password': 'accounts123',
+        'role': 'Accounts/SCM',
+        'full_name': 'Accounts Manager',
+        'floor': 'All',
+        'department': 'Accounts',
+    },
+]
+
+SAMPLE_VENDORS = [
+    {
+        'vendor_name': 'TechCorp Solutions',
+        'vendor_code': 'TC001',
+        'category': 'IT Equipment',
+        'contact_person': 'amaan',
+        'phone': '+91-9876543210',
+        'email': 'sales@techcorp.com',
+        'payment_terms': 'Net 30'
+    },
+    {
+        'vendor_name': 'Office Furniture Ltd',
+        'vendor_code': 'OF002',
+        'category': 'Furniture',
+        'contact_person': 'Sarah ',
+        'phone': '+91-9876543211',
+        'email': 'orders@officefurniture.com',
+        'payment_terms': 'Net 15'
+    },
+    {
+        'vendor_name': 'Medical Supplies Co',
+        'vendor_code': 'MS003',
+        'category': 'Medical Equipment',
+        'contact_person': 'Dr. ritik ',
+        'phone': '+91-9876543212',
+        'email': 'info@medicalsupplies.com',
+        'payment_terms': 'Advance'
+    }
+]
+
+
+def seed_defaults():
+    """Create the missing default users and sample vendors; returns (users, vendors) created"""
+    existing_users = set(db.session.execute(
+        select(User.username).where(User.username.in_([user['username'] for user in DEFAULT_USERS]))).scalars())
+    existing_vendors = set(db.session.execute(
+        select(Vendor.vendor_code).where(Vendor.vendor_code.in_([vendor['vendor_code'] for vendor in SAMPLE_VENDORS]))
+    ).scalars())
+
+    users = [user for user in DEFAULT_USERS if user['username'] not in existing_users]
+    vendors = [vendor for vendor in SAMPLE_VENDORS if vendor['vendor_code'] not in existing_vendors]
+    if not users and not vendors:
+        return 0, 0
+
+    for data in users:
+        fields = {key: value for key, value in data.items() if key != 'password'}
+        db.session.add(User(password_hash=generate_password_hash(data['password']), **fields))
+        logging.info(f"{data['full_name']} created with username: {data['username']}, password: {data['password']}")
+    for data in vendors:
+        db.session.add(Vendor(**data))
+    db.session.commit()
+    if vendors:
+        logging.info(f"{len(vendors)} sample vendor(s) created")
+    return len(users), len(vendors)
+
+
+if __name__ == '__main__':
+    from app import app
+
+    parser = argparse.ArgumentParser(description='Create the default users and sample vendors if missing')
+    parser.parse_args()
+
+    with app.app_context():
+        users, vendors = seed_defaults()
+    print(f"Created {users} user(s) and {vendors} vendor(s)")
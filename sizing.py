@@ -0,0 +1,195 @@
+"""
+Startup sizing for gunicorn workers/threads and the SQLAlchemy pool.
+
+The plan is derived from the CPU count and available memory of the container
+(cgroup limits included) and from a DB connection budget (DB_MAX_CONNECTIONS),
+so that workers x (pool_size + max_overflow) never exceeds what the database
+allows. Explicit environment overrides always win:
+
+    WEB_CONCURRENCY, GUNICORN_THREADS, SQLALCHEMY_POOL_SIZE,
+    SQLALCHEMY_MAX_OVERFLOW, DB_MAX_CONNECTIONS, DB_RESERVED_CONNECTIONS,
+    WORKER_MEMORY_MB
+
+gunicorn_config.py computes the plan once and exports it as SIZING_PLAN so the
+workers (and the /health endpoint) report exactly what the master chose.
+"""
+
+import json
+import logging
+import os
+
+DEFAULT_WORKER_MEMORY_MB = 150
+DEFAULT_RESERVED_CONNECTIONS = 3
+DEFAULT_THREADS = 4
+DEFAULT_GEVENT_POOL_SIZE = 10
+
+
+def _env_int(name):
+    value = os.environ.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        logging.warning(f"Ignoring non-integer {name}={value!r}")
+        return None
+
+
+def _read_file(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def detect_cpu_count():
+    """CPUs usable by this process, honouring affinity and cgroup quotas"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    # cgroup v2: "max 100000" or "200000 100000"
+    cpu_max = _read_file('/sys/fs/cgroup/cpu.max')
+    if cpu_max:
+        quota, _, period = cpu_max.partition(' ')
+        if quota != 'max' and period:
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    else:
+        # cgroup v1
+        quota = _read_file('/sys/fs/cgroup/cpu/cpu.cfs_quota_us')
+        period = _read_file('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+        if quota and period and int(quota) > 0:
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+
+    return max(1, cpus)
+
+
+def detect_memory_mb():
+    """Available memory in MB, capped by the cgroup limit when there is one"""
+    available = None
+    meminfo = _read_file('/proc/meminfo')
+    if meminfo:
+        for line in meminfo.splitlines():
+            if line.startswith('MemAvailable:'):
+                available = int(line.split()[1]) // 1024
+                break
+    if available is None:
+        try:
+            available = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_AVPHYS_PAGES') // (1024 * 1024)
+        except (ValueError, OSError, AttributeError):
+            available = None
+
+    limit = _read_file('/sys/fs/cgroup/memory.max') or _read_file('/sys/fs/cgroup/memory/memory.limit_in_bytes')
+    if limit and limit != 'max':
+        limit_mb = int(limit) // (1024 * 1024)
+        # v1 reports a huge number when unlimited
+        if limit_mb < (1 << 40):
+            available = min(available, limit_mb) if available else limit_mb
+
+    return available
+
+
+def compute_plan(profile='sync', cpu_count=None, memory_mb=None, max_db_connections=None):
+    """Return a sizing plan dict for the given worker profile"""
+    cpu_count = cpu_count or detect_cpu_count()
+    if memory_mb is None:
+        memory_mb = detect_memory_mb()
+    if max_db_connections is None:
+        max_db_connections = _env_int('DB_MAX_CONNECTIONS')
+
+    worker_memory_mb = _env_int('WORKER_MEMORY_MB') or DEFAULT_WORKER_MEMORY_MB
+    reserved = _env_int('DB_RESERVED_CONNECTIONS')
+    if reserved is None:
+        reserved = DEFAULT_RESERVED_CONNECTIONS
+
+    # Workers: the usual 2 x CPU + 1, limited by how many fit in memory
+    workers = 2 * cpu_count + 1
+    if memory_mb:
+        workers = min(workers, max(1, memory_mb // worker_memory_mb))
+
+    # Concurrent requests (and so DB connections wanted) per worker
+    if profile == 'gthread':
+        threads = _env_int('GUNICORN_THREADS') or DEFAULT_THREADS
+        wanted_pool = threads
+    elif profile == 'gevent':
+        threads = 1
+        wanted_pool = _env_int('GEVENT_DB_POOL_SIZE') or DEFAULT_GEVENT_POOL_SIZE
+    else:
+        threads = 1
+        wanted_pool = 1
+
+    # Fit the connection budget: first drop workers until each gets a connection
+    budget = None
+    if max_db_connections:
+        budget = max(1, max_db_connections - reserved)
+        workers = min(workers, budget)
+
+    explicit_workers = _env_int('WEB_CONCURRENCY')
+    if explicit_workers:
+        workers = explicit_workers
+
+    pool_size = wanted_pool
+    max_overflow = max(2, wanted_pool // 2)
+    if budget:
+        per_worker = max(1, budget // workers)
+        pool_size = min(pool_size, per_worker)
+        max_overflow = max(0, min(max_overflow, per_worker - pool_size))
+
+    explicit_pool = _env_int('SQLALCHEMY_POOL_SIZE')
+    if explicit_pool is not None:
+        pool_size = explicit_pool
+    explicit_overflow = _env_int('SQLALCHEMY_MAX_OVERFLOW')
+    if explicit_overflow is not None:
+        max_overflow = explicit_overflow
+
+    peak = workers * (pool_size + max_overflow)
+    if max_db_connections and peak > max_db_connections:
+        logging.warning(f"Sizing plan may open {peak} DB connections, above DB_MAX_CONNECTIONS={max_db_connections}")
+
+    return {
+        'profile': profile,
+        'cpu_count': cpu_count,
+        'memory_mb': memory_mb,
+        'workers': workers,
+        'threads': threads,
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'max_db_connections': max_db_connections,
+        'reserved_connections': reserved,
+        'peak_db_connections': peak,
+    }
+
+
+def get_plan(profile=None):
+    """Return the plan exported by gunicorn_config.py, or compute one"""
+    exported = os.environ.get('SIZING_PLAN')
+    if exported:
+        try:
+            return json.loads(exported)
+        except ValueError:
+            logging.warning("Ignoring malformed SIZING_PLAN")
+    return compute_plan(profile or os.environ.get('GUNICORN_PROFILE', 'sync'))
+
+
+def describe(plan):
+    budget = plan['max_db_connections'] or 'unlimited'
+    return (f"Sizing plan ({plan['profile']}): {plan['workers']} workers x {plan['threads']} threads "
+            f"on {plan['cpu_count']} CPUs / {plan['memory_mb']} MB; DB pool "
+            f"{plan['pool_size']}+{plan['max_overflow']} per worker, peak "
+            f"{plan['peak_db_connections']} of {budget} connections")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Show the worker and DB pool sizing plan')
+    parser.add_argument('--profile', default=os.environ.get('GUNICORN_PROFILE', 'sync'),
+                        choices=['sync', 'gthread', 'gevent'])
+    parser.add_argument('--max-db-connections', type=int)
+    args = parser.parse_args()
+
+    plan = compute_plan(args.profile, max_db_connections=args.max_db_connections)
+    print(describe(plan))
+    print(json.dumps(plan, indent=2))
@@ -0,0 +1,210 @@
+"""
+Low-stock and asset limit alerts.
+
+Alerts are raised and resolved as inventory changes instead of being
+discovered by scan queries when someone opens the dashboard. A session hook
+notes which assets each flush touched (a changed current_quantity,
+minimum_threshold or asset_type, a new asset, or an asset limit being added,
+changed or removed). Just before the transaction commits only those assets
+are re-evaluated, and their transitions are written to stock_alert in the
+same transaction:
+
+- entering low stock (a consumable with current_quantity <= minimum_threshold)
+  or going over an alert-enabled limit inserts an active alert;
+- leaving that state marks the alert resolved (is_active false, resolved_at);
+- while an alert stays active its quantity and threshold are kept current.
+
+The dashboard only reads the active alerts. Changes made outside the ORM (raw
+SQL, bulk UPDATE statements, other applications) are not seen by the hook.
+Re-evaluate every asset after deploying this table, and from cron as a
+backstop:
+    15 6 * * *  cd /app && python stock_alerts.py
+"""
+
+import argparse
+from datetime import datetime
+
+from sqlalchemy import and_, bindparam, event, exists, func, insert, inspect, select, update
+from sqlalchemy.orm import contains_eager
+
+from asset_limits import exceeded_limits_select
+from db_routing import RoutingSession, primary
+from models import db, Asset, AssetLimit, StockAlert
+
+LOW_STOCK = 'Low Stock'
+LIMIT_EXCEEDED = 'Limit Exceeded'
+ALERT_TYPES = (LOW_STOCK, LIMIT_EXCEEDED)
+WATCHED_ASSET_FIELDS = ('current_quantity', 'minimum_threshold', 'asset_type')
+WATCHED_LIMIT_FIELDS = ('asset_id', 'max_quantity', 'alert_enabled')
+IN_CHUNK = 500
+
+_TOUCHED = 'stock_alert_asset_ids'  # key in Session.info
+
+
+def low_stock_condition():
+    return and_(Asset.asset_type == 'Consumable Asset', Asset.current_quantity <= Asset.minimum_threshold)
+
+
+def _breaches(asset_ids):
+    """(asset_id, alert_type) -> (quantity, threshold, message) for assets that should be alerting"""
+    breaches = {}
+    for asset_id, asset_tag, name, quantity, threshold in db.session.execute(
+            select(Asset.id, Asset.asset_tag, Asset.name, Asset.current_quantity, Asset.minimum_threshold)
+            .where(Asset.id.in_(asset_ids), low_stock_condition())):
+        breaches[(asset_id, LOW_STOCK)] = (
+            quantity, threshold, f'{asset_tag} ({name}) is low on stock: {quantity} left, minimum {threshold}')
+    for asset_id, asset_tag, name, quantity, max_quantity in db.session.execute(exceeded_limits_select(asset_ids)):
+        breaches[(asset_id, LIMIT_EXCEEDED)] = (
+            quantity, max_quantity, f'{asset_tag} ({name}) exceeds its limit: {quantity} held, maximum {max_quantity}')
+    return breaches
+
+
+def evaluate(asset_ids):
+    """Raise and resolve alerts for asset_ids; returns (raised, resolved)"""
+    asset_ids = sorted(set(asset_ids))
+    raised = resolved = 0
+    now = datetime.utcnow()
+    for start in range(0, len(asset_ids), IN_CHUNK):
+        chunk = asset_ids[start:start + IN_CHUNK]
+        breaches = _breaches(chunk)
+
+        active = {}
+        for alert_id, asset_id, alert_type, quantity, threshold in db.session.execute(
+                select(StockAlert.id, StockAlert.asset_id, StockAlert.alert_type,
+                       StockAlert.quantity, StockAlert.threshold)
+                .where(StockAlert.is_active.is_(True), StockAlert.asset_id.in_(chunk))
+                .order_by(StockAlert.id)):
+            active.setdefault((asset_id, alert_type), []).append((alert_id, quantity, threshold))
+
+        new_rows = [{'asset_id': asset_id, 'alert_type': alert_type, 'quantity': quantity,
+                     'threshold': threshold, 'message': message, 'is_active': True, 'created_at': now}
+                    for (asset_id, alert_type), (quantity, threshold, message) in breaches.items()
+                    if (asset_id, alert_type) not in active]
+        if new_rows:
+            db.session.execute(insert(StockAlert), new_rows)
+            raised += len(new_rows)
+
+        # Left the alerting state, or duplicates from two workers raising the same alert at once
+        stale = [alert_id for key, alerts in active.items()
+                 for alert_id, _, _ in (alerts if key not in breaches else alerts[1:])]
+        if stale:
+            db.session.execute(
+                update(StockAlert).where(StockAlert.id.in_(stale))
+                .values(is_active=False, resolved_at=now)
+                .execution_options(synchronize_session=False))
+            resolved += len(stale)
+
+        # Still alerting: keep the figures shown on the dashboard current
+        changed = [{'alert_id': alerts[0][0], 'new_quantity': breaches[key][0],
+                    'new_threshold': breaches[key][1], 'new_message': breaches[key][2]}
+                   for key, alerts in active.items()
+                   if key in breaches and alerts[0][1:] != breaches[key][:2]]
+        if changed:
+            table = StockAlert.__table__
+            db.session.execute(
+                update(table).where(table.c.id == bindparam('alert_id'))
+                .values(quantity=bindparam('new_quantity'), threshold=bindparam('new_threshold'),
+                        message=bindparam('new_message')),
+                changed)
+    return raised, resolved
+
+
+def active_alerts_query(alert_type=None):
+    """Active alerts with their asset, most recent first"""
+    query = (StockAlert.query.filter(StockAlert.is_active.is_(True))
+             .join(StockAlert.asset).options(contains_eager(StockAlert.asset)))
+    if alert_type:
+        query = query.filter(StockAlert.alert_type == alert_type)
+    return query.order_by(StockAlert.created_at.desc(), StockAlert.id.desc())
+
+
+def active_alert_counts():
+    """Number of active alerts per alert type"""
+    counts = dict.fromkeys(ALERT_TYPES, 0)
+    counts.update(db.session.execute(
+        select(StockAlert.alert_type, func.count(StockAlert.id))
+        .where(StockAlert.is_active.is_(True))
+        .group_by(StockAlert.alert_type)
+    ).all())
+    return counts
+
+
+def reevaluate_all(batch_size=1000):
+    """Re-evaluate every asset in id batches, committing per batch; returns (raised, resolved)"""
+    raised = resolved = 0
+    last_id = 0
+    while True:
+        ids = db.session.execute(
+            select(Asset.id).where(Asset.id > last_id).order_by(Asset.id).limit(batch_size)).scalars().all()
+        if not ids:
+            break
+        batch_raised, batch_resolved = evaluate(ids)
+        raised += batch_raised
+        resolved += batch_resolved
+        db.session.commit()
+        last_id = ids[-1]
+
+    # Alerts left behind by assets that no longer exist
+    resolved += db.session.execute(
+        update(StockAlert)
+        .where(StockAlert.is_active.is_(True), ~exists().where(Asset.id == StockAlert.asset_id))
+        .values(is_active=False, resolved_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return raised, resolved
+
+
+def _changed(obj, fields):
+    state = inspect(obj)
+    return any(state.attrs[name].history.has_changes() for name in fields)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _note_touched_assets(db_session, flush_context):
+    touched = set()
+    for obj in db_session.new:
+        if isinstance(obj, Asset):
+            touched.add(obj.id)
+        elif isinstance(obj, AssetLimit):
+            touched.add(obj.asset_id)
+    for obj in db_session.dirty:
+        if isinstance(obj, Asset) and _changed(obj, WATCHED_ASSET_FIELDS):
+            touched.add(obj.id)
+        elif isinstance(obj, AssetLimit) and _changed(obj, WATCHED_LIMIT_FIELDS):
+            # A limit moved to another asset affects both
+            touched.add(obj.asset_id)
+            touched.update(inspect(obj).attrs.asset_id.history.deleted)
+    for obj in db_session.deleted:
+        if isinstance(obj, AssetLimit):
+            touched.add(obj.asset_id)
+    touched.discard(None)
+    if touched:
+        db_session.info.setdefault(_TOUCHED, set()).update(touched)
+
+
+@event.listens_for(RoutingSession, 'before_commit')
+def _evaluate_touched_assets(db_session):
+    if db_session.new or db_session.dirty or db_session.deleted:
+        db_session.flush()
+    touched = db_session.info.pop(_TOUCHED, None)
+    if touched:
+        with primary():
+            evaluate(touched)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_touched_assets(db_session):
+    db_session.info.pop(_TOUCHED, None)
+
+
+if __name__ == '__main__':
+    from app import app
+
+    parser = argparse.ArgumentParser(description='Re-evaluate low-stock and asset limit alerts for every asset')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    with app.app_context():
+        raised, resolved = reevaluate_all(batch_size=args.batch_size)
+    print(f"Raised {raised} stock alert(s), resolved {resolved}")
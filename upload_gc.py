@@ -0,0 +1,243 @@
+"""
+Garbage collection for orphaned uploads.
+
+Files are left behind when requests are deleted, POs are cancelled or a save
+fails after the upload was already written. This script walks UPLOAD_FOLDER
+one shard (or one batch of legacy flat files) at a time. For each piece it
+asks the database which of those files are still referenced by uploaded_file,
+bill, procurement_quotation or purchase_order rows, and diffs the two sets.
+Memory use is bounded by the shard or batch size, not by the table sizes.
+
+Orphans are not deleted straight away. They are moved to
+UPLOAD_FOLDER/.quarantine/<date>/ and removed by a later run once they are
+older than --quarantine-days, so a mistake can still be undone by moving the
+file back. Files newer than --min-age-hours are never touched; they may
+belong to an upload whose transaction has not committed yet.
+
+Usage:
+    python upload_gc.py --dry-run
+    python upload_gc.py --min-age-hours 2 --quarantine-days 14
+
+Suitable for cron, e.g. nightly: `python upload_gc.py >> logs/upload_gc.log`
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+
+from app import app, db
+from models import UploadedFile, Bill, ProcurementQuotation, PurchaseOrder, StoredBlob
+from blob_store import BLOB_DIR, blob_path, blob_root
+from previews import FAILED_SUFFIX, PREVIEW_DIR
+
+QUARANTINE_DIR = '.quarantine'
+SKIP_NAMES = {'.gitkeep', BLOB_DIR, PREVIEW_DIR, QUARANTINE_DIR}
+
+
+class Report:
+    def __init__(self):
+        self.scanned = 0
+        self.quarantined = 0
+        self.quarantined_bytes = 0
+        self.deleted = 0
+        self.reclaimed_bytes = 0
+        self.previews_removed = 0
+
+    def __str__(self):
+        return (f"Scanned {self.scanned} file(s); quarantined {self.quarantined} "
+                f"({self.quarantined_bytes / 1024 / 1024:.1f} MB); deleted {self.deleted} "
+                f"from quarantine, reclaimed {self.reclaimed_bytes / 1024 / 1024:.1f} MB; "
+                f"removed {self.previews_removed} stale preview(s)")
+
+
+class UploadGC:
+    def __init__(self, min_age_hours=1, quarantine_days=7, batch_size=500, dry_run=False):
+        self.root = app.config['UPLOAD_FOLDER']
+        self.min_age = min_age_hours * 3600
+        self.quarantine_age = quarantine_days * 86400
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.quarantine_root = os.path.join(self.root, QUARANTINE_DIR)
+        self.today_dir = os.path.join(self.quarantine_root, datetime.now().strftime('%Y-%m-%d'))
+        self.report = Report()
+        self.now = time.time()
+
+    def run(self):
+        self.purge_quarantine()
+        self.collect_blobs()
+        self.collect_legacy_files()
+        self.collect_previews()
+        return self.report
+
+    # -- helpers -----------------------------------------------------------
+
+    def _old_enough(self, entry):
+        return self.now - entry.stat().st_mtime >= self.min_age
+
+    def _quarantine(self, path):
+        size = os.path.getsize(path)
+        self.report.quarantined += 1
+        self.report.quarantined_bytes += size
+        relative = os.path.relpath(path, self.root)
+        print(f"  orphan: {relative} ({size} bytes)")
+        if self.dry_run:
+            return
+        target = os.path.join(self.today_dir, relative)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+
+    # -- quarantine --------------------------------------------------------
+
+    def purge_quarantine(self):
+        """Delete quarantined files once they have sat there long enough"""
+        if not os.path.isdir(self.quarantine_root):
+            return
+        for day in sorted(os.listdir(self.quarantine_root)):
+            day_dir = os.path.join(self.quarantine_root, day)
+            try:
+                quarantined_at = datetime.strptime(day, '%Y-%m-%d').timestamp()
+            except ValueError:
+                continue
+            if self.now - quarantined_at < self.quarantine_age:
+                continue
+            for dirpath, _, filenames in os.walk(day_dir):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    self.report.deleted += 1
+                    self.report.reclaimed_bytes += os.path.getsize(path)
+            if not self.dry_run:
+                shutil.rmtree(day_dir)
+
+    # -- content-addressed blobs -------------------------------------------
+
+    def _referenced_hashes(self, prefix):
+        """Hashes starting with prefix that any row still points at"""
+        referenced = set()
+        for column in (UploadedFile.content_hash, Bill.content_hash):
+            query = db.session.query(column).filter(column.like(prefix + '%')).distinct()
+            referenced.update(value for (value,) in query)
+        query = (db.session.query(ProcurementQuotation.quotation_filename)
+                 .filter(ProcurementQuotation.quotation_filename.like(prefix + '%')))
+        referenced.update(value[:64] for (value,) in query)
+        return referenced
+
+    def collect_blobs(self):
+        root = blob_root()
+        if not os.path.isdir(root):
+            return
+        for shard in sorted(os.listdir(root)):
+            shard_dir = os.path.join(root, shard)
+            if not os.path.isdir(shard_dir):
+                # Leftover temp files from interrupted uploads
+                if shard.startswith(('.upload-', '.migrate-')):
+                    entry_path = os.path.join(root, shard)
+                    if self.now - os.path.getmtime(entry_path) >= self.min_age:
+                        self._quarantine(entry_path)
+                continue
+
+            on_disk = {}
+            for dirpath, _, filenames in os.walk(shard_dir):
+                for name in filenames:
+                    on_disk[name] = os.path.join(dirpath, name)
+            self.report.scanned += len(on_disk)
+
+            orphans = set(on_disk) - self._referenced_hashes(shard)
+            removed = []
+            for sha256 in sorted(orphans):
+                path = on_disk[sha256]
+                if self.now - os.path.getmtime(path) < self.min_age:
+                    continue
+                self._quarantine(path)
+                removed.append(sha256)
+
+            if removed and not self.dry_run:
+                StoredBlob.query.filter(StoredBlob.sha256.in_(removed)).delete(synchronize_session=False)
+                db.session.commit()
+
+    # -- legacy flat files -------------------------------------------------
+
+    def _po_attachment_names(self):
+        """File names listed in the purchase_order JSON columns"""
+        names = set()
+        query = (db.session.query(PurchaseOrder.quotation_files, PurchaseOrder.vendor_documents)
+                 .filter(db.or_(PurchaseOrder.quotation_files.isnot(None),
+                                PurchaseOrder.vendor_documents.isnot(None)))
+                 .yield_per(1000))
+        for row in query:
+            for value in row:
+                try:
+                    names.update(os.path.basename(str(item)) for item in json.loads(value or '[]'))
+                except (TypeError, ValueError):
+                    continue
+        return names
+
+    def _referenced_names(self, names):
+        referenced = set()
+        for column in (UploadedFile.filename, Bill.bill_filename, ProcurementQuotation.quotation_filename):
+            query = db.session.query(column).filter(column.in_(names))
+            referenced.update(value for (value,) in query)
+        return referenced
+
+    def _check_legacy_batch(self, batch, po_names):
+        names = [entry.name for entry in batch]
+        referenced = self._referenced_names(names) | po_names
+        for entry in batch:
+            if entry.name not in referenced:
+                self._quarantine(entry.path)
+
+    def collect_legacy_files(self):
+        po_names = self._po_attachment_names()
+        batch = []
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.name in SKIP_NAMES or not entry.is_file():
+                    continue
+                self.report.scanned += 1
+                if not self._old_enough(entry):
+                    continue
+                batch.append(entry)
+                if len(batch) >= self.batch_size:
+                    self._check_legacy_batch(batch, po_names)
+                    batch = []
+        if batch:
+            self._check_legacy_batch(batch, po_names)
+
+    # -- previews ----------------------------------------------------------
+
+    def collect_previews(self):
+        """Drop cached thumbnails and failure markers whose blob is gone (they can be regenerated)"""
+        preview_root = os.path.join(self.root, PREVIEW_DIR)
+        if not os.path.isdir(preview_root):
+            return
+        for dirpath, _, filenames in os.walk(preview_root):
+            for name in filenames:
+                sha256, ext = os.path.splitext(name)
+                if name.startswith('.') or ext not in ('.png', FAILED_SUFFIX):
+                    continue
+                if not os.path.exists(blob_path(sha256)):
+                    self.report.previews_removed += 1
+                    if not self.dry_run:
+                        os.unlink(os.path.join(dirpath, name))
+
+
+def collect_garbage(**options):
+    with app.app_context():
+        return UploadGC(**options).run()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Quarantine and delete orphaned uploads')
+    parser.add_argument('--min-age-hours', type=float, default=1,
+                        help='never touch files modified more recently than this')
+    parser.add_argument('--quarantine-days', type=float, default=7,
+                        help='delete quarantined files after this many days')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    report = collect_garbage(min_age_hours=args.min_age_hours, quarantine_days=args.quarantine_days,
+                             batch_size=args.batch_size, dry_run=args.dry_run)
+    print(("[dry run] " if args.dry_run else "") + str(report))
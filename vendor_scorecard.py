@@ -0,0 +1,261 @@
+"""
+Vendor scorecards.
+
+vendor_scorecard holds one row per vendor with additive counters (item
+assignments, delivered and on-time deliveries, purchase orders and their
+spend, quotations and their summed unit price) and the figures derived from
+them (on-time rate, average quotation price), so the ranked vendor list is a
+single indexed query however many vendors there are.
+
+The counters are maintained incrementally. A session hook works out what
+each flushed ItemAssignment, PurchaseOrder or ProcurementQuotation
+contributes before and after the change (from the attribute history, so a
+PO moved to another vendor or cancelled is taken off the old figures) and
+keeps the difference per vendor. Just before the transaction commits the
+differences are applied as `counter = counter + delta` UPDATEs, which stay
+correct when several workers commit for the same vendor at once.
+
+Changes made outside the ORM are not seen by the hook. Rebuild every
+scorecard from the source tables after deploying this table, and from cron
+as a backstop:
+    45 6 * * 0  cd /app && python vendor_scorecard.py
+"""
+
+import argparse
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import and_, bindparam, case, delete, event, func, insert, inspect, or_, select, update
+from sqlalchemy.orm import contains_eager
+
+from db_routing import RoutingSession, primary
+from models import (db, ItemAssignment, ProcurementQuotation, PurchaseOrder, Vendor, VendorScorecard,
+                    insert_ignoring_duplicates)
+
+COUNTERS = ('assignment_count', 'delivered_count', 'on_time_count', 'po_count', 'po_spend',
+            'quotation_count', 'quotation_unit_price_total')
+# Ranking column -> descending?; vendors without a figure are left out of that ranking
+RANKINGS = {
+    'on_time_rate': True,
+    'po_spend': True,
+    'po_count': True,
+    'avg_quotation_price': False,
+}
+CANCELLED_PO_STATUS = 'Cancelled'
+
+_DELTAS = 'vendor_scorecard_deltas'  # key in Session.info
+
+
+def _assignment(values):
+    expected, actual = values['expected_delivery_date'], values['actual_delivery_date']
+    delivered = expected is not None and actual is not None
+    return {'assignment_count': 1, 'delivered_count': int(delivered),
+            'on_time_count': int(delivered and actual <= expected)}
+
+
+def _purchase_order(values):
+    if values['status'] == CANCELLED_PO_STATUS:
+        return {}
+    return {'po_count': 1, 'po_spend': values['grand_total'] or 0}
+
+
+def _quotation(values):
+    quantity = values['quoted_quantity'] or 0
+    # Same as ProcurementQuotation.cost_per_unit
+    unit_price = (values['total_cost'] or 0) / quantity if quantity > 0 else 0
+    return {'quotation_count': 1, 'quotation_unit_price_total': unit_price}
+
+
+# model -> (fields read, contribution to its vendor's counters)
+SOURCES = {
+    ItemAssignment: (('vendor_id', 'expected_delivery_date', 'actual_delivery_date'), _assignment),
+    PurchaseOrder: (('vendor_id', 'status', 'grand_total'), _purchase_order),
+    ProcurementQuotation: (('vendor_id', 'quoted_quantity', 'total_cost'), _quotation),
+}
+
+
+def _load_replaced_value(target, value, oldvalue, initiator):
+    pass
+
+
+# active_history makes every change to a watched attribute load the value it
+# replaces, even if the attribute was expired by an earlier commit; without
+# it the history has no old value and the previous vendor would not be debited
+for _model, (_fields, _) in SOURCES.items():
+    for _name in _fields:
+        event.listen(getattr(_model, _name), 'set', _load_replaced_value, active_history=True)
+
+
+def _values(obj, fields, before=False):
+    state = inspect(obj)
+    values = {}
+    for name in fields:
+        history = state.attrs[name].history
+        if before and history.has_changes():
+            values[name] = history.deleted[0] if history.deleted else None
+        else:
+            values[name] = getattr(obj, name)
+    return values
+
+
+def _add(deltas, values, contribute, sign):
+    if values['vendor_id'] is None:
+        return
+    counter = deltas.setdefault(values['vendor_id'], Counter())
+    for name, amount in contribute(values).items():
+        counter[name] += sign * amount
+
+
+def apply_deltas(deltas):
+    """Add {vendor_id: {counter: delta}} to the scorecards, creating missing rows"""
+    if not deltas:
+        return
+    now = datetime.utcnow()
+    db.session.execute(insert_ignoring_duplicates(VendorScorecard),
+                       [dict(dict.fromkeys(COUNTERS, 0), vendor_id=vendor_id, updated_at=now)
+                        for vendor_id in sorted(deltas)])
+
+    changed = [dict({f'd_{name}': counter.get(name, 0) for name in COUNTERS}, b_vendor_id=vendor_id)
+               for vendor_id, counter in sorted(deltas.items()) if any(counter.values())]
+    if not changed:
+        return
+    table = VendorScorecard.__table__
+    new = {name: table.c[name] + bindparam(f'd_{name}') for name in COUNTERS}
+    db.session.execute(
+        update(table).where(table.c.vendor_id == bindparam('b_vendor_id')).values(
+            on_time_rate=case((new['delivered_count'] > 0,
+                               new['on_time_count'] * 100.0 / new['delivered_count']), else_=None),
+            avg_quotation_price=case((new['quotation_count'] > 0,
+                                      new['quotation_unit_price_total'] / new['quotation_count']), else_=None),
+            updated_at=now,
+            **new),
+        changed)
+
+
+def rebuild():
+    """Recompute every scorecard from the source tables; returns the number of vendors"""
+    rows = {vendor_id: dict.fromkeys(COUNTERS, 0)
+            for vendor_id in db.session.execute(select(Vendor.id)).scalars()}
+
+    delivered = and_(ItemAssignment.expected_delivery_date.isnot(None),
+                     ItemAssignment.actual_delivery_date.isnot(None))
+    on_time = and_(delivered, ItemAssignment.actual_delivery_date <= ItemAssignment.expected_delivery_date)
+    for vendor_id, assignments, delivered_count, on_time_count in db.session.execute(
+            select(ItemAssignment.vendor_id, func.count(ItemAssignment.id),
+                   func.sum(case((delivered, 1), else_=0)), func.sum(case((on_time, 1), else_=0)))
+            .group_by(ItemAssignment.vendor_id)):
+        if vendor_id in rows:
+            rows[vendor_id].update(assignment_count=assignments, delivered_count=delivered_count or 0,
+                                   on_time_count=on_time_count or 0)
+
+    for vendor_id, po_count, spend in db.session.execute(
+            select(PurchaseOrder.vendor_id, func.count(PurchaseOrder.id),
+                   func.sum(func.coalesce(PurchaseOrder.grand_total, 0)))
+            .where(or_(PurchaseOrder.status.is_(None), PurchaseOrder.status != CANCELLED_PO_STATUS))
+            .group_by(PurchaseOrder.vendor_id)):
+        if vendor_id in rows:
+            rows[vendor_id].update(po_count=po_count, po_spend=spend or 0)
+
+    unit_price = case((ProcurementQuotation.quoted_quantity > 0,
+                       ProcurementQuotation.total_cost * 1.0 / ProcurementQuotation.quoted_quantity), else_=0)
+    for vendor_id, quotations, unit_price_total in db.session.execute(
+            select(ProcurementQuotation.vendor_id, func.count(ProcurementQuotation.id), func.sum(unit_price))
+            .group_by(ProcurementQuotation.vendor_id)):
+        if vendor_id in rows:
+            rows[vendor_id].update(quotation_count=quotations, quotation_unit_price_total=unit_price_total or 0)
+
+    now = datetime.utcnow()
+    for vendor_id, row in rows.items():
+        row.update(
+            vendor_id=vendor_id, updated_at=now,
+            on_time_rate=row['on_time_count'] * 100.0 / row['delivered_count'] if row['delivered_count'] else None,
+            avg_quotation_price=(row['quotation_unit_price_total'] / row['quotation_count']
+                                 if row['quotation_count'] else None))
+
+    db.session.execute(delete(VendorScorecard))
+    if rows:
+        db.session.execute(insert(VendorScorecard), list(rows.values()))
+    db.session.commit()
+    return len(rows)
+
+
+def ranked_query(ranking='on_time_rate', active_only=True):
+    """Scorecards with their vendor, best first by ranking (a key of RANKINGS)"""
+    column = getattr(VendorScorecard, ranking)
+    order = column.desc() if RANKINGS[ranking] else column.asc()
+    query = (VendorScorecard.query.join(VendorScorecard.vendor)
+             .options(contains_eager(VendorScorecard.vendor))
+             .filter(column.isnot(None)))
+    if active_only:
+        query = query.filter(Vendor.is_active.is_(True))
+    return query.order_by(order, VendorScorecard.vendor_id)
+
+
+def to_dict(scorecard):
+    return {
+        'vendor_id': scorecard.vendor_id,
+        'vendor_name': scorecard.vendor.vendor_name,
+        'vendor_code': scorecard.vendor.vendor_code,
+        'category': scorecard.vendor.category,
+        'assignments': scorecard.assignment_count,
+        'delivered': scorecard.delivered_count,
+        'on_time': scorecard.on_time_count,
+        'on_time_rate': round(scorecard.on_time_rate, 1) if scorecard.on_time_rate is not None else None,
+        'po_count': scorecard.po_count,
+        'po_spend': round(scorecard.po_spend, 2),
+        'quotations': scorecard.quotation_count,
+        'avg_quotation_price': (round(scorecard.avg_quotation_price, 2)
+                                if scorecard.avg_quotation_price is not None else None),
+    }
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _collect_deltas(db_session, flush_context):
+    deltas = {}
+    for obj in db_session.new:
+        if isinstance(obj, Vendor):
+            deltas.setdefault(obj.id, Counter())
+        elif type(obj) in SOURCES:
+            fields, contribute = SOURCES[type(obj)]
+            _add(deltas, _values(obj, fields), contribute, 1)
+    for obj in db_session.dirty:
+        if type(obj) in SOURCES:
+            fields, contribute = SOURCES[type(obj)]
+            state = inspect(obj)
+            if any(state.attrs[name].history.has_changes() for name in fields):
+                _add(deltas, _values(obj, fields, before=True), contribute, -1)
+                _add(deltas, _values(obj, fields), contribute, 1)
+    for obj in db_session.deleted:
+        if type(obj) in SOURCES:
+            fields, contribute = SOURCES[type(obj)]
+            _add(deltas, _values(obj, fields, before=True), contribute, -1)
+    if deltas:
+        pending = db_session.info.setdefault(_DELTAS, {})
+        for vendor_id, counter in deltas.items():
+            pending.setdefault(vendor_id, Counter()).update(counter)
+
+
+@event.listens_for(RoutingSession, 'before_commit')
+def _apply_pending_deltas(db_session):
+    if db_session.new or db_session.dirty or db_session.deleted:
+        db_session.flush()
+    deltas = db_session.info.pop(_DELTAS, None)
+    if deltas:
+        with primary():
+            apply_deltas(deltas)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_pending_deltas(db_session):
+    db_session.info.pop(_DELTAS, None)
+
+
+if __name__ == '__main__':
+    from app import app
+
+    parser = argparse.ArgumentParser(description='Rebuild every vendor scorecard from assignments, POs and quotations')
+    parser.parse_args()
+
+    with app.app_context():
+        vendors = rebuild()
+    print(f"Rebuilt scorecards for {vendors} vendor(s)")
@@ -0,0 +1,168 @@
+"""
+Warranty expiry alerts.
+
+generate_warranty_alerts() finds every asset whose warranty runs out within
+the largest threshold (90 days) with one range query on the indexed
+asset.warranty_expiry column. Each asset gets an alert for the tightest
+threshold it has crossed (90, 30 or 7 days), and all missing alerts are
+inserted in one statement. The unique index on (asset_id, alert_type,
+alert_date, threshold_days) makes runs idempotent, even when two workers run
+at the same time. Alerts superseded by a tighter threshold, for expiries
+that have passed, or for a warranty that was changed are deactivated with
+set-based UPDATEs.
+
+The lifecycle dashboard only reads the active alerts. They are refreshed
+either in-process, every WARRANTY_ALERT_INTERVAL_HOURS (0 disables; the
+thread starts with the first request so CLI scripts don't run it), or from
+cron:
+    0 6 * * *  cd /app && python warranty_alerts.py
+"""
+
+import argparse
+import logging
+import threading
+from datetime import date, timedelta
+
+from sqlalchemy import and_, exists, or_, select, update
+
+from models import db, Asset, WarrantyAlert, insert_ignoring_duplicates
+
+ALERT_TYPE = 'Warranty Expiry'
+THRESHOLDS = (7, 30, 90)  # days before expiry, tightest first
+IN_CHUNK = 500
+
+_scheduler_lock = threading.Lock()
+_scheduler_thread = None
+_scheduler_stop = threading.Event()
+
+
+def threshold_for(days_remaining):
+    """Tightest threshold crossed with days_remaining left, or None"""
+    for threshold in THRESHOLDS:
+        if days_remaining <= threshold:
+            return threshold
+    return None
+
+
+def _existing_keys(asset_ids, today):
+    keys = set()
+    for start in range(0, len(asset_ids), IN_CHUNK):
+        chunk = asset_ids[start:start + IN_CHUNK]
+        keys.update(db.session.execute(
+            select(WarrantyAlert.asset_id, WarrantyAlert.alert_date, WarrantyAlert.threshold_days)
+            .where(WarrantyAlert.alert_type == ALERT_TYPE,
+                   WarrantyAlert.asset_id.in_(chunk),
+                   WarrantyAlert.alert_date >= today)
+        ).all())
+    return keys
+
+
+def generate_warranty_alerts(today=None):
+    """Create missing alerts and retire stale ones; returns (created, deactivated)"""
+    today = today or date.today()
+    horizon = today + timedelta(days=max(THRESHOLDS))
+
+    expiring = db.session.execute(
+        select(Asset.id, Asset.asset_tag, Asset.name, Asset.warranty_expiry)
+        .where(Asset.warranty_expiry >= today, Asset.warranty_expiry <= horizon)
+        .order_by(Asset.warranty_expiry)
+    ).all()
+
+    due = {}
+    for asset_id, asset_tag, name, expiry in expiring:
+        days_remaining = (expiry - today).days
+        threshold = threshold_for(days_remaining)
+        due[asset_id] = {
+            'asset_id': asset_id,
+            'alert_type': ALERT_TYPE,
+            'alert_date': expiry,
+            'threshold_days': threshold,
+            'message': (f'Warranty for {asset_tag} ({name}) expires on {expiry.strftime("%Y-%m-%d")}, '
+                        f'{days_remaining} day(s) left'),
+            'is_active': True,
+        }
+
+    existing = _existing_keys(list(due), today)
+    missing = [row for row in due.values()
+               if (row['asset_id'], row['alert_date'], row['threshold_days']) not in existing]
+    if missing:
+        db.session.execute(insert_ignoring_duplicates(WarrantyAlert), missing)
+
+    deactivated = 0
+    active = and_(WarrantyAlert.alert_type == ALERT_TYPE, WarrantyAlert.is_active.is_(True))
+
+    # Earlier, looser thresholds once a tighter one has been raised
+    for threshold in THRESHOLDS:
+        asset_ids = [asset_id for asset_id, row in due.items() if row['threshold_days'] == threshold]
+        for start in range(0, len(asset_ids), IN_CHUNK):
+            deactivated += db.session.execute(
+                update(WarrantyAlert)
+                .where(active, WarrantyAlert.asset_id.in_(asset_ids[start:start + IN_CHUNK]),
+                       WarrantyAlert.threshold_days > threshold)
+                .values(is_active=False)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+
+    # Expired warranties, and alerts whose asset's expiry date has since changed
+    current_expiry = exists().where(Asset.id == WarrantyAlert.asset_id,
+                                    Asset.warranty_expiry == WarrantyAlert.alert_date)
+    deactivated += db.session.execute(
+        update(WarrantyAlert)
+        .where(active, or_(WarrantyAlert.alert_date < today, ~current_expiry))
+        .values(is_active=False)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    db.session.commit()
+    return len(missing), deactivated
+
+
+def _scheduler_loop(app, interval_seconds):
+    while True:
+        with app.app_context():
+            try:
+                created, deactivated = generate_warranty_alerts()
+                if created or deactivated:
+                    logging.info(f"Warranty alerts: {created} created, {deactivated} deactivated")
+            except Exception as e:
+                db.session.rollback()
+                logging.warning(f"Warranty alert run failed: {e}")
+            finally:
+                db.session.remove()
+        if _scheduler_stop.wait(interval_seconds):
+            return
+
+
+def init_warranty_scheduler(app):
+    """Refresh alerts on a background thread every WARRANTY_ALERT_INTERVAL_HOURS"""
+    hours = app.config.get('WARRANTY_ALERT_INTERVAL_HOURS', 0)
+    if hours <= 0:
+        return
+
+    @app.before_request
+    def _start_warranty_scheduler():
+        global _scheduler_thread
+        if _scheduler_thread is not None:
+            return
+        with _scheduler_lock:
+            # Started per worker on first use so forked gunicorn workers each get one
+            if _scheduler_thread is None:
+                _scheduler_thread = threading.Thread(
+                    target=_scheduler_loop, args=(app, hours * 3600),
+                    name='warranty-alerts', daemon=True)
+                _scheduler_thread.start()
+
+
+if __name__ == '__main__':
+    from datetime import datetime
+
+    from app import app
+
+    parser = argparse.ArgumentParser(description='Generate warranty expiry alerts (90/30/7 days)')
+    parser.add_argument('--today', type=lambda value: datetime.strptime(value, '%Y-%m-%d').date(),
+                        help='run as if on this date (YYYY-MM-DD)')
+    args = parser.parse_args()
+
+    with app.app_context():
+        created, deactivated = generate_warranty_alerts(today=args.today)
+    print(f"Created {created} warranty alert(s), deactivated {deactivated}")